@@ -0,0 +1,61 @@
+#
+# Microbenchmark for parsing curve events, and for the whole path of an
+# event through the event listener thread (parsing, skipping events seen
+# before resuming and queueing).  Run from the benchmarks directory with:
+#
+#   PYTHONPATH=.. python bench_events.py [number of events]
+#
+
+import json
+import sys
+import threading
+import time
+
+import sseclient
+
+from volue_insight_timeseries.events import CurveEvent, EventCursor, EventListener, EventQueue
+
+
+def make_sse_events(count):
+    res = []
+    for n in range(count):
+        d = {'id': n % 50, 'created': '2024-03-01T12:{:02d}:{:02d}.123+01:00'.format(n // 60 % 60, n % 60),
+             'operation': 'modify', 'issue_date': '2024-03-01T00:00:00+01:00',
+             'range': {'begin': '2024-03-02T00:00:00+01:00', 'end': '2024-03-12T00:00:00+01:00'}}
+        res.append(sseclient.Event(id=str(n), event='curve_event', data=json.dumps(d)))
+    return res
+
+
+def events_per_second(sse_events):
+    start = time.perf_counter()
+    for sse_event in sse_events:
+        CurveEvent(sse_event)
+    return len(sse_events) / (time.perf_counter() - start)
+
+
+def listener_events_per_second(sse_events):
+    # A listener without a connection, fed directly by the reading loop
+    listener = EventListener.__new__(EventListener)
+    listener.retry = 3000
+    listener.curve_cache = {}
+    listener.received = 0
+    listener._lock = threading.Lock()
+    listener.queue = EventQueue()
+    resume = EventCursor()
+    start = time.perf_counter()
+    for sse_event in sse_events:
+        listener._handle_sse_event(sse_event, resume)
+    return len(sse_events) / (time.perf_counter() - start)
+
+
+def main(count=100000):
+    sse_events = make_sse_events(count)
+    print('Parse:              {:10.0f} events/s'.format(events_per_second(sse_events)))
+    print('Listener path:      {:10.0f} events/s'.format(listener_events_per_second(sse_events)))
+    for sse_event in sse_events:
+        sse_event.id = None
+    print('Listener path (no event ids): {:10.0f} events/s'.format(listener_events_per_second(sse_events)))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
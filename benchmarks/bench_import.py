@@ -0,0 +1,54 @@
+#
+# Benchmark for the time taken to import the package, in fresh interpreters.
+# Run from the benchmarks directory with:
+#
+#   PYTHONPATH=.. python bench_import.py [--runs N] [--max-ms LIMIT]
+#
+# With --max-ms the script fails if the median import time exceeds the limit,
+# or if any of the heavy optional dependencies are imported.
+#
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ('pandas', 'numpy', 'dateutil', 'sseclient')
+
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import volue_insight_timeseries
+elapsed = time.perf_counter() - start
+print(json.dumps({'ms': elapsed * 1000, 'heavy': [m for m in %r if m in sys.modules]}))
+''' % (HEAVY_MODULES,)
+
+
+def measure(runs):
+    times = []
+    heavy = set()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', _PROBE], check=True, capture_output=True, text=True)
+        res = json.loads(out.stdout)
+        times.append(res['ms'])
+        heavy.update(res['heavy'])
+    return times, sorted(heavy)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure import time of volue_insight_timeseries')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, default=None)
+    args = parser.parse_args(argv)
+    times, heavy = measure(args.runs)
+    median = statistics.median(times)
+    print('Import time: median {:.1f} ms, min {:.1f} ms, max {:.1f} ms'.format(median, min(times), max(times)))
+    if heavy:
+        print('Heavy modules imported: {}'.format(', '.join(heavy)))
+    if args.max_ms is not None and (median > args.max_ms or heavy):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
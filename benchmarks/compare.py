@@ -0,0 +1,26 @@
+#
+# Compare two result files from benchmarks/run.py:
+#
+#   python compare.py old.json new.json
+#
+
+import json
+import sys
+
+
+def main(old_file, new_file):
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    print('{:32s} {:>10s} {:>10s} {:>8s}'.format('benchmark', 'old (s)', 'new (s)', 'speedup'))
+    for name, res in new['results'].items():
+        if name not in old['results']:
+            continue
+        before = old['results'][name]['min']
+        after = res['min']
+        print('{:32s} {:10.4f} {:10.4f} {:7.2f}x'.format(name, before, after, before / after))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:3])
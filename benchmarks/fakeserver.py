@@ -0,0 +1,309 @@
+#
+# A local stand-in for the Volue Insight API, for load testing the client
+# without touching production.  Data is generated deterministically from the
+# curve id and time, so repeated runs return the same payloads.
+#
+# Run stand-alone from the benchmarks directory with:
+#
+#   PYTHONPATH=.. python fakeserver.py --port 8099 --latency 20 --error-rate 0.01
+#
+# and point a session at it:
+#
+#   Session(urlbase='http://localhost:8099', auth_urlbase='http://localhost:8099',
+#           client_id='any', client_secret='any')
+#
+
+import argparse
+import datetime
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from volue_insight_timeseries import util
+
+# Data "ends" here, instances are issued daily up to this date
+NOW = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+_STEPS = {
+    'MIN': 60, 'MIN5': 300, 'MIN15': 900, 'MIN30': 1800,
+    'H': 3600, 'H3': 3 * 3600, 'H6': 6 * 3600, 'H12': 12 * 3600,
+    'D': 86400, 'W': 7 * 86400, 'M': 30 * 86400, 'Q': 91 * 86400, 'Y': 365 * 86400,
+}
+
+
+class Options:
+    """Behaviour of the fake server"""
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, points=168, instances=30,
+                 tags=('Avg', '01', '02', '03'), event_interval=1.0, seed=0):
+        self.latency = latency                # Mean added latency, in ms
+        self.jitter = jitter                  # Random extra latency, up to this many ms
+        self.error_rate = error_rate          # Fraction of requests failing with 503
+        self.points = points                  # Points returned if no range is given
+        self.instances = instances            # Number of instances per instance curve
+        self.tags = list(tags)
+        self.event_interval = event_interval  # Seconds between events
+        self.seed = seed
+
+
+def curve_metadata(name=None, id=None):
+    """Derive (stable) metadata from a curve name, or from an id"""
+    if name is None:
+        name = 'curve {}'.format(id)
+    if id is None:
+        id = zlib.crc32(name.encode()) % 1000000
+    tokens = name.lower().split()
+    frequency = 'H'
+    for token in tokens:
+        if token.upper() in _STEPS:
+            frequency = token.upper()
+    forecast = tokens[-1:] == ['f']
+    tagged = any('ens' in t for t in tokens)
+    if forecast:
+        curve_type = util.TAGGED_INSTANCES if tagged else util.INSTANCES
+    else:
+        curve_type = util.TAGGED if tagged else util.TIME_SERIES
+    return {'id': id, 'name': name, 'frequency': frequency, 'time_zone': 'UTC', 'curve_type': curve_type}
+
+
+def _value(curve_id, t, tag=''):
+    phase = (curve_id % 97) + zlib.crc32(tag.encode()) % 13
+    return round(100 + 50 * math.sin(t / 86400.0 * 2 * math.pi + phase), 3)
+
+
+def _parse_time(value, default):
+    if value is None:
+        return default
+    return util.parsetime(value, tz='UTC')
+
+
+def make_points(curve_id, frequency, begin, end, tag=''):
+    step = _STEPS.get(frequency, 3600)
+    start = int(begin.timestamp()) // step * step
+    if start < begin.timestamp():
+        start += step
+    stop = end.timestamp()
+    return [[t * 1000, _value(curve_id, t, tag)] for t in range(start, int(math.ceil(stop)), step)]
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    options = Options()
+    curves = {}
+    _rng = random.Random(0)
+    _rng_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _random(self):
+        with self._rng_lock:
+            return self._rng.random()
+
+    def _send_json(self, obj, status=200):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_status(self, status, message=''):
+        body = message.encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay_and_fail(self):
+        delay = self.options.latency + self.options.jitter * self._random()
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        if self.options.error_rate > 0 and self._random() < self.options.error_rate:
+            self._send_status(503, 'Fake overload')
+            return True
+        return False
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        if self._delay_and_fail():
+            return
+        if urlparse(self.path).path == '/oauth2/token':
+            return self._send_json({'access_token': 'fake-token', 'token_type': 'Bearer', 'expires_in': 3600})
+        self._send_status(404, 'Not found')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split('/') if p][1:]  # Skip 'api'
+        if parts == ['events']:
+            return self._events(query)
+        if self._delay_and_fail():
+            return
+        try:
+            res = self._route(parts, query)
+        except (KeyError, ValueError) as e:
+            return self._send_status(400, 'Bad request: {}'.format(e))
+        if res is None:
+            return self._send_status(404, 'Not found')
+        self._send_json(res)
+
+    def _metadata(self, id):
+        id = int(id)
+        if id not in self.curves:
+            self.curves[id] = curve_metadata(id=id)
+        return self.curves[id]
+
+    def _register(self, name):
+        meta = curve_metadata(name=name)
+        self.curves[meta['id']] = meta
+        return meta
+
+    def _series(self, meta, query, prefix='', tag='', issue_date=None):
+        step = _STEPS.get(meta['frequency'], 3600)
+        default_begin = issue_date or NOW - datetime.timedelta(seconds=step * self.options.points)
+        begin = _parse_time(query.get(prefix + 'from', [None])[0], default_begin)
+        end = _parse_time(query.get(prefix + 'to', [None])[0],
+                          begin + datetime.timedelta(seconds=step * self.options.points))
+        res = {'id': meta['id'], 'name': meta['name'], 'frequency': meta['frequency'],
+               'time_zone': meta['time_zone'], 'points': make_points(meta['id'], meta['frequency'], begin, end, tag)}
+        if tag:
+            res['tag'] = tag
+        if issue_date is not None:
+            res['issue_date'] = issue_date.isoformat()
+        return res
+
+    def _issue_dates(self, query):
+        if 'issue_date' in query:
+            return [_parse_time(d, None) for d in query['issue_date']]
+        dates = [NOW - datetime.timedelta(days=k) for k in range(self.options.instances)]
+        begin = _parse_time(query.get('issue_date_from', [None])[0], None)
+        end = _parse_time(query.get('issue_date_to', [None])[0], None)
+        return [d for d in dates if (begin is None or d >= begin) and (end is None or d < end)]
+
+    def _instance(self, meta, query, issue_date, tag=''):
+        if query.get('with_data', ['true'])[0] == 'false':
+            res = {'id': meta['id'], 'name': meta['name'], 'frequency': meta['frequency'],
+                   'time_zone': meta['time_zone'], 'issue_date': issue_date.isoformat()}
+            if tag:
+                res['tag'] = tag
+            return res
+        prefix = 'data_' if any(k.startswith('data_') for k in query) else ''
+        return self._series(meta, query, prefix=prefix, tag=tag, issue_date=issue_date)
+
+    def _route(self, parts, query):
+        if parts == ['curves', 'get']:
+            return self._register(query['name'][0])
+        if parts == ['curves']:
+            return [self._register(name) for name in query.get('name', [])]
+        if parts[:1] == ['series']:
+            if parts[1] == 'tagged':
+                meta = self._metadata(parts[2])
+                if parts[3:] == ['tags']:
+                    return self.options.tags
+                return [self._series(meta, query, tag=tag) for tag in query.get('tag', self.options.tags[:1])]
+            return self._series(self._metadata(parts[1]), query)
+        if parts[:1] == ['instances']:
+            tagged = parts[1] == 'tagged'
+            if tagged:
+                parts = parts[1:]
+            meta = self._metadata(parts[1])
+            op = parts[2] if len(parts) > 2 else 'search'
+            tags = query.get('tag', self.options.tags if op == 'search' else self.options.tags[:1]) if tagged else ['']
+            if op == 'tags':
+                return self.options.tags
+            if op in ('relative', 'absolute'):
+                return self._series(meta, query, prefix='data_', tag=tags[0])
+            dates = self._issue_dates(query) if op != 'get' else [_parse_time(query['issue_date'][0], None)]
+            if not dates:
+                return None
+            if op == 'latest':
+                return self._instance(meta, query, max(dates), tags[0])
+            res = [self._instance(meta, query, d, tag) for d in dates for tag in tags]
+            if op == 'get' and not tagged:
+                return res[0]
+            return res
+        if parts and parts[0] in ('units', 'areas', 'categories', 'frequencies', 'time_zones'):
+            return ['fake']
+        return None
+
+    def _events(self, query):
+        ids = [int(i) for i in query.get('id', [])]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        rng = random.Random(self.options.seed)
+        n = 0
+        try:
+            while ids:
+                created = datetime.datetime.now(datetime.timezone.utc)
+                data = {'id': rng.choice(ids), 'created': created.isoformat(), 'operation': 'modify',
+                        'range': {'begin': (NOW - datetime.timedelta(days=1)).isoformat(), 'end': NOW.isoformat()}}
+                self.wfile.write('id: {}\nevent: curve_event\ndata: {}\n\n'.format(n, json.dumps(data)).encode())
+                self.wfile.flush()
+                n += 1
+                time.sleep(self.options.event_interval)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+
+def make_server(port=0, options=None, host='127.0.0.1'):
+    """Create (but do not start) a fake API server; port 0 picks a free port"""
+    handler = type('Handler', (FakeApiHandler,), {
+        'options': options or Options(),
+        'curves': {},
+        '_rng': random.Random((options or Options()).seed),
+        '_rng_lock': threading.Lock(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_server(port=0, options=None):
+    """Start a fake API server in a background thread, returns (server, url)"""
+    server = make_server(port, options)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://{}:{}'.format(*server.server_address[:2])
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.0, help='Added latency per request, in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra latency, up to this many ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failing with 503')
+    parser.add_argument('--points', type=int, default=168, help='Points per series when no range is given')
+    parser.add_argument('--instances', type=int, default=30, help='Instances per instance curve')
+    parser.add_argument('--event-interval', type=float, default=1.0, help='Seconds between events')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def options_from_args(args):
+    return Options(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, points=args.points,
+                   instances=args.instances, event_interval=args.event_interval, seed=args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fake Volue Insight API server')
+    parser.add_argument('--port', type=int, default=8099)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    server = make_server(args.port, options_from_args(args))
+    print('Serving fake API on http://{}:{}'.format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#
+# Load test of the client against the local fake API server, reporting
+# requests/s, latency percentiles, CPU and memory per concurrency level.
+# Run from the benchmarks directory with:
+#
+#   PYTHONPATH=.. python loadtest.py --workload series --concurrency 1,4,16,64,256 --latency 20
+#
+# By default the fake server runs in a separate process, so that its CPU use
+# is not counted against the client.  Use --url to test against a server that
+# is already running.
+#
+
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import resource
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import volue_insight_timeseries as vit
+
+import fakeserver
+
+CURVES = {
+    'series': ['pro de wnd mwh/h cet min15 a', 'con de mwh/h cet h a', 'tt de con °c cet min15 a'],
+    'instances': ['pro de wnd ec00 mwh/h cet min15 f', 'con de ec00 mwh/h cet h f'],
+    'tagged': ['tt de con ens °c cet h a'],
+}
+
+
+def _series(session, names, n):
+    curve = session.get_curve(name=names[n % len(names)])
+    return curve.get_data(data_from='2023-12-01', data_to='2023-12-08')
+
+
+def _instances(session, names, n):
+    curve = session.get_curve(name=names[n % len(names)])
+    return curve.get_latest()
+
+
+def _tagged(session, names, n):
+    curve = session.get_curve(name=names[n % len(names)])
+    return curve.get_data(tag=['Avg', '01', '02', '03'], data_from='2023-12-01', data_to='2023-12-08')
+
+
+def _search(session, names, n):
+    return session.search(name=names)
+
+
+WORKLOADS = {
+    'series': (_series, CURVES['series']),
+    'instances': (_instances, CURVES['instances']),
+    'tagged': (_tagged, CURVES['tagged']),
+    'search': (_search, CURVES['series'] + CURVES['instances']),
+}
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    k = min(len(values) - 1, max(0, int(round(q / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def _rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1e6
+    except OSError:
+        return None
+
+
+def run_level(session, workload, concurrency, duration):
+    func, names = WORKLOADS[workload]
+    latencies = []
+    errors = []
+    stop = time.perf_counter() + duration
+    counter = iter(range(sys.maxsize))
+    lock = threading.Lock()
+
+    def worker():
+        while time.perf_counter() < stop:
+            with lock:
+                n = next(counter)
+            start = time.perf_counter()
+            try:
+                func(session, names, n)
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors.append(repr(e))
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+        for f in [pool.submit(worker) for _ in range(concurrency)]:
+            f.result()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'requests_per_second': len(latencies) / wall,
+        'p50_ms': (_percentile(latencies, 50) or 0) * 1000,
+        'p99_ms': (_percentile(latencies, 99) or 0) * 1000,
+        'mean_ms': (statistics.mean(latencies) if latencies else 0) * 1000,
+        'cpu_seconds': cpu,
+        'cpu_utilisation': cpu / wall,
+        'rss_mb': _rss_mb(),
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1000.0,
+    }
+
+
+def _serve(port, options):
+    fakeserver.make_server(port, options).serve_forever()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('Fake server did not start')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the client against a fake API server')
+    parser.add_argument('--workload', choices=sorted(WORKLOADS), default='series')
+    parser.add_argument('--concurrency', default='1,4,16,64,256',
+                        help='Comma-separated list of concurrency levels')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per concurrency level')
+    parser.add_argument('--url', help='Use an already running server instead of starting one')
+    parser.add_argument('--output', help='Save the results as json to this file')
+    fakeserver.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = None
+    url = args.url
+    if url is None:
+        port = _free_port()
+        server = multiprocessing.Process(target=_serve, args=(port, fakeserver.options_from_args(args)))
+        server.daemon = True
+        server.start()
+        _wait_for(port)
+        url = 'http://127.0.0.1:{}'.format(port)
+
+    try:
+        session = vit.Session(urlbase=url, auth_urlbase=url, client_id='load', client_secret='test')
+        results = []
+        print('{:>11s} {:>9s} {:>7s} {:>10s} {:>10s} {:>10s} {:>7s} {:>9s}'.format(
+            'concurrency', 'req/s', 'errors', 'p50 (ms)', 'p99 (ms)', 'cpu (s)', 'cpu %', 'rss (MB)'))
+        for level in [int(c) for c in args.concurrency.split(',')]:
+            res = run_level(session, args.workload, level, args.duration)
+            results.append(res)
+            print('{concurrency:11d} {requests_per_second:9.1f} {errors:7d} {p50_ms:10.1f} {p99_ms:10.1f} '
+                  '{cpu_seconds:10.2f} {:7.0f} {:9.1f}'.format(res['cpu_utilisation'] * 100, res['rss_mb'] or 0,
+                                                              **res))
+            sys.stdout.flush()
+    finally:
+        if server is not None:
+            server.terminate()
+
+    if args.output:
+        with open(args.output, 'wt') as f:
+            json.dump({'workload': args.workload, 'url': url, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+#
+# Benchmarks for the decode, conversion and aggregation hot paths, using
+# synthetic payloads of realistic sizes.  Run from the benchmarks directory with:
+#
+#   PYTHONPATH=.. python run.py [--quick] [-k PATTERN] [--output results.json]
+#
+# and compare two result files (e.g. from two versions) with:
+#
+#   python compare.py old.json new.json
+#
+
+import argparse
+import datetime
+import json
+import platform
+import re
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import volue_insight_timeseries as vit
+from volue_insight_timeseries import util
+
+from bench_events import make_sse_events
+
+START = 1704063600000  # 2024-01-01T00:00:00+01:00
+MIN15 = 15 * 60 * 1000
+SIZES = (1000, 100000, 1000000)
+QUICK_SIZES = (1000, 100000)
+
+
+#
+# Synthetic payloads, shaped like the json from the API
+#
+
+def make_payload(n, frequency='MIN15', step=MIN15, start=START, **attrs):
+    rng = np.random.default_rng(n)
+    values = rng.normal(100, 25, n).round(3).tolist()
+    points = [[start + i * step, v] for i, v in enumerate(values)]
+    payload = {'id': 1, 'name': 'bench curve', 'frequency': frequency, 'time_zone': 'CET', 'points': points}
+    payload.update(attrs)
+    return payload
+
+
+def make_instances(count, n):
+    # Hourly instances, one per day
+    res = []
+    for k in range(count):
+        issue = START + k * 86400000
+        issue_date = datetime.datetime.fromtimestamp(issue / 1000, util.parse_tz('CET')).isoformat()
+        res.append(make_payload(n, frequency='H', step=3600000, start=issue, issue_date=issue_date))
+    return res
+
+
+def make_tags(count, n):
+    return [make_payload(n, tag='{:02d}'.format(k)) for k in range(count)]
+
+
+#
+# The benchmark cases, each a function returning (setup, run, items)
+#
+
+def case_json_decode(n):
+    text = json.dumps(make_payload(n))
+    return (lambda: text), json.loads, n
+
+
+def case_ts_construct(n):
+    payload = make_payload(n)
+    return (lambda: payload), (lambda p: util.TS(input_dict=p, curve_type=util.TIME_SERIES)), n
+
+
+def case_to_pandas(n):
+    ts = util.TS(input_dict=make_payload(n), curve_type=util.TIME_SERIES)
+    return (lambda: ts), (lambda t: t.to_pandas()), n
+
+
+def case_to_pandas_compact(n):
+    ts = util.TS(input_dict=make_payload(n), curve_type=util.TIME_SERIES).compact()
+    return (lambda: ts), (lambda t: t.to_pandas()), n
+
+
+def case_from_pandas(n):
+    series = util.TS(input_dict=make_payload(n), curve_type=util.TIME_SERIES).to_pandas()
+    return (lambda: series), util.TS.from_pandas, n
+
+
+def case_instances_construct(count, n):
+    payload = make_instances(count, n)
+    return ((lambda: payload),
+            (lambda p: [util.TS(input_dict=r, curve_type=util.INSTANCES) for r in p]),
+            count * n)
+
+
+def case_instances_to_pandas(count, n):
+    ts_list = [util.TS(input_dict=r, curve_type=util.INSTANCES) for r in make_instances(count, n)]
+    return (lambda: ts_list), (lambda tl: [t.to_pandas() for t in tl]), count * n
+
+
+def case_tags_to_df(count, n):
+    ts_list = [util.TS(input_dict=r, curve_type=util.TAGGED) for r in make_tags(count, n)]
+    return (lambda: ts_list), util.tags_to_DF, count * n
+
+
+def case_aggregate(func, count, n):
+    ts_list = [util.TS(input_dict=r, curve_type=util.TAGGED) for r in make_tags(count, n)]
+    return (lambda: ts_list), (lambda tl: func(tl, 'aggregate')), count * n
+
+
+def case_make_arg(count):
+    dates = [pd.Timestamp(START + k * 3600000, unit='ms', tz='CET') for k in range(count)]
+    return (lambda: dates), (lambda d: util.make_arg('issue_date', d)), count
+
+
+def case_event_parse(count):
+    sse_events = make_sse_events(count)
+
+    def parse(events):
+        for e in events:
+            event = vit.events.CurveEvent(e)
+            event.created, event.issue_date, event.range
+    return (lambda: sse_events), parse, count
+
+
+def all_cases(sizes):
+    cases = {}
+    for n in sizes:
+        cases['json_decode_{}'.format(n)] = lambda n=n: case_json_decode(n)
+        cases['ts_construct_{}'.format(n)] = lambda n=n: case_ts_construct(n)
+        cases['to_pandas_{}'.format(n)] = lambda n=n: case_to_pandas(n)
+        cases['to_pandas_compact_{}'.format(n)] = lambda n=n: case_to_pandas_compact(n)
+        cases['from_pandas_{}'.format(n)] = lambda n=n: case_from_pandas(n)
+    cases['instances_construct_500x240'] = lambda: case_instances_construct(500, 240)
+    cases['instances_to_pandas_500x240'] = lambda: case_instances_to_pandas(500, 240)
+    cases['tags_to_DF_50x8760'] = lambda: case_tags_to_df(50, 8760)
+    for name, func in (('sum', util.TS.sum), ('mean', util.TS.mean), ('median', util.TS.median),
+                       ('std', util.TS.std)):
+        cases['ts_{}_50x8760'.format(name)] = lambda func=func: case_aggregate(func, 50, 8760)
+    cases['make_arg_500_dates'] = lambda: case_make_arg(500)
+    cases['event_parse_10000'] = lambda: case_event_parse(10000)
+    return cases
+
+
+def run_case(make_case, min_time, max_repeat):
+    setup, run, items = make_case()
+    times = []
+    total = 0.0
+    while len(times) < max_repeat and (len(times) < 3 or total < min_time):
+        arg = setup()
+        start = time.perf_counter()
+        run(arg)
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        total += elapsed
+        if elapsed > min_time:
+            break
+    best = min(times)
+    return {
+        'min': best,
+        'median': statistics.median(times),
+        'repeat': len(times),
+        'items': items,
+        'items_per_second': items / best if best > 0 else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark volue_insight_timeseries hot paths')
+    parser.add_argument('--quick', action='store_true', help='Skip the largest payloads')
+    parser.add_argument('-k', dest='pattern', help='Only run benchmarks matching this regular expression')
+    parser.add_argument('--output', help='Save the results as json to this file')
+    parser.add_argument('--min-time', type=float, default=1.0, help='Minimum time spent per benchmark')
+    parser.add_argument('--max-repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    cases = all_cases(QUICK_SIZES if args.quick else SIZES)
+    results = {}
+    for name, make_case in cases.items():
+        if args.pattern and not re.search(args.pattern, name):
+            continue
+        res = run_case(make_case, args.min_time, args.max_repeat)
+        results[name] = res
+        print('{:32s} {:10.4f} s  {:14.0f} items/s'.format(name, res['min'], res['items_per_second'] or 0))
+        sys.stdout.flush()
+
+    if args.output:
+        meta = {
+            'version': vit.__version__,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        with open(args.output, 'wt') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ Multiple curves and multiple regions (for all curves) can be specified
 """
 
 import volue_insight_timeseries
+from volue_insight_timeseries.bulk import run_concurrently
 import pandas as pd
 import os
 
@@ -44,53 +45,61 @@ if not os.path.isdir(data_dir):
 # Create a session to Connect to Volue Insight API
 session = volue_insight_timeseries.Session(config_file=my_config_file)
 
-# loop through the given curves
-for c, curve_name in enumerate(curve_names):
-
-    # iterate regions
-    for region in regions:
-        # create curve name to read
-        cname = curve_name.format(region=region)
-
-        # make subdirectory to save csv files
-        dir_name = cname.replace('/','-').replace(' ','_')
-        dir = os.path.join(data_dir, dir_name)
-        if not os.path.isdir(dir):
-            os.mkdir(dir)
-
-        # get data from curve
-        print('Fetching curve', cname)
-        curve = session.get_curve(name=cname)
-        instances = curve.search_instances(issue_date_from=date_from,
-                                           issue_date_to=date_to,
-                                           with_data=True)
-
-        # create empty data dataframe for storing all instances
-        data = pd.DataFrame()
-
-        # looping through instances
-        for inst in instances:
-
-            # get every instance and convert to pandas Series
-            s = inst.to_pandas()
-
-            # get issue date
-            issue_date = pd.Timestamp(inst.issue_date).strftime('%Y%m%d%H%M')
-
-            # add series to data df
-            s.name = issue_date
-            data = pd.concat([data,s], axis=1)
-
-            # create names for single instance csv files
-            csv_name = dir_name + '_' + issue_date
-            # save to comma separated csv with point as decimal separator
-            s.to_csv(os.path.join(dir,csv_name+'.csv'))
-            # save to semicolon separated csv with comma as decimal separator
-            s.to_csv(os.path.join(dir,csv_name+'_comma.csv'),
-                     sep=';', decimal=',')
-
-        # save dataframe with all instances to csv
-        data = data.sort_index(axis=1)
+# curve names to read, for all regions
+cnames = [curve_name.format(region=region)
+          for curve_name in curve_names for region in regions]
+
+
+def fetch_instances(cname):
+    curve = session.get_curve(name=cname)
+    return curve.search_instances(issue_date_from=date_from,
+                                  issue_date_to=date_to,
+                                  with_data=True)
+
+
+# get data from all curves, running the requests concurrently
+print('Fetching curves', cnames)
+results = run_concurrently(fetch_instances, cnames)
+
+# loop through the curves
+for cname, (instances, error) in zip(cnames, results):
+    if error is not None:
+        print('Failed to fetch', cname, error)
+        continue
+
+    # make subdirectory to save csv files
+    dir_name = cname.replace('/','-').replace(' ','_')
+    dir = os.path.join(data_dir, dir_name)
+    if not os.path.isdir(dir):
+        os.mkdir(dir)
+
+    # collect all instances for storing in one dataframe
+    data = []
+
+    # looping through instances
+    for inst in instances or []:
+
+        # get every instance and convert to pandas Series
+        s = inst.to_pandas()
+
+        # get issue date
+        issue_date = pd.Timestamp(inst.issue_date).strftime('%Y%m%d%H%M')
+
+        # add series to data
+        s.name = issue_date
+        data.append(s)
+
+        # create names for single instance csv files
+        csv_name = dir_name + '_' + issue_date
+        # save to comma separated csv with point as decimal separator
+        s.to_csv(os.path.join(dir,csv_name+'.csv'))
+        # save to semicolon separated csv with comma as decimal separator
+        s.to_csv(os.path.join(dir,csv_name+'_comma.csv'),
+                 sep=';', decimal=',')
+
+    # save dataframe with all instances to csv
+    if data:
+        data = pd.concat(data, axis=1).sort_index(axis=1)
         data.to_csv(os.path.join(data_dir,dir_name+'.csv'))
 
 print('[Done]')
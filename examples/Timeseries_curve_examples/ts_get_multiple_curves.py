@@ -49,27 +49,24 @@ session = volue_insight_timeseries.Session(config_file=my_config_file)
 
 # loop through the given curves
 for c, curve_name in enumerate(curve_names):
-    # init empty df for each curve
-    df = pd.DataFrame()
     # get curve and output frequency for curve name
     freq_curve = freqs_curve[c]
     freq_out = freqs_out[c]
 
-    # iterate regions
-    for region in regions:
-        # get curve data and convert to pandas Series
-        cname = curve_name.format(region=region, freq=freq_curve)
-        print('Fetching curve', cname)
-        curve = session.get_curve(name=cname)
-        ts = curve.get_data(data_from=start, data_to=end)
-        s = ts.to_pandas()
-
-        if freq_curve != freq_out:
-            # convert frequency if needed
-            s = s.groupby(pd.Grouper(freq=freq_out)).mean()
-
-        # add data to curve dataframe
-        df[curve_name.format(region=region, freq=freq_out)] = s
+    # fetch the curve for all regions at once, the requests run concurrently
+    names = {curve_name.format(region=region, freq=freq_curve):
+             curve_name.format(region=region, freq=freq_out) for region in regions}
+    print('Fetching curves', list(names))
+    result = session.get_many(list(names), data_from=start, data_to=end)
+    for cname, error in result.errors.items():
+        print('Failed to fetch', cname, error)
+
+    # one column per region, on a common UTC index, converted back to the
+    # time zone of the curves (CET) before resampling
+    df = result.frame.rename(columns=names).tz_convert('CET')
+    if freq_curve != freq_out:
+        # convert frequency if needed
+        df = df.groupby(pd.Grouper(freq=freq_out)).mean()
 
     # create valid name for saving to csv
     csv_name = curve_name.format(region='', freq=freq_out)
@@ -30,6 +30,9 @@ setup(
     python_requires='>=3.9, <3.13a0',
     packages=find_packages(),
     install_requires=extract_requirements('requirements.txt'),
+    extras_require={
+        'tracing': ['opentelemetry-api'],
+    },
     tests_require=[
         'pytest',
         'pytest-cov >= 2.5',
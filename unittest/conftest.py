@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+import requests_mock
+
+import volue_insight_timeseries as vit
+from volue_insight_timeseries.transport import FakeTransport
+
+authprefix = 'rtsp://auth.host/oauth2'
+token = {'token_type': 'Bearer', 'access_token': 'secrettoken', 'expires_in': 1000}
+
+
+#
+# Fixtures to set up sessions for the tests
+#
+
+@pytest.fixture
+def mock_adapter():
+    # Request mock which answers the token requests to the test auth host
+    mock = requests_mock.Adapter()
+    mock.register_uri('POST', authprefix + '/token', text=json.dumps(token))
+    return mock
+
+
+@pytest.fixture
+def session(mock_adapter):
+    # Session from the test config file, and the request mock linked into it
+    config_file = os.path.join(os.path.dirname(__file__), 'testconfig_oauth.ini')
+    s = vit.Session()
+    s._session.mount('rtsp', mock_adapter)
+    s.read_config_file(config_file)
+    return s, mock_adapter
+
+
+def _answer_token(api):
+    # Fake api which answers the token requests, and passes the rest on to api
+    def answer(method, url, data, headers):
+        if url.endswith('/oauth2/token'):
+            return 200, token
+        return api(method, url, data, headers)
+    return answer
+
+
+@pytest.fixture
+def fake_session():
+    # Factory for sessions against the test hosts.  The requests are answered
+    # by api through the transport class (FakeTransport by default), or, with
+    # no api, by the given transport.
+    def make(api=None, transport=None):
+        if transport is None:
+            transport = FakeTransport
+        if api is not None:
+            transport = transport(_answer_token(api))
+        return vit.Session(urlbase='rtsp://test.host', auth_urlbase='rtsp://auth.host', client_id='clientid',
+                           client_secret='verysecret', transport=transport)
+    return make
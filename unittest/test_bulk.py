@@ -0,0 +1,185 @@
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+import pytest
+
+import volue_insight_timeseries as vit
+from volue_insight_timeseries.bulk import run_concurrently
+
+curves = {
+    'Curve A': {'id': 1, 'name': 'Curve A', 'frequency': 'H', 'time_zone': 'CET', 'curve_type': 'TIME_SERIES'},
+    'Curve B': {'id': 2, 'name': 'Curve B', 'frequency': 'H', 'time_zone': 'UTC', 'curve_type': 'INSTANCES'},
+    'Curve C': {'id': 3, 'name': 'Curve C', 'frequency': 'H', 'time_zone': 'UTC', 'curve_type': 'TIME_SERIES'},
+}
+
+
+def fake_api(method, url, data, headers):
+    parts = urlsplit(url)
+    query = parse_qs(parts.query)
+    if parts.path == '/api/curves':
+        names = [name.lower() for name in query['name']]
+        return 200, [c for name, c in curves.items() if name.lower() in names]
+    if parts.path == '/api/curves/get':
+        return 200, curves[query['name'][0]]
+    if parts.path == '/api/series/1':
+        return 200, dict(curves['Curve A'], points=[[0, 1.0], [3600000, 2.0]])
+    if parts.path == '/api/instances/2/latest':
+        return 200, dict(curves['Curve B'], issue_date='1970-01-01T00:00:00+00:00', points=[[3600000, 3.0]])
+    return 400, 'Bad request'
+
+
+def test_get_many(fake_session):
+    s = fake_session(fake_api)
+    res = s.get_many(['curve a', 'Curve B', 'Curve C', 'Curve D'], data_from='1970-01-01', data_to='1970-01-02')
+    assert not res.ok
+    assert list(res.series) == ['curve a', 'Curve B']
+    assert sorted(res.errors) == ['Curve C', 'Curve D']
+    assert isinstance(res.errors['Curve C'], vit.util.CurveException)
+    assert isinstance(res.errors['Curve D'], vit.session.MetadataException)
+    frame = res.frame
+    assert list(frame.columns) == ['curve a', 'Curve B']
+    assert str(frame.index.tz) == 'UTC'
+    assert frame.index[0] == pd.Timestamp(0, tz='UTC')
+    assert frame['curve a'].tolist() == [1.0, 2.0]
+    assert pd.isna(frame['Curve B'].iloc[0])
+    assert frame['Curve B'].iloc[1] == 3.0
+
+
+def test_get_many_made_curves(fake_session):
+    s = fake_session(fake_api)
+    made = [s.make_curve(1, 'TIME_SERIES'), s.make_curve(2, 'INSTANCES')]
+    res = s.get_many(made, data_from='1970-01-01', data_to='1970-01-02')
+    assert res.ok
+    assert list(res.series) == [1, 2]
+    assert res.series[2].issue_date is not None
+    latest = s.get_latest_many(made)
+    assert list(latest.series) == [2]
+    assert isinstance(latest.errors[1], vit.util.CurveException)
+
+
+def test_run_concurrently():
+    def func(n):
+        if n == 3:
+            raise ValueError(n)
+        return n * 2
+    res = run_concurrently(func, range(5), max_workers=3)
+    assert [r for r, e in res] == [0, 2, 4, None, 8]
+    assert isinstance(res[3][1], ValueError)
+
+
+def test_get_latest_many(fake_session):
+    issue_date = ['2024-01-01T00:00:00+00:00']
+    calls = []
+
+    def api(method, url, data, headers):
+        parts = urlsplit(url)
+        query = parse_qs(parts.query)
+        calls.append((parts.path, query.get('with_data', ['true'])[0]))
+        if parts.path == '/api/instances/2/latest':
+            res = dict(curves['Curve B'], issue_date=issue_date[0])
+            if query.get('with_data') != ['false']:
+                res['points'] = [[1704067200000, 3.0]]
+            return 200, res
+        return fake_api(method, url, data, headers)
+
+    s = fake_session(api)
+    metrics = s.enable_metrics()
+    curve = s.get_curve(name='Curve B')
+    res = s.get_latest_many([curve, 'Curve A'], data_from='2024-01-01')
+    assert list(res.series) == ['Curve B']
+    assert isinstance(res.errors['Curve A'], vit.util.CurveException)
+    assert res.frame.columns.tolist() == [('Curve B', issue_date[0])]
+    assert res.frame.columns.names == ['curve', 'issue_date']
+    # Unchanged instance is taken from the cache
+    del calls[:]
+    again = s.get_latest_many([curve], data_from='2024-01-01')
+    assert again.series['Curve B'] is res.series['Curve B']
+    assert calls == [('/api/instances/2/latest', 'false')]
+    assert metrics.cache.get(cache='latest', result='hit') == 1
+    # A new instance is downloaded
+    issue_date[0] = '2024-01-02T00:00:00+00:00'
+    del calls[:]
+    new = s.get_latest_many([curve], data_from='2024-01-01')
+    assert new.series['Curve B'].issue_date != res.series['Curve B'].issue_date
+    assert calls == [('/api/instances/2/latest', 'false'), ('/api/instances/2/latest', 'true')]
+
+
+def test_split_long_url(fake_session):
+    requests = []
+
+    def api(method, url, data, headers):
+        requests.append(url)
+        if 'area=' in url:
+            return 400, 'Unknown area'
+        return fake_api(method, url, data, headers)
+
+    s = fake_session(api)
+    s.max_url_length = 80
+    names = ['Curve C', 'Curve A', 'Curve X', 'Curve B'] * 3
+    res = s.search(name=names, frequency='H')
+    searches = [url for url in requests if '/api/curves?' in url]
+    assert len(searches) > 1
+    assert all(len(url) <= 80 for url in searches)
+    assert all('frequency=H' in url for url in searches)
+    # The results are joined in the order of the requests, without duplicates
+    expected = []
+    for url in searches:
+        expected.extend(c['name'] for name, c in curves.items()
+                        if name in parse_qs(urlsplit(url).query)['name'] and c['name'] not in expected)
+    assert [c.name for c in res] == expected
+    assert sorted(expected) == ['Curve A', 'Curve B', 'Curve C']
+    # Errors are returned as for a single request
+    with pytest.raises(vit.session.MetadataException):
+        s.search(name=names, area='NO1')
+    # Requests for a single object are not split
+    del requests[:]
+    curve = s.get_curve(name='Curve B')
+    issue_dates = ['2024-01-{:02}'.format(day) for day in range(1, 29)]
+    latest = curve.get_latest(issue_dates=issue_dates)
+    assert latest.issue_date == '1970-01-01T00:00:00+00:00'
+    assert len([url for url in requests if '/latest' in url]) == 1
+
+
+def test_single_flight(fake_session):
+    release = threading.Event()
+    calls = []
+
+    def api(method, url, data, headers):
+        if '/api/series/' in url:
+            calls.append(url)
+            release.wait(5)
+        return fake_api(method, url, data, headers)
+
+    s = fake_session(api)
+    metrics = s.enable_metrics()
+    flight = s.enable_single_flight()
+    assert s.enable_single_flight() is flight
+    curve = s.get_curve(name='Curve A')
+
+    def fetch(n):
+        if n == 0:
+            # Let the others join the request in flight before it completes
+            deadline = time.monotonic() + 5
+            while flight.shared < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            release.set()
+            return None
+        return curve.get_data(data_from='1970-01-01', data_to='1970-01-02')
+    res = run_concurrently(fetch, range(5), max_workers=5)
+    series = [r for r, e in res[1:]]
+    assert len(calls) == 1
+    assert flight.calls == 1 and flight.shared == 3
+    assert all(ts.points == [[0, 1.0], [3600000, 2.0]] for ts in series)
+    assert len({id(ts) for ts in series}) == 4
+    # Changing the points of one caller does not change the others
+    series[0].points.append([7200000, 3.0])
+    series[1].points[0][1] = 5.0
+    assert all(ts.points == [[0, 1.0], [3600000, 2.0]] for ts in series[2:])
+    assert metrics.cache.get(cache='single_flight', result='hit') == 3
+    # Nothing is kept after the request
+    release.clear()
+    threading.Timer(0.05, release.set).start()
+    curve.get_data(data_from='1970-01-01', data_to='1970-01-02')
+    assert len(calls) == 2
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+import requests
+
+import volue_insight_timeseries as vit
+from volue_insight_timeseries import circuit
+
+
+def test_breaker_states():
+    breaker = circuit.CircuitBreaker(failures=3, reset_timeout=0.05)
+    assert breaker.check('series') == circuit.CLOSED
+    assert breaker.record('series', False) == circuit.CLOSED
+    assert breaker.record('series', True) == circuit.CLOSED
+    for _ in range(3):
+        state = breaker.record('series', False)
+    assert state == circuit.OPEN
+    with pytest.raises(circuit.CircuitOpenException):
+        breaker.check('series')
+    # Other endpoint classes are not affected
+    assert breaker.check('curves') == circuit.CLOSED
+    time.sleep(0.06)
+    # One probe is let through
+    assert breaker.check('series') == circuit.HALF_OPEN
+    with pytest.raises(circuit.CircuitOpenException):
+        breaker.check('series')
+    # A failed probe opens the circuit again
+    assert breaker.record('series', False) == circuit.OPEN
+    with pytest.raises(circuit.CircuitOpenException):
+        breaker.check('series')
+    time.sleep(0.06)
+    assert breaker.check('series') == circuit.HALF_OPEN
+    assert breaker.record('series', True) == circuit.CLOSED
+    assert breaker.check('series') == circuit.CLOSED
+    assert breaker.states() == {'series': circuit.CLOSED}
+
+
+def test_breaker_slow_calls():
+    breaker = circuit.CircuitBreaker(failures=2, slow_call=1.0)
+    breaker.record('series', True, 2.0)
+    assert breaker.record('series', True, 0.5) == circuit.CLOSED
+    breaker.record('series', True, 2.0)
+    assert breaker.record('series', True, 3.0) == circuit.OPEN
+
+
+def test_session_circuit_breaker(monkeypatch, fake_session):
+    monkeypatch.setattr(vit.session, 'RETRY_DELAY', 0)
+    state = {'healthy': False, 'calls': 0}
+
+    def api(method, url, data, headers):
+        state['calls'] += 1
+        if not state['healthy']:
+            if url.endswith('/timeout'):
+                raise requests.exceptions.Timeout('timed out')
+            return 503, 'unavailable'
+        return 200, []
+
+    s = fake_session(api)
+    session_metrics = s.enable_metrics()
+    breaker = s.enable_circuit_breaker(failures=3, reset_timeout=0.05)
+    # A request counts as one failure, after its retries
+    attempts = vit.session.RETRY_COUNT + 1
+    for n in range(2):
+        assert s.data_request('GET', None, '/api/series/1').status_code == 503
+        assert breaker.state('series') == circuit.CLOSED
+    with pytest.raises(requests.exceptions.Timeout):
+        s.data_request('GET', None, '/api/series/timeout')
+    assert state['calls'] == 3 * attempts
+    assert breaker.state('series') == circuit.OPEN
+    with pytest.raises(circuit.CircuitOpenException):
+        s.data_request('GET', None, '/api/series/1')
+    assert state['calls'] == 3 * attempts
+    assert session_metrics.circuit_state.get(endpoint='series') == 2
+    assert session_metrics.circuit_rejected.get(endpoint='series') == 1
+    # Other endpoints are still called
+    assert s.data_request('GET', None, '/api/curves/get?name=x', retries=0).status_code == 503
+    # A failed probe opens the circuit again, without retrying
+    time.sleep(0.06)
+    with pytest.raises(circuit.CircuitOpenException):
+        s.data_request('GET', None, '/api/series/1')
+    assert state['calls'] == 3 * attempts + 2
+    assert breaker.state('series') == circuit.OPEN
+    time.sleep(0.06)
+    state['healthy'] = True
+    assert s.data_request('GET', None, '/api/series/1').status_code == 200
+    assert breaker.state('series') == circuit.CLOSED
+    assert session_metrics.circuit_state.get(endpoint='series') == 0
@@ -1,32 +1,18 @@
+import datetime
 import json
 import os
+import queue
+import re
 
+import pandas as pd
 import pytest
-import requests_mock
+import sseclient
 
 import volue_insight_timeseries as vit
 
 prefix = 'rtsp://test.host/api'
-authprefix = 'rtsp://auth.host/oauth2'
 
 
-#
-# Fixtures to set up the session for the rest of the tests
-# Returns both a session and a request mock linked into the session.
-#
-
-@pytest.fixture
-def session():
-    config_file = os.path.join(os.path.dirname(__file__), 'testconfig_oauth.ini')
-    s = vit.Session()
-    mock = requests_mock.Adapter()
-    s._session.mount('rtsp', mock)
-    client_token = json.dumps({'token_type': 'Bearer', 'access_token': 'secrettoken',
-                               'expires_in': 1000})
-    mock.register_uri('POST', authprefix + '/token', text=client_token)
-    s.read_config_file(config_file)
-    return s, mock
-
 #
 # Test the various authorization headers
 #
@@ -83,6 +69,36 @@ def test_ts_data(ts_curve):
     d = c.get_data(data_from=1, data_to=2)
     assert isinstance(d, vit.util.TS)
     assert d.frequency == 'H'
+    assert c._last_stats is None
+
+def test_request_stats(ts_curve):
+    c,s,m = ts_curve
+    vit.session.RETRY_DELAY = 0.00001
+    datapoints = json.dumps({'id': 5, 'frequency': 'H', 'points': [[140000000000, 10.0]]})
+    m.register_uri('GET', prefix + '/series/5?from=1&to=2',
+                   [{'status_code': 503, 'text': 'busy'}, {'text': datapoints}])
+    collector = vit.instrument.StatsCollector()
+    s.add_request_hook(collector)
+    c.get_data(data_from=1, data_to=2)
+    stats = c._last_stats
+    assert list(collector.recent) == [stats]
+    assert stats.method == 'GET'
+    assert stats.endpoint == 'series'
+    assert stats.status_code == 200
+    assert stats.retries == 1
+    assert stats.bytes == len(datapoints)
+    for phase in ('auth', 'ttfb', 'download', 'decode', 'build', 'total'):
+        assert getattr(stats, phase) >= 0
+    # Requests outside curve methods are reported too
+    m.register_uri('GET', prefix + '/units', text='[]')
+    s.get_attribute('units')
+    summary = collector.summary()
+    assert summary['series']['count'] == 1
+    assert summary['series']['retries'] == 1
+    assert summary['attributes']['count'] == 1
+    s.remove_request_hook(collector)
+    c.get_data(data_from=1, data_to=2)
+    assert len(collector.recent) == 2
 
 
 @pytest.fixture
@@ -119,6 +135,32 @@ def test_tagged_data(tagged_curve):
     assert d.frequency == 'H'
     assert d.tag == 'tag1'
 
+def test_tagged_data_frame(tagged_curve):
+    c,s,m = tagged_curve
+    tags = ['{:02d}'.format(i) for i in range(5)]
+    m.register_uri('GET', prefix + '/series/tagged/9/tags', text=json.dumps(tags))
+
+    def series(request, context):
+        begin = vit.util.parsetime(request.qs['from'][0]).timestamp()
+        end = vit.util.parsetime(request.qs['to'][0]).timestamp()
+        hours = range(int(begin) // 3600, int(end) // 3600)
+        return [{'id': 9, 'tag': tag, 'frequency': 'H', 'time_zone': 'CET',
+                 'points': [[h * 3600000, int(tag) * 1000 + h % 1000] for h in hours]}
+                for tag in request.qs['tag']]
+
+    m.register_uri('GET', re.compile(re.escape(prefix + '/series/tagged/9?')), json=series)
+    df = c.get_data_frame(data_from='2024-03-30', data_to='2024-04-02', tags_per_request=2,
+                          time_chunk=datetime.timedelta(days=1))
+    # 3 batches of tags, 3 days over the change to summer time
+    assert len([r for r in m.request_history if 'tag=' in r.url]) == 9
+    assert list(df.columns) == tags
+    assert len(df) == 71
+    assert df.index.freqstr == 'h'
+    assert str(df.index.tz) == 'CET'
+    assert df.index[0] == pd.Timestamp('2024-03-30', tz='CET')
+    hours = (df.index - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(hours=1)
+    assert (df['03'].values == 3000 + hours % 1000).all()
+
 
 @pytest.fixture
 def inst_curve(session):
@@ -152,6 +194,35 @@ def test_inst_search(inst_curve):
     res = c.search_instances(issue_dates=['46', '50'])
     assert len(res) == 2
 
+def test_inst_search_lazy(inst_curve, monkeypatch):
+    c,s,m = inst_curve
+    monkeypatch.setattr(vit.curves, 'LAZY_BATCH_SIZE', 2)
+    meta = [{'frequency': 'H', 'name': 'inst_name', 'id': 7, 'issue_date': d} for d in ('46', '50', '54')]
+    m.register_uri('GET', prefix + '/instances/7?with_data=false&issue_date_from=46', text=json.dumps(meta))
+
+    def data(request, context):
+        issue_dates = request.qs['issue_date']
+        return json.dumps([dict(i, points=[[0, float(i['issue_date'])]]) for i in meta
+                           if i['issue_date'] in issue_dates and i['issue_date'] != '54'])
+    m.register_uri('GET', prefix + '/instances/7?with_data=true&function=sum', text=data)
+    calls = m.call_count
+    res = c.search_instances(issue_date_from='46', with_data=True, function='sum', lazy=True)
+    assert m.call_count == calls + 1
+    assert [type(ts) for ts in res] == [vit.util.LazyTS] * 3
+    assert not any(ts.loaded for ts in res)
+    assert str(res[0]) == 'TS: inst_name 46 (not loaded)'
+    # The second instance is fetched together with the next one
+    assert res[1].points == [[0, 50.0]]
+    assert m.call_count == calls + 2
+    assert m.last_request.qs['issue_date'] == ['50', '54']
+    assert res[2].loaded and res[2].points == []
+    assert res[0].to_pandas().tolist() == [46.0]
+    assert m.call_count == calls + 3
+    assert m.last_request.qs['issue_date'] == ['46']
+    # No instances found
+    m.register_uri('GET', prefix + '/instances/7?with_data=false&issue_date_from=58', status_code=204)
+    assert c.search_instances(issue_date_from='58', lazy=True) is None
+
 def test_inst_get_instance(inst_curve):
     c,s,m = inst_curve
     inst = {'frequency': 'H', 'points': [[140000000000, 10.0]],
@@ -320,3 +391,181 @@ def test_events(session, ts_curve, inst_curve):
             assert isinstance(event, vit.events.CurveEvent)
             assert event.id == id
             assert isinstance(event.curve, vit.curves.BaseCurve)
+
+
+def _sse_curve_events(events, retry=None):
+    sse_data = []
+    for n, id, created in events:
+        d = {'id': id, 'created': created, 'operation': 'modify',
+             'range': {'begin': None, 'end': None}}
+        retry_line = '' if retry is None else 'retry: {}\n'.format(retry)
+        sse_data.append('id: {}\nevent: curve_event\n{}data: {}\n\n'.format(n, retry_line, json.dumps(d)))
+    return ''.join(sse_data)
+
+
+def test_events_resume(session):
+    s, m = session
+    first = [(0, 5, '2016-10-01T00:01:00+00:00'), (1, 7, '2016-10-01T00:02:00+00:00')]
+    # The server resends events from start_time, inclusive
+    second = first[1:] + [(2, 5, '2016-10-01T00:03:00+00:00')]
+    m.register_uri('GET', prefix + '/events?id=5&id=7',
+                   [{'text': _sse_curve_events(first, retry=10)},
+                    {'text': _sse_curve_events(second, retry=10)}])
+    with vit.events.EventListener(s, [5, 7], timeout=5) as e:
+        assert [e.get().event_id for _ in range(3)] == ['0', '1', '2']
+    urls = [r.url for r in m.request_history if '/events' in r.url]
+    assert 'start_time' not in urls[0]
+    assert 'start_time=2016-10-01T00%3A02%3A00%2B00%3A00' in urls[1]
+
+
+def test_events_split_streams(session):
+    s, m = session
+    s.max_url_length = 85
+    m.register_uri('GET', prefix + '/events?id=5', text=_sse_curve_events([(0, 5, '2016-10-01T00:01:00+00:00')]))
+    m.register_uri('GET', prefix + '/events?id=7', text=_sse_curve_events([(1, 7, '2016-10-01T00:00:00+00:00')]))
+    with vit.events.EventListener(s, [5, 7], timeout=5) as e:
+        assert e.id_groups == [[5], [7]]
+        assert sorted(e.get().id for _ in range(2)) == [5, 7]
+    urls = [r.url for r in m.request_history if '/events' in r.url]
+    assert all(url.count('id=') == 1 for url in urls)
+
+
+def test_events_cursor_file(session, tmp_path):
+    s, m = session
+    cursor_file = str(tmp_path / 'cursor.json')
+    events = [(0, 5, '2016-10-01T00:01:00+00:00'), (1, 5, '2016-10-01T00:02:00+00:00')]
+    m.register_uri('GET', prefix + '/events?id=5', text=_sse_curve_events(events))
+    with s.events([5], timeout=5, cursor_file=cursor_file) as e:
+        assert e.get().event_id == '0'
+    with open(cursor_file) as f:
+        assert json.load(f) == {'created': '2016-10-01T00:01:00+00:00', 'keys': ['0']}
+    # A restarted listener resumes after the last event handed out
+    with s.events([5], timeout=5, cursor_file=cursor_file) as e:
+        assert e.start_time == vit.util.parsetime('2016-10-01T00:01:00+00:00')
+        assert e.get().event_id == '1'
+    assert 'start_time=2016-10-01T00%3A01%3A00%2B00%3A00' in m.request_history[-1].url
+    # An explicit start_time is used instead of the position in the file
+    with s.events([5], start_time='2016-10-01T00:00:00+00:00', timeout=5, cursor_file=cursor_file) as e:
+        assert e.get().event_id == '0'
+    assert 'start_time=2016-10-01T00%3A00%3A00%2B00%3A00' in m.request_history[-1].url
+    with open(cursor_file) as f:
+        assert json.load(f) == {'created': '2016-10-01T00:01:00+00:00', 'keys': ['0']}
+
+
+def test_events_cursor_file_split_streams(session, tmp_path):
+    s, m = session
+    s.max_url_length = 85
+    cursor_file = str(tmp_path / 'cursor.json')
+    events = [(0, 5, '2016-10-01T00:01:00+00:00'), (1, 5, '2016-10-01T00:03:00+00:00')]
+    m.register_uri('GET', prefix + '/events?id=5', text=_sse_curve_events(events))
+    m.register_uri('GET', prefix + '/events?id=7', text='')
+    with s.events([5, 7], start_time='2016-10-01T00:00:00+00:00', timeout=5, cursor_file=cursor_file) as e:
+        assert [e.get().event_id for _ in range(2)] == ['0', '1']
+        # The stream for curve 7 has seen nothing after start_time
+        assert e.cursor.created == vit.util.parsetime('2016-10-01T00:00:00+00:00')
+    m.register_uri('GET', prefix + '/events?id=7', text=_sse_curve_events([(2, 7, '2016-10-01T00:02:00+00:00')]))
+    with s.events([5, 7], timeout=5, cursor_file=cursor_file) as e:
+        assert sorted(e.get().event_id for _ in range(3)) == ['0', '1', '2']
+        # The cursor follows the stream furthest behind
+        assert e.cursor.position() == (vit.util.parsetime('2016-10-01T00:02:00+00:00'), {'2'})
+    urls = [r.url for r in m.request_history if '/events' in r.url][-2:]
+    assert all('start_time=2016-10-01T00%3A00%3A00%2B00%3A00' in url for url in urls)
+
+
+def test_event_cursor_checkpoint(tmp_path):
+    cursor_file = str(tmp_path / 'cursor.json')
+    cursor = vit.events.EventCursor(cursor_file, save_every=3, save_interval=60)
+    for n in range(2):
+        cursor.advance(vit.util.parsetime('2016-10-01T00:0{}:00+00:00'.format(n)), str(n))
+        cursor.checkpoint()
+    assert not os.path.exists(cursor_file)
+    cursor.advance(vit.util.parsetime('2016-10-01T00:02:00+00:00'), '2')
+    cursor.checkpoint()
+    with open(cursor_file) as f:
+        assert json.load(f) == {'created': '2016-10-01T00:02:00+00:00', 'keys': ['2']}
+    cursor.save_interval = 0
+    cursor.advance(vit.util.parsetime('2016-10-01T00:03:00+00:00'), '3')
+    cursor.checkpoint()
+    assert vit.events.EventCursor(cursor_file).keys == {'3'}
+
+
+def _curve_event(id, created, begin=None, end=None, operation='modify'):
+    d = {'id': id, 'created': created, 'operation': operation, 'range': {'begin': begin, 'end': end}}
+    return vit.events.CurveEvent(sseclient.Event(data=json.dumps(d), event='curve_event'))
+
+
+def test_event_queue_drop_oldest():
+    q = vit.events.EventQueue(2, 'drop_oldest')
+    for n in range(4):
+        q.put(_curve_event(n, '2016-10-01T00:00:00+00:00'))
+    assert q.qsize() == 2
+    assert q.dropped == 2
+    assert [q.get().id, q.get().id] == [2, 3]
+
+
+def test_event_queue_coalesce():
+    q = vit.events.EventQueue(2, 'coalesce')
+    q.put(_curve_event(5, '2016-10-01T00:00:00+00:00', '2016-01-01T00:00:00+00:00', '2016-01-02T00:00:00+00:00'))
+    q.put(_curve_event(7, '2016-10-01T00:00:00+00:00'))
+    q.put(_curve_event(5, '2016-10-01T00:01:00+00:00', '2016-01-03T00:00:00+00:00', '2016-01-04T00:00:00+00:00'))
+    assert q.qsize() == 2
+    assert q.coalesced == 1
+    e = q.get()
+    assert e.id == 5
+    assert e.created == vit.util.parsetime('2016-10-01T00:01:00+00:00')
+    assert e.range == (vit.util.parsetime('2016-01-01T00:00:00+00:00'),
+                       vit.util.parsetime('2016-01-04T00:00:00+00:00'))
+    assert q.get().id == 7
+    with pytest.raises(queue.Empty):
+        q.get(timeout=0.01)
+
+
+def test_event_queue_coalesce_when_full():
+    # Events are only merged when the queue is full
+    for maxsize in (0, 100):
+        q = vit.events.EventQueue(maxsize, 'coalesce')
+        for n in range(3):
+            q.put(_curve_event(5, '2016-10-01T00:0{}:00+00:00'.format(n)))
+        assert q.qsize() == 3
+        assert q.coalesced == 0
+    # Different operations are never merged
+    q = vit.events.EventQueue(1, 'coalesce')
+    q.put(_curve_event(5, '2016-10-01T00:00:00+00:00'))
+    q.put(_curve_event(5, '2016-10-01T00:01:00+00:00'))
+    assert q.coalesced == 1
+    q.close()
+    q.put(_curve_event(5, '2016-10-01T00:02:00+00:00', operation='delete'))
+    assert q.coalesced == 1
+    assert q.qsize() == 1
+
+
+def test_event_queue_bad_policy():
+    with pytest.raises(ValueError):
+        vit.events.EventQueue(2, 'ignore')
+
+
+def test_events_stats(session):
+    s, m = session
+    events = [(n, 5, '2016-10-01T00:0{}:00+00:00'.format(n)) for n in range(3)]
+    m.register_uri('GET', prefix + '/events?id=5', text=_sse_curve_events(events))
+    with s.events([5], timeout=5, max_queue_size=10) as e:
+        e.get()
+        stats = e.stats()
+    assert stats['delivered'] == 1
+    assert stats['received'] == 3
+    assert stats['queue_capacity'] == 10
+    assert stats['dropped'] == 0
+    assert stats['lag'] > 0
+
+
+def test_curve_event_parsing():
+    e = _curve_event(5, '2016-10-01T00:01:02.345+01:00', '2016-01-01T00:00:00+01:00', None)
+    assert not hasattr(e, '__dict__')
+    assert e.json_data['id'] == 5
+    assert e.created == vit.util.parsetime('2016-10-01T00:01:02.345+01:00')
+    assert e.created.microsecond == 345000
+    assert e.range == (vit.util.parsetime('2016-01-01T00:00:00+01:00'), None)
+    assert e.issue_date is None
+    assert e.tag is None
+    # Events without an id are known by their data as received
+    assert vit.events._event_key(e) == json.dumps(e.json_data)
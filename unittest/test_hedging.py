@@ -0,0 +1,164 @@
+import contextlib
+import threading
+import time
+
+import pytest
+
+import volue_insight_timeseries as vit
+from volue_insight_timeseries import hedging, instrument, limits
+
+URL = 'https://test.host/api/series/3'
+
+
+def _warm_up(hedger, latency=0.005, count=hedging.MIN_SAMPLES):
+    for _ in range(count):
+        hedger.latencies.record('series', latency)
+    hedger.requests += count
+
+
+def test_latency_percentile():
+    tracker = instrument.LatencyTracker(window=100)
+    assert tracker.percentile('series', 0.5) is None
+    for n in range(200):
+        tracker.record('series', n / 100)
+    assert tracker.count('series') == 100
+    assert tracker.percentile('series', 0.0) == 1.0
+    assert tracker.percentile('series', 0.95) == 1.95
+    assert tracker.percentile('series', 1.0) == 1.99
+
+
+def test_hedge_slow_request():
+    hedger = hedging.Hedger(budget=1.0)
+    _warm_up(hedger)
+    calls = []
+
+    def func():
+        calls.append(threading.get_ident())
+        time.sleep(0.5 if len(calls) == 1 else 0.001)
+        return len(calls)
+
+    start = time.perf_counter()
+    assert hedger.request(URL, func) == (2, True)
+    assert time.perf_counter() - start < 0.3
+    assert hedger.hedged == 1
+    assert hedger.hedge_wins == 1
+    # Fast requests are not hedged
+    assert hedger.request(URL, lambda: 'fast') == ('fast', None)
+    assert hedger.hedged == 1
+    hedger.close()
+
+
+def test_hedge_errors():
+    hedger = hedging.Hedger(budget=1.0)
+    _warm_up(hedger)
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.05)
+            raise ValueError('first')
+        time.sleep(0.1)
+        return 'second'
+
+    # The hedge answers, even after the original fails
+    assert hedger.request(URL, func) == ('second', True)
+
+    def fail():
+        time.sleep(0.05)
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        hedger.request(URL, fail)
+    hedger.close()
+
+
+def test_hedge_after_sending():
+    hedger = hedging.Hedger(budget=1.0)
+    _warm_up(hedger)
+
+    @contextlib.contextmanager
+    def slow_slot():
+        time.sleep(0.1)
+        yield
+
+    # Waiting for a slot does not count towards the hedging delay
+    assert hedger.request(URL, lambda: 'x', slow_slot) == ('x', None)
+    assert hedger.hedged == 0
+    # The copies are scheduled as made by the calling thread
+    callers = []
+
+    def func():
+        callers.append(limits.current_caller())
+        time.sleep(0.05)
+        return 'y'
+
+    assert hedger.request(URL, func)[0] == 'y'
+    assert callers == [threading.get_ident()] * 2
+    hedger.close()
+
+
+def test_hedge_budget():
+    hedger = hedging.Hedger(budget=0.0)
+    _warm_up(hedger)
+    assert hedger.request(URL, lambda: time.sleep(0.05) or 'slow') == ('slow', None)
+    assert hedger.hedged == 0
+    # Not enough latencies for the endpoint class
+    hedger = hedging.Hedger(budget=1.0)
+    assert hedger.delay('series') is None
+    assert hedger.request(URL, lambda: 'x') == ('x', None)
+
+
+def test_session_hedging(fake_session):
+    lock = threading.Lock()
+    counts = {}
+
+    def api(method, url, data, headers):
+        with lock:
+            counts[url] = counts.get(url, 0) + 1
+            first = counts[url] == 1
+        if url.endswith('/slow') and first:
+            time.sleep(0.5)
+        return 200, {'url': url}
+
+    s = fake_session(api)
+    session_metrics = s.enable_metrics()
+    hedger = s.enable_hedging(budget=0.5)
+    for n in range(hedging.MIN_SAMPLES):
+        assert s.data_request('GET', None, '/api/series/{}'.format(n)).status_code == 200
+    assert hedger.delay('series') is not None
+    start = time.perf_counter()
+    res = s.data_request('GET', None, '/api/series/slow')
+    assert time.perf_counter() - start < 0.4
+    assert res.json() == {'url': 'rtsp://test.host/api/series/slow'}
+    assert counts['rtsp://test.host/api/series/slow'] == 2
+    assert session_metrics.hedged.get(endpoint='series', winner='hedge') == 1
+    assert session_metrics.hedge_delay.get(endpoint='series') >= hedging.MIN_DELAY
+    # Other requests are never hedged
+    assert s.data_request('PUT', None, '/api/series/slow', data=[]).status_code == 200
+    assert hedger.requests == hedging.MIN_SAMPLES + 1
+
+
+def test_session_hedging_limits(fake_session):
+    lock = threading.Lock()
+    active = [0, 0]  # Requests running now, and the most at once
+
+    def api(method, url, data, headers):
+        with lock:
+            active[0] += 1
+            active[1] = max(active)
+        time.sleep(0.05 if url.endswith('/slow') else 0.001)
+        with lock:
+            active[0] -= 1
+        return 200, {'url': url}
+
+    s = fake_session(api)
+    s.set_limits(max_in_flight=1)
+    hedger = s.enable_hedging(budget=1.0)
+    for n in range(hedging.MIN_SAMPLES):
+        s.data_request('GET', None, '/api/series/{}'.format(n))
+    results = vit.bulk.run_concurrently(lambda n: s.data_request('GET', None, '/api/series/slow'), range(8))
+    assert all(error is None and res.status_code == 200 for res, error in results)
+    assert hedger.hedged > 0
+    # Each copy of a hedged request waits for its own slot
+    assert active[1] == 1
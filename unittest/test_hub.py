@@ -0,0 +1,101 @@
+import json
+import os
+import socket
+import stat
+import time
+
+import pytest
+
+import volue_insight_timeseries as vit
+from volue_insight_timeseries.hub import EventHub, EventHubException, HubListener
+
+prefix = 'rtsp://test.host/api'
+
+
+def test_hub_fan_out(session, tmp_path):
+    s, m = session
+    address = str(tmp_path / 'hub.sock')
+    hub = EventHub(s, [5, 7], address)
+    ids = [5, 7, 7, 5]
+
+    def sse_stream(request, context):
+        # Only start sending once both subscribers are connected
+        deadline = time.time() + 5
+        while hub.stats()['subscribers'] < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        sse_data = []
+        for n, id in enumerate(ids):
+            d = {'id': id, 'created': '2016-10-01T00:0{}:00+00:00'.format(n), 'operation': 'modify'}
+            sse_data.append('id: {}\nevent: curve_event\ndata: {}\n\n'.format(n, json.dumps(d)))
+        return ''.join(sse_data)
+
+    m.register_uri('GET', prefix + '/events?id=5&id=7', text=sse_stream)
+    with hub, HubListener(address, [5], timeout=5) as only_5, HubListener(address, [5, 7], timeout=5) as both:
+        received = [both.get() for _ in ids]
+        assert [e.id for e in received] == ids
+        assert all(isinstance(e, vit.events.CurveEvent) for e in received)
+        assert [only_5.get().event_id for _ in range(2)] == ['0', '3']
+        assert received[1].created == vit.util.parsetime('2016-10-01T00:01:00+00:00')
+    # Only one upstream connection is used
+    assert len([r for r in m.request_history if '/events' in r.url]) == 1
+
+
+def test_hub_address_in_use(session, tmp_path):
+    s, m = session
+    address = str(tmp_path / 'hub.sock')
+    # A stale socket is replaced
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(address)
+    stale.close()
+    hub = EventHub(s, [5], address)
+    # A socket a hub is serving on is not
+    with pytest.raises(EventHubException):
+        EventHub(s, [5], address)
+    hub.close()
+    assert vit.hub.EventHub is EventHub
+
+
+def test_hub_handshake(session, tmp_path):
+    s, m = session
+    address = str(tmp_path / 'hub.sock')
+    m.register_uri('GET', prefix + '/events?id=5', text='')
+    with EventHub(s, [5], address) as hub:
+        # Only the user running the hub may subscribe
+        assert stat.S_IMODE(os.stat(address).st_mode) == 0o600
+        # A bad handshake closes the connection
+        for handshake in (b'[5]\n', b'"5"\n', b'{"ids": 5}\n', b'{"ids": [[5]]}\n'):
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.settimeout(5)
+            client.connect(address)
+            client.sendall(handshake)
+            assert client.recv(1) == b''
+            client.close()
+        assert hub.stats()['subscribers'] == 0
+
+
+def test_hub_restart(session, tmp_path):
+    s, m = session
+    address = str(tmp_path / 'hub.sock')
+    hubs = []
+
+    def sse_stream(request, context):
+        hub = hubs[-1]
+        deadline = time.time() + 5
+        while hub.stats()['subscribers'] < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        n = len(hubs)
+        d = {'id': 5, 'created': '2016-10-01T00:0{}:00+00:00'.format(n), 'operation': 'modify'}
+        return 'id: {}\nevent: curve_event\ndata: {}\n\n'.format(n, json.dumps(d))
+
+    m.register_uri('GET', prefix + '/events?id=5', text=sse_stream)
+    hubs.append(EventHub(s, [5], address))
+    hubs[0].start()
+    with HubListener(address, [5], timeout=5) as listener:
+        assert listener.get().event_id == '1'
+        hubs[0].close()
+        time.sleep(0.2)
+        # The listener reconnects to the restarted hub
+        hubs.append(EventHub(s, [5], address))
+        with hubs[1]:
+            assert listener.get().event_id == '2'
+        assert listener.stats()['reconnects'] == 1
@@ -0,0 +1,162 @@
+import threading
+import time
+
+import pytest
+
+from volue_insight_timeseries import limits
+from volue_insight_timeseries.bulk import run_concurrently
+
+
+def test_token_bucket():
+    bucket = limits.TokenBucket(rate=100, burst=2)
+    start = time.monotonic()
+    waits = [bucket.acquire() for _ in range(6)]
+    assert waits[:2] == [0.0, 0.0]
+    assert all(w > 0 for w in waits[2:])
+    assert time.monotonic() - start >= 0.035
+    with pytest.raises(limits.LimitException):
+        limits.TokenBucket(rate=0)
+
+
+def test_file_token_bucket(tmp_path):
+    # Two buckets on the same file share the tokens, like two processes
+    path = str(tmp_path / 'bucket')
+    first = limits.FileTokenBucket(path, rate=10, burst=2)
+    second = limits.FileTokenBucket(path, rate=10, burst=2)
+    assert first.acquire() == 0.0
+    assert second.acquire() == 0.0
+    assert first.acquire() > 0.05
+
+
+def test_file_concurrency_limiter(tmp_path):
+    path = str(tmp_path / 'slots')
+    first = limits.FileConcurrencyLimiter(path, 1)
+    second = limits.FileConcurrencyLimiter(path, 1)
+    entered = threading.Event()
+
+    def use_second():
+        with second:
+            entered.set()
+
+    with first:
+        thread = threading.Thread(target=use_second)
+        thread.start()
+        assert not entered.wait(0.1)
+    assert entered.wait(5)
+    thread.join()
+
+
+def test_session_limits(fake_session):
+    lock = threading.Lock()
+    running = {'now': 0, 'max': 0, 'bulk': 0}
+
+    def api(method, url, data, headers):
+        with lock:
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+            if limits.current_priority() == limits.BULK:
+                running['bulk'] += 1
+        time.sleep(0.02)
+        with lock:
+            running['now'] -= 1
+        return 200, []
+
+    s = fake_session(api)
+    s.set_limits(max_in_flight=4)
+    bulk_limits = s.set_limits(rate=1000, max_in_flight=2, priority=limits.BULK)
+    with s.priority(limits.BULK):
+        run_concurrently(lambda n: s.search(name='x{}'.format(n)), range(8), max_workers=8)
+    assert running['max'] == 2
+    assert running['bulk'] == 8
+    assert limits.current_priority() == limits.INTERACTIVE
+    assert bulk_limits.bucket is not None
+    running['max'] = 0
+    run_concurrently(lambda n: s.search(name='x{}'.format(n)), range(8), max_workers=8)
+    assert running['max'] == 4
+    assert s.set_limits(priority=limits.BULK) is None
+    assert list(s.limits) == [None]
+
+
+def _queue_request(scheduler, order, name, priority, caller):
+    # Start a request and wait until it is queued (or running)
+    before = sum(lane['waiting'] + lane['running'] for lane in scheduler.stats().values())
+
+    def request():
+        with scheduler.slot(priority, caller):
+            order.append(name)
+
+    thread = threading.Thread(target=request)
+    thread.start()
+    while sum(lane['waiting'] + lane['running'] for lane in scheduler.stats().values()) == before:
+        time.sleep(0.001)
+    return thread
+
+
+def test_scheduler_order():
+    scheduler = limits.PriorityScheduler({limits.INTERACTIVE: None, limits.BULK: None}, max_in_flight=1)
+    order = []
+    with scheduler.slot(limits.INTERACTIVE, 'holder'):
+        threads = [_queue_request(scheduler, order, 'a1', limits.BULK, 'a'),
+                   _queue_request(scheduler, order, 'a2', limits.BULK, 'a'),
+                   _queue_request(scheduler, order, 'a3', limits.BULK, 'a'),
+                   _queue_request(scheduler, order, 'b1', limits.BULK, 'b'),
+                   _queue_request(scheduler, order, 'i1', limits.INTERACTIVE, 'c'),
+                   _queue_request(scheduler, order, 'x1', 'other', 'c')]
+        assert scheduler.stats() == {limits.INTERACTIVE: {'running': 1, 'waiting': 1},
+                                     limits.BULK: {'running': 0, 'waiting': 5}}
+    for thread in threads:
+        thread.join()
+    # Interactive first, then the bulk callers taking turns
+    assert order == ['i1', 'a1', 'b1', 'x1', 'a2', 'a3']
+    assert scheduler.stats()[limits.BULK] == {'running': 0, 'waiting': 0}
+
+
+def test_scheduler_lane_limit():
+    scheduler = limits.PriorityScheduler({limits.INTERACTIVE: None, limits.BULK: 1}, max_in_flight=3)
+    order = []
+    with scheduler.slot(limits.BULK, 'a'):
+        thread = _queue_request(scheduler, order, 'a2', limits.BULK, 'a')
+        # The bulk lane is full, interactive requests still get through
+        with scheduler.slot(limits.INTERACTIVE, 'b'):
+            assert scheduler.stats()[limits.BULK] == {'running': 1, 'waiting': 1}
+        assert order == []
+    thread.join()
+    assert order == ['a2']
+
+
+def test_session_scheduler(fake_session):
+    lock = threading.Lock()
+    running = {'now': 0, 'max': 0}
+
+    def api(method, url, data, headers):
+        with lock:
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+        time.sleep(0.02)
+        with lock:
+            running['now'] -= 1
+        return 200, []
+
+    s = fake_session(api)
+    scheduler = s.enable_scheduler(max_in_flight=4)
+    assert scheduler.lanes == {limits.INTERACTIVE: None, limits.BULK: 2}
+    with s.priority(limits.BULK):
+        run_concurrently(lambda n: s.search(name='x{}'.format(n)), range(8), max_workers=8)
+    assert running['max'] == 2
+    running['max'] = 0
+    run_concurrently(lambda n: s.search(name='x{}'.format(n)), range(8), max_workers=8)
+    assert running['max'] == 4
+
+
+def test_pin_caller():
+    callers = set()
+
+    def work(n):
+        callers.add(limits.current_caller())
+
+    run_concurrently(work, range(8), max_workers=4)
+    assert callers == {threading.get_ident()}
+    callers.clear()
+    with limits.caller('job'):
+        run_concurrently(work, range(8), max_workers=4)
+    assert callers == {'job'}
@@ -0,0 +1,68 @@
+import json
+import urllib.request
+
+import pytest
+
+from volue_insight_timeseries.metrics import MetricsException, MetricsRegistry
+
+metadata = {'id': 5, 'name': 'testcurve5', 'frequency': 'H', 'time_zone': 'CET', 'curve_type': 'TIME_SERIES'}
+series = dict(metadata, points=[[0, 1.0], [3600000, 2.0]])
+
+
+def fake_api(method, url, data, headers):
+    if '/api/curves/get' in url:
+        return 200, metadata
+    if '/api/series/5' in url:
+        return 200, series
+    return 404, 'Not found'
+
+
+def test_registry():
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', 'A counter', ('kind',))
+    counter.inc(kind='a')
+    counter.inc(2, kind='a')
+    assert counter.get(kind='a') == 3
+    with pytest.raises(MetricsException):
+        counter.inc(other='b')
+    with pytest.raises(MetricsException):
+        registry.gauge('test_total', 'Not a counter')
+    histogram = registry.histogram('test_seconds', 'A histogram', buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    registry.gauge('test_gauge', 'A gauge', function=lambda: 7)
+    text = registry.to_prometheus()
+    assert '# TYPE test_total counter\ntest_total{kind="a"} 3\n' in text
+    assert 'test_seconds_bucket{le="0.1"} 1\n' in text
+    assert 'test_seconds_bucket{le="1"} 2\n' in text
+    assert 'test_seconds_bucket{le="+Inf"} 3\n' in text
+    assert 'test_seconds_count 3\n' in text
+    assert 'test_gauge 7\n' in text
+    d = registry.as_dict()
+    assert d['test_seconds']['values'][0]['value']['buckets'] == {'0.1': 1, '1': 2, '+Inf': 3}
+    assert d['test_gauge']['values'] == [{'labels': {}, 'value': 7}]
+
+
+def test_session_metrics(fake_session):
+    s = fake_session(fake_api)
+    m = s.enable_metrics()
+    assert s.enable_metrics() is m
+    c = s.get_curve(name='testcurve5')
+    c.get_data(data_from='1970-01-01', data_to='1970-01-02')
+    assert c.access() is None
+    assert m.requests.get(endpoint='series', method='GET', status=200) == 1
+    assert m.requests.get(endpoint='curves', method='GET', status=200) == 1
+    assert m.requests.get(endpoint='curves', method='GET', status=404) == 1
+    assert m.bytes.get(endpoint='series') == len(json.dumps(series))
+    assert m.in_flight.get() == 0
+    assert m.cache_hit_ratio.get(cache='token') == 1.0
+    server = m.serve()
+    try:
+        with urllib.request.urlopen(server.url) as f:
+            text = f.read().decode()
+        assert 'vit_requests_total{endpoint="series",method="GET",status="200"} 1' in text
+        with urllib.request.urlopen(server.url + '.json') as f:
+            assert 'vit_request_duration_seconds' in json.load(f)
+    finally:
+        server.close()
@@ -0,0 +1,76 @@
+import pytest
+
+import volue_insight_timeseries as vit
+from volue_insight_timeseries import curves, timeouts
+from volue_insight_timeseries.transport import FakeTransport
+
+
+class TimeoutTransport(FakeTransport):
+    def __init__(self, handler):
+        super().__init__(handler)
+        self.timeouts = []
+
+    def request(self, method, url, data=None, headers=None, auth=None, stream=False, timeout=None):
+        if not url.endswith('/oauth2/token'):
+            self.timeouts.append(timeout)
+        return super().request(method, url, data, headers, auth, stream, timeout)
+
+
+def test_adaptive_timeouts():
+    adaptive = timeouts.AdaptiveTimeouts(connect=2, percentile=0.5, multiplier=4, min_read=1, min_samples=5)
+    assert adaptive.timeout('series', default=300) == (2, 300)
+    for _ in range(5):
+        adaptive.record('series', 0.5)
+    assert adaptive.timeout('series', default=300) == (2, 2.0)
+    # Latencies and timeouts are scaled by the number of points
+    assert adaptive.timeout('series', points=100000) == (2, 20.0)
+    for _ in range(5):
+        adaptive.record('series', 5.0, points=100000)
+    assert adaptive.timeout('series') == (2, 2.0)
+    assert adaptive.timeout('series', attempt=2) == (2, 8.0)
+    # Requests of unknown size get the default, and are not recorded
+    assert adaptive.timeout('series', points=None, default=300) == (2, 300)
+    adaptive.record('series', 100.0, points=None)
+    assert adaptive.latencies.count('series') == 10
+    # Too short read timeouts are raised, too long are cut
+    adaptive.record('curves', 0.01)
+    adaptive.min_samples = 1
+    assert adaptive.timeout('curves') == (2, 1)
+    adaptive.max_read = 10
+    assert adaptive.timeout('series', points=1000000) == (2, 10)
+
+
+def test_session_adaptive_timeouts(fake_session):
+    def api(method, url, data, headers):
+        return 200, {'id': 5, 'name': 'testcurve', 'frequency': 'H', 'time_zone': 'CET', 'points': []}
+
+    s = fake_session(api, TimeoutTransport)
+    transport = s.transport
+    curve = curves.TimeSeriesCurve(5, {'id': 5, 'name': 'testcurve', 'frequency': 'H', 'time_zone': 'CET',
+                                       'curve_type': 'TIME_SERIES'}, s)
+    curve.get_data(data_from='2024-01-01', data_to='2024-01-02')
+    assert transport.timeouts == [vit.session.TIMEOUT]
+    adaptive = s.enable_adaptive_timeouts(connect=3, min_read=0.5)
+    assert curve._expected_points('/api/series/5?from=2024-01-01&to=2025-01-01') == 8784
+    assert curve._expected_points('/api/series/5?from=2024-01-01&to=2025-01-01&frequency=D') == 366
+    assert curve._expected_points('/api/series/5') is None
+    curve.get_data(data_from='2024-01-01', data_to='2024-01-02')
+    assert transport.timeouts[-1] == (3, vit.session.TIMEOUT)
+    for _ in range(timeouts.MIN_SAMPLES):
+        adaptive.record('series', 0.2)
+    curve.get_data(data_from='2024-01-01', data_to='2024-01-02')
+    connect, read = transport.timeouts[-1]
+    assert connect == 3
+    assert read == pytest.approx(0.8)
+    # Twenty years of hourly values take longer
+    curve.get_data(data_from='2004-01-01', data_to='2024-01-01')
+    connect, read = transport.timeouts[-1]
+    assert read == pytest.approx(0.8 * 175320 / timeouts.POINTS_UNIT, rel=0.01)
+    # Without a range the size is not known
+    curve.get_data()
+    assert transport.timeouts[-1] == (3, vit.session.TIMEOUT)
+    # Metadata requests are small
+    for _ in range(timeouts.MIN_SAMPLES):
+        adaptive.record('curves', 0.2)
+    s.data_request('GET', None, '/api/curves/get?name=testcurve')
+    assert transport.timeouts[-1][1] == pytest.approx(0.8)
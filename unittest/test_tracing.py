@@ -0,0 +1,72 @@
+import contextlib
+
+import pytest
+
+from volue_insight_timeseries import tracing
+
+metadata = {'id': 5, 'name': 'testcurve5', 'frequency': 'H', 'time_zone': 'CET', 'curve_type': 'TIME_SERIES'}
+series = dict(metadata, points=[[0, 1.0], [3600000, 2.0]])
+
+
+class FakeSpan:
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = dict(attributes or {})
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+
+class FakeTracer:
+    def __init__(self):
+        self.spans = []
+
+    @contextlib.contextmanager
+    def start_as_current_span(self, name, attributes=None):
+        span = FakeSpan(name, attributes)
+        self.spans.append(span)
+        yield span
+
+    def find(self, name):
+        return [s for s in self.spans if s.name == 'volue_insight_timeseries.' + name]
+
+
+@pytest.fixture
+def tracer():
+    tracer = FakeTracer()
+    tracing.set_tracer(tracer)
+    yield tracer
+    tracing.set_tracer(None)
+
+
+def fake_api(method, url, data, headers):
+    if '/api/curves/get' in url:
+        return 200, metadata
+    if '/api/series/5' in url:
+        return 200, series
+    return 404, 'Not found'
+
+
+def test_spans(tracer, fake_session):
+    s = fake_session(fake_api)
+    assert len(tracer.find('authenticate')) == 1
+    c = s.get_curve(name='testcurve5')
+    ts = c.get_data(data_from='1970-01-01', data_to='1970-01-02')
+    [span] = tracer.find('get_data')
+    assert span.attributes['vit.curve.name'] == 'testcurve5'
+    assert span.attributes['vit.curve.type'] == 'TIME_SERIES'
+    assert span.attributes['vit.points'] == 2
+    assert span.attributes['vit.bytes'] == len(c._last_response.content)
+    requests = tracer.find('data_request')
+    assert [r.attributes['http.status_code'] for r in requests] == [200, 200]
+    assert len(tracer.find('attempt')) == 3
+    ts.to_pandas()
+    [span] = tracer.find('to_pandas')
+    assert span.attributes['vit.points'] == 2
+
+
+def test_no_tracer():
+    tracing.set_tracer(None)
+    with tracing.span('test') as span:
+        span.set_attribute('key', 'value')
+    assert not tracing.enabled()
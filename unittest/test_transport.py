@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+import volue_insight_timeseries as vit
+from volue_insight_timeseries.transport import (RecordingTransport, ReplayTransport, RequestsTransport,
+                                                TransportException, load_transport)
+
+prefix = 'rtsp://test.host/api'
+metadata = {'id': 5, 'name': 'testcurve5', 'frequency': 'H', 'time_zone': 'CET', 'curve_type': 'TIME_SERIES'}
+series = dict(metadata, points=[[0, 1.0], [3600000, 2.0]])
+
+
+def fake_api(method, url, data, headers):
+    if '/api/curves/get' in url:
+        return 200, metadata
+    if '/api/series/5' in url:
+        assert headers['Authorization'] == 'Bearer secrettoken'
+        return 200, series
+    return 404, 'Not found'
+
+
+def test_fake_transport(fake_session):
+    s = fake_session(fake_api)
+    c = s.get_curve(name='testcurve5')
+    ts = c.get_data(data_from='1970-01-01', data_to='1970-01-02')
+    assert ts.points == series['points']
+    assert c.access() is None
+
+
+def test_record_and_replay(tmp_path, fake_session, mock_adapter):
+    cassette = str(tmp_path / 'cassette.json')
+    requests_session = vit.session.requests.Session()
+    requests_session.mount('rtsp', mock_adapter)
+    mock_adapter.register_uri('GET', prefix + '/curves/get?name=testcurve5', text=json.dumps(metadata))
+    mock_adapter.register_uri('GET', prefix + '/series/5', [{'text': json.dumps(series)},
+                                                    {'text': json.dumps(dict(series, points=[]))}])
+    recorder = RecordingTransport(cassette, RequestsTransport(requests_session))
+    s = fake_session(transport=recorder)
+    c = s.get_curve(name='testcurve5')
+    assert len(c.get_data().points) == 2
+    assert len(c.get_data().points) == 0
+    recorder.close()
+
+    # Replay against another host, with no network access
+    s = vit.Session(urlbase='http://elsewhere', auth_urlbase='http://auth.elsewhere', client_id='clientid',
+                    client_secret='verysecret', transport=ReplayTransport(cassette))
+    c = s.get_curve(name='testcurve5')
+    assert len(c.get_data().points) == 2
+    assert len(c.get_data().points) == 0
+    assert len(c.get_data().points) == 0
+    with pytest.raises(TransportException):
+        c.get_data(data_from='2020-01-01')
+
+
+def test_transport_from_config(tmp_path):
+    config_file = tmp_path / 'config.ini'
+    config_file.write_text('[common]\nauth_type = None\ntransport = volue_insight_timeseries.transport:Transport\n')
+    s = vit.Session(config_file=str(config_file))
+    assert type(s.transport) is vit.transport.Transport
+    assert isinstance(load_transport('requests'), RequestsTransport)
+    with pytest.raises(TransportException):
+        load_transport('no.such.transport')
@@ -1,6 +1,13 @@
+import datetime
+import os
+import subprocess
+import sys
+from zoneinfo import ZoneInfo
+
 import pytest
 import pandas as pd
-from volue_insight_timeseries.util import TS, TIME_SERIES
+from volue_insight_timeseries.util import (CurveException, TS, TIME_SERIES, expected_points, parsetime, split_url,
+                                           tags_to_DF)
 
 @pytest.fixture
 def ts1():
@@ -60,6 +67,7 @@ def test_to_pandas_freq_table_compatibility(ts5):
         'H12': ['12h', '12H'],
         'H6': ['6h', '6H'],
         'H3': ['3h', '3H'],
+        'H': ['h', 'H'],
         'MIN30': ['30min', '30T'],
         'MIN15': ['15min', '15T'],
         'MIN5': ['5min', '5T'],
@@ -153,8 +161,183 @@ def test_median_ts(ts1, ts2, ts3):
     for dp1, dp2 in zip(points, summed.points):
         assert dp1 == dp2
 
+
+def test_quantile_and_std_ts(ts1, ts2, ts3):
+    df = pd.concat([ts.to_pandas() for ts in (ts1, ts2, ts3)], axis=1)
+    quantile = TS.quantile([ts1, ts2, ts3], 0.25, 'Quantile')
+    assert quantile.frequency == 'M'
+    assert [v for t, v in quantile.points] == df.quantile(0.25, axis=1).tolist()
+    std = TS.std([ts1, ts2, ts3], 'Std')
+    assert [v for t, v in std.points] == pytest.approx(df.std(axis=1).tolist())
+    with pytest.raises(ValueError):
+        TS.quantile([ts1], 1.5, 'Quantile')
+
+
+def test_aggregate_with_gaps():
+    hour = 3600000
+    a = TS(id=1, frequency='H', time_zone='CET', curve_type=TIME_SERIES,
+           points=[[0, 1.0], [2 * hour, None], [4 * hour, 3.0]])
+    b = TS(id=2, frequency='H', time_zone='CET', curve_type=TIME_SERIES,
+           points=[[6 * hour, 5.0], [7 * hour, 7.0]])
+    df = pd.concat([a.to_pandas(), b.to_pandas()], axis=1).asfreq('h')
+    times = [t * hour for t in range(8)]
+
+    summed = TS.sum([a, b], 'Summed')
+    assert [t for t, v in summed.points] == times
+    assert [v for t, v in summed.points] == df.sum(axis=1).tolist()
+    assert summed.time_zone == 'CET'
+    mean = TS.mean([a, b], '42')
+    assert mean.id == 42
+    expected = df.mean(axis=1).replace({float('nan'): None}).tolist()
+    assert [v for t, v in mean.points] == expected
+    std = TS.std([a, b], 'Std')
+    assert all(v is None for t, v in std.points)
+
+
+def test_aggregate_mixed_frequencies(ts1):
+    daily = TS(id=9, frequency='D', time_zone='CET', curve_type=TIME_SERIES,
+               points=[[0, 1.0], [86400000, 2.0]])
+    summed = TS.sum([ts1, daily], 'Summed')
+    assert summed.points[:3] == [[0, 81.0], [86400000, 2.0], [2678400000, 90.0]]
+    # The result has the finest frequency
+    assert summed.frequency == 'D'
+    hourly = TS(id=10, frequency='H', time_zone='CET', curve_type=TIME_SERIES, points=[[0, 1.0], [3600000, 2.0]])
+    quarterly = TS(id=11, frequency='MIN15', time_zone='CET', curve_type=TIME_SERIES,
+                   points=[[0, 1.0], [900000, 2.0]])
+    summed = TS.sum([hourly, quarterly], 'Summed')
+    assert summed.frequency == 'MIN15'
+    assert summed.points == [[0, 2.0], [900000, 2.0], [3600000, 2.0]]
+
+
+def test_tags_to_df(ts1, ts2):
+    ts1.tag = 'a'
+    ts2.tag = 'b'
+    ts2.points = ts2.points[1:]
+    df = tags_to_DF([ts1, ts2])
+    expected = pd.DataFrame({'a': ts1.to_pandas(), 'b': ts2.to_pandas()})
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False, check_index_type=False)
+    assert df.index.freqstr == 'MS'
+
+
+def test_compact(ts1):
+    compact = ts1.compact()
+    assert compact.is_compact and not ts1.is_compact
+    assert compact.compact() is compact
+    assert compact.size == 4
+    assert compact.values.tolist() == [80, 90, 70, 120]
+    assert not compact.times.flags.writeable
+    assert compact.points == ts1.points
+    pd.testing.assert_series_equal(compact.to_pandas(), ts1.to_pandas(), check_dtype=False,
+                                   check_index_type=False)
+    assert str(compact) == str(ts1)
+    # Once made, the points replace the compact form, and changes are kept
+    compact.points[0][1] = 0.0
+    assert not compact.is_compact
+    assert compact.values.tolist() == [0, 90, 70, 120]
+    assert ts1.points[0][1] == 80
+    # Setting the points goes back to a normal series
+    compact.points = [[0, 1.0]]
+    assert not compact.is_compact and compact.size == 1
+
+
+def test_compact_dst():
+    # Days over the change to summer time in CET are 23 hours long
+    start = 1711580400000  # 2024-03-28T00:00:00+01:00
+    points = [[start, 1.0], [start + 86400000, 2.0], [start + 2 * 86400000, None],
+              [start + 3 * 86400000, 4.0], [start + 4 * 86400000 - 3600000, 5.0]]
+    ts = TS(id=1, frequency='D', time_zone='CET', curve_type=TIME_SERIES, points=points)
+    compact = ts.compact()
+    assert compact.points == points
+    assert compact.slice('2024-03-31', '2024-04-02').points == points[3:]
+    ts.points = points[:4] + [[start + 4 * 86400000, 5.0]]
+    with pytest.raises(CurveException):
+        ts.compact()
+
+
+@pytest.mark.parametrize('frequency', ['H3', 'H6', 'H12'])
+def test_compact_dst_hours(frequency):
+    # Multi-hour steps are fixed durations over the change to summer time,
+    # as in pandas
+    start = pd.Timestamp('2024-03-30T12:00', tz='CET')
+    index = pd.date_range(start, periods=8, freq=TS._map_freq(frequency))
+    points = [[int(t.timestamp() * 1000), float(n)] for n, t in enumerate(index)]
+    ts = TS(id=1, frequency=frequency, time_zone='CET', curve_type=TIME_SERIES, points=points)
+    compact = ts.compact()
+    assert compact.times.tolist() == [t for t, v in points]
+    assert compact.to_pandas().index.equals(ts.to_pandas().index)
+    assert compact.slice(points[3][0]).points == points[3:]
+
+
+def test_slice():
+    hour = 3600000
+    ts = TS(id=1, frequency='H', time_zone='UTC', curve_type=TIME_SERIES,
+            points=[[i * hour, float(i)] for i in range(48)])
+    part = ts.slice(datetime.datetime(1970, 1, 1, 10), 20 * hour + 1)
+    assert part.is_compact
+    assert part.values.base is not None  # A view, not a copy
+    assert not part.times.flags.writeable
+    assert part.points[0] == [10 * hour, 10.0]
+    assert part.points[-1] == [20 * hour, 20.0]
+    assert ts.slice(data_to=-1).size == 0
+    assert ts.slice(data_from=100 * hour).size == 0
+    assert TS.sum([part, ts], 'Summed').points[10] == [10 * hour, 20.0]
+
+
+def test_to_pandas_shared_index(ts1, ts2):
+    s1 = ts1.to_pandas()
+    s2 = ts2.to_pandas()
+    assert s1.index.is_(s2.index)
+    assert s1.index.freqstr == 'MS'
+    s1.index.name = 'time'
+    assert s2.index.name is None
+    # Points off the grid are filled like before
+    ts2.points = [ts2.points[0], ts2.points[2]]
+    s2 = ts2.to_pandas()
+    assert not s1.index.is_(s2.index)
+    assert s2.index.equals(s1.index[:3])
+    assert pd.isna(s2.iloc[1])
+
+
+def test_split_url():
+    assert split_url('/api/curves?name=a&name=b', 100) is None
+    urls = split_url('/api/curves?name=aaa&area=X&name=bbb&name=ccc&name=ddd', 40)
+    assert urls == ['/api/curves?name=aaa&name=bbb&area=X', '/api/curves?name=ccc&name=ddd&area=X']
+    assert split_url('/api/curves?name=aaaaaaaaaa&area=X', 20) is None
+
+
 def test_fullname(ts1):
     assert ts1.fullname == "This is a Name"
 
     ts1.name = None
     assert ts1.fullname == "1 TIME_SERIES CET M"
+
+
+def test_parsetime():
+    d = parsetime('2016-10-01T00:01:02.345+01:00')
+    assert d.utcoffset() == datetime.timedelta(hours=1)
+    assert d.microsecond == 345000
+    # Not handled by the fast path on all python versions
+    assert parsetime('2016-10-01T00:00:00Z') == datetime.datetime(2016, 10, 1, tzinfo=datetime.timezone.utc)
+    assert parsetime('Oct 1 2016 12:00') == datetime.datetime(2016, 10, 1, 12, tzinfo=ZoneInfo('CET'))
+    assert parsetime('2016-10-01', tz='UTC') == datetime.datetime(2016, 10, 1, tzinfo=datetime.timezone.utc)
+
+
+def test_import_is_lazy():
+    # The heavy dependencies should only be imported when used
+    code = ('import sys, volue_insight_timeseries; '
+            'print(",".join(m for m in ("pandas", "numpy", "dateutil", "sseclient", "http.server", '
+            '"concurrent.futures", "volue_insight_timeseries.hub", "volue_insight_timeseries.metrics") '
+            'if m in sys.modules))')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True, cwd=root)
+    assert out.stdout.strip() == ''
+
+
+def test_expected_points():
+    assert expected_points('2024-01-01', '2024-01-02', 'H') == 24
+    assert expected_points('2024-01-01', '2024-01-02', 'min15') == 96
+    assert expected_points('2024-01-01', '2025-01-01', 'D') == 366
+    assert expected_points('2024-01-01', '2025-01-01', 'M') == 12
+    assert expected_points('2024-01-02', '2024-01-01', 'H') == 0
+    assert expected_points('2024-01-01', '2025-01-01', 'X') is None
+    assert expected_points('not a date', '2025-01-01', 'H') is None
@@ -9,3 +9,16 @@ from . import auth, curves, events, session, util
 here = os.path.abspath(os.path.dirname(__file__))
 with open(os.path.join(here, 'VERSION')) as fv:
     VERSION = __version__ = fv.read().strip()
+
+
+# Modules for optional features (the event hub, metrics, etc.) are only
+# imported when first used
+_LAZY_MODULES = {'bulk', 'circuit', 'hedging', 'hub', 'instrument', 'limits', 'metrics', 'timeouts', 'tracing',
+                 'transport'}
+
+
+def __getattr__(name):
+    if name in _LAZY_MODULES:
+        import importlib
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,194 @@
+#
+# Fetching many curves at once.
+#
+# Requests run in a bounded thread pool sharing the session (and its
+# connection pool), and failures are reported per curve instead of aborting
+# the whole batch.
+#
+
+import collections
+import contextvars
+import threading
+
+from . import limits
+
+MAX_WORKERS = 8     # Default number of concurrent requests
+SEARCH_BATCH = 100  # Number of curve names looked up per metadata search
+
+
+def _call(func, item):
+    try:
+        return func(item), None
+    except Exception as e:
+        return None, e
+
+
+def run_concurrently(func, items, max_workers=MAX_WORKERS):
+    """Call ``func(item)`` for each item, using up to ``max_workers`` threads
+
+    Returns a list of ``(result, exception)`` tuples in the same order as
+    ``items``, where exception is None if the call succeeded.  The calls
+    run in the context (e.g. the request priority) of the caller.
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [_call(func, item) for item in items]
+    import concurrent.futures
+
+    context = contextvars.copy_context()
+    context.run(limits.pin_caller)
+    with concurrent.futures.ThreadPoolExecutor(min(max_workers, len(items))) as pool:
+        return list(pool.map(lambda item: context.copy().run(_call, func, item), items))
+
+
+def aligned_frame(series):
+    """Combine a dict of name to :class:`volue_insight_timeseries.util.TS`
+    (or None for no data) into one pandas.DataFrame on a common UTC index"""
+    import pandas as pd
+
+    columns = []
+    for name, ts in series.items():
+        if ts is None or not ts.size:
+            s = pd.Series(name=name, dtype='float64', index=pd.DatetimeIndex([], tz='UTC'))
+        else:
+            s = ts.to_pandas(name=name).tz_convert('UTC')
+        columns.append(s)
+    if not columns:
+        return pd.DataFrame(index=pd.DatetimeIndex([], tz='UTC'))
+    return pd.concat(columns, axis=1)
+
+
+class BulkResult:
+    """
+    The result of fetching many curves, see
+    :meth:`volue_insight_timeseries.session.Session.get_many`.
+
+    Attributes
+    ----------
+    series: dict
+        :class:`volue_insight_timeseries.util.TS` objects by curve name, in
+        the order requested, or None for curves without data in the range.
+    errors: dict
+        Exceptions by curve name, for the curves that could not be fetched.
+    """
+    def __init__(self, series, errors):
+        self.series = series
+        self.errors = errors
+        self._frame = None
+
+    @property
+    def frame(self):
+        """pandas.DataFrame with one column per curve fetched, on a UTC index"""
+        if self._frame is None:
+            self._frame = aligned_frame(self.series)
+        return self._frame
+
+    @property
+    def ok(self):
+        """True if all curves were fetched"""
+        return not self.errors
+
+    def __repr__(self):
+        return 'BulkResult({} curves, {} errors)'.format(len(self.series), len(self.errors))
+
+
+class LatestResult(BulkResult):
+    """
+    The result of fetching the latest instance of many curves, see
+    :meth:`volue_insight_timeseries.session.Session.get_latest_many`.  In
+    ``frame`` the columns are keyed by curve name and issue date.
+    """
+    @property
+    def frame(self):
+        """pandas.DataFrame with (curve, issue_date) columns, on a UTC index"""
+        if self._frame is None:
+            import pandas as pd
+
+            frame = aligned_frame(self.series)
+            issue_dates = [None if ts is None else ts.issue_date for ts in self.series.values()]
+            frame.columns = pd.MultiIndex.from_arrays([list(self.series), issue_dates],
+                                                      names=['curve', 'issue_date'])
+            self._frame = frame
+        return self._frame
+
+
+class LatestCache:
+    """
+    Latest instances by curve and arguments, so that an instance that has
+    not changed does not need to be downloaded again.  Holds up to
+    ``maxsize`` instances, dropping the least recently used.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            ts = self._items.get(key)
+            if ts is not None:
+                self._items.move_to_end(key)
+            return ts
+
+    def put(self, key, ts):
+        with self._lock:
+            self._items[key] = ts
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs concurrent calls with the same key only once: calls made while one
+    is in progress wait for it and share its result (or exception), see
+    :meth:`volue_insight_timeseries.session.Session.enable_single_flight`.
+    Nothing is kept once the call has finished, so this is not a cache.
+    """
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.calls = 0   # Number of calls actually made
+        self.shared = 0  # Number of calls that shared the result of another
+
+    def do(self, key, func):
+        """Call ``func()``, unless a call with this key is in progress.
+        Returns ``(result, shared)``, where shared is True if the result came
+        from another call."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        try:
+            flight.result = func()
+            return flight.result, False
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
@@ -0,0 +1,105 @@
+#
+# Circuit breaker: stop sending requests to an endpoint that keeps failing,
+# and fail fast instead of waiting for timeouts and retries.
+#
+# After a while, one request is let through to probe the endpoint, and the
+# circuit closes again if it succeeds.
+#
+
+import threading
+import time
+
+# Circuit states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+FAILURES = 5          # Consecutive failures opening the circuit
+RESET_TIMEOUT = 30.0  # Seconds before an open circuit is probed
+
+
+class CircuitOpenException(Exception):
+    pass
+
+
+class _Circuit:
+    __slots__ = ('state', 'failures', 'opened', 'probing')
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+
+
+class CircuitBreaker:
+    """
+    Circuits by endpoint class, see
+    :meth:`volue_insight_timeseries.session.Session.enable_circuit_breaker`.
+
+    Parameters
+    ----------
+    failures: int
+        Number of consecutive failed requests opening the circuit.
+    slow_call: float, optional
+        Requests taking longer than this (in seconds) count as failed.
+    reset_timeout: float
+        Seconds before a request is let through an open circuit to probe
+        the endpoint.
+    """
+    def __init__(self, failures=FAILURES, slow_call=None, reset_timeout=RESET_TIMEOUT):
+        self.failures = failures
+        self.slow_call = slow_call
+        self.reset_timeout = reset_timeout
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def check(self, endpoint):
+        """Raise a CircuitOpenException if requests to the endpoint class
+        should fail fast, otherwise return the state of its circuit.  A
+        request allowed through a half-open circuit must be recorded."""
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is None or circuit.state == CLOSED:
+                return CLOSED
+            if circuit.state == OPEN:
+                if time.monotonic() - circuit.opened < self.reset_timeout:
+                    raise CircuitOpenException('Circuit open for {} requests, failing fast'.format(endpoint))
+                circuit.state = HALF_OPEN
+                circuit.probing = False
+            if circuit.probing:
+                raise CircuitOpenException('Circuit half open for {} requests, waiting for probe'.format(endpoint))
+            circuit.probing = True
+            return HALF_OPEN
+
+    def record(self, endpoint, ok, elapsed=None):
+        """Record the outcome of a request, and return the new state of
+        the circuit"""
+        if ok and self.slow_call is not None and elapsed is not None and elapsed > self.slow_call:
+            ok = False
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is None:
+                if ok:
+                    return CLOSED
+                circuit = self._circuits[endpoint] = _Circuit()
+            circuit.probing = False
+            if ok:
+                circuit.state = CLOSED
+                circuit.failures = 0
+            else:
+                circuit.failures += 1
+                if circuit.state == HALF_OPEN or circuit.failures >= self.failures:
+                    circuit.state = OPEN
+                    circuit.opened = time.monotonic()
+            return circuit.state
+
+    def state(self, endpoint):
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            return CLOSED if circuit is None else circuit.state
+
+    def states(self):
+        """The state of the circuits by endpoint class"""
+        with self._lock:
+            return {endpoint: circuit.state for endpoint, circuit in self._circuits.items()}
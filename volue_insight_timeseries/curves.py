@@ -1,7 +1,65 @@
-from past.types import basestring
+import datetime
+import threading
+import time
 import warnings
-
-from . import util
+from urllib.parse import parse_qs, urljoin, urlsplit
+
+from . import bulk, tracing, util
+
+LAZY_BATCH_SIZE = 20  # Number of lazy instances fetched per request
+
+
+def _as_datetime(value, tz):
+    # Time-stamp as an aware datetime, naive values are taken to be in tz
+    if isinstance(value, datetime.datetime):
+        return value if value.tzinfo is not None else value.replace(tzinfo=tz)
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time(), tzinfo=tz)
+    return util.parsetime(str(value), tz=tz)
+
+
+def _copy_points(result):
+    # Copy of decoded curve data with its own lists of points, so that a
+    # result shared by single-flight callers is not changed by the others
+    if isinstance(result, list):
+        return [_copy_points(r) for r in result]
+    if isinstance(result, dict) and isinstance(result.get('points'), list):
+        return dict(result, points=[list(p) for p in result['points']])
+    return result
+
+
+class _LazyInstanceLoader:
+    """
+    Fetches the data of the lazy instances from a search_instances call.
+    When an instance is used, it is fetched together with the following
+    (or else preceding) instances not yet fetched, with one search for
+    their issue dates, since these are likely to be used next.
+    """
+    def __init__(self, curve, data_args):
+        self._curve = curve
+        self._data_args = data_args
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def wrap(self, instances):
+        self._pending = [util.LazyTS(ts, self) for ts in instances]
+        return list(self._pending)
+
+    def load(self, ts):
+        with self._lock:
+            if ts.loaded:
+                return  # Fetched by another thread while we waited
+            i = self._pending.index(ts)
+            batch = self._pending[i:i + LAZY_BATCH_SIZE]
+            batch = self._pending[max(0, i - LAZY_BATCH_SIZE + len(batch)):i] + batch
+            args = dict(self._data_args, with_data=True)
+            args['issue_dates'] = sorted({lazy.issue_date for lazy in batch})
+            if ts.tag is not None:
+                args['tags'] = sorted({lazy.tag for lazy in batch})
+            found = {(res.issue_date, res.tag): res for res in self._curve.search_instances(**args) or []}
+            for lazy in batch:
+                lazy._set_data(found.get((lazy.issue_date, lazy.tag)))
+            self._pending = [lazy for lazy in self._pending if not lazy.loaded]
 
 
 class BaseCurve:
@@ -47,16 +105,81 @@ class BaseCurve:
         if output_time_zone is not None:
             args.append(util.make_arg('output_time_zone', output_time_zone))
 
-    def _load_data(self, url, failmsg, urlbase=None):
+    def _expected_points(self, url):
+        # Number of points the request is expected to return, from its data
+        # range and frequency, or None if not known
+        query = parse_qs(urlsplit(url).query)
+        if query.get('with_data') == ['false']:
+            return 0
+        first = query.get('from', query.get('data_from'))
+        last = query.get('to', query.get('data_to'))
+        frequency = query.get('frequency', [getattr(self, 'frequency', None)])[0]
+        if not first or not last or not frequency:
+            return None
+        points = util.expected_points(first[0], last[0], frequency, self.tz)
+        if points is None:
+            return None
+        # One series per tag or issue date
+        return points * max(1, len(query.get('tag', ()))) * max(1, len(query.get('issue_date', ())))
+
+    def _load_data(self, url, failmsg, urlbase=None, build=None):
         if urlbase is None:
             urlbase = self._session.urlbase
+        points = self._expected_points(url) if self._session.adaptive_timeouts is not None else None
+        with self._session._measure() as stats, self._session._expect_points(points):
+            self._last_stats = stats
+            flight = self._session.single_flight
+            if flight is None:
+                response, result = self._get_json(urlbase, url, stats)
+            else:
+                key = ('GET', urljoin(urlbase, url))
+                (response, result), shared = flight.do(key, lambda: self._get_json(urlbase, url, stats))
+                self._session._record_cache('single_flight', shared)
+                if shared:
+                    result = _copy_points(result)
+            self._last_response = response
+            if response.status_code == 200:
+                if build is not None:
+                    start = time.perf_counter()
+                    result = build(result)
+                    if stats is not None:
+                        stats.build = time.perf_counter() - start
+                return result
+            elif response.status_code == 204 or response.status_code == 404:
+                return None
+            raise util.CurveException('{}: {} ({})'.format(failmsg, response.content, response.status_code))
+
+    def _get_json(self, urlbase, url, stats):
         response = self._session.data_request('GET', urlbase, url)
-        self._last_response = response
+        result = None
         if response.status_code == 200:
-            return response.json()
-        elif response.status_code == 204 or response.status_code == 404:
-            return None
-        raise util.CurveException('{}: {} ({})'.format(failmsg, response.content, response.status_code))
+            start = time.perf_counter()
+            result = response.json()
+            if stats is not None:
+                stats.decode = time.perf_counter() - start
+        return response, result
+
+    def _load_ts(self, url, failmsg, curve_type, **kwargs):
+        return self._load_data(url, failmsg, build=lambda r: util.TS(input_dict=r, curve_type=curve_type, **kwargs))
+
+    def _load_ts_list(self, url, failmsg, curve_type, **kwargs):
+        def build(result):
+            return [util.TS(input_dict=r, curve_type=curve_type, **kwargs) for r in result]
+        return self._load_data(url, failmsg, build=build)
+
+    def _split_range(self, data_from, data_to, chunk):
+        if chunk is None:
+            return [(data_from, data_to)]
+        if data_from is None or data_to is None:
+            raise util.CurveException('data_from and data_to must be given to split the range')
+        first = _as_datetime(data_from, self.tz)
+        last = _as_datetime(data_to, self.tz)
+        ranges = []
+        while first < last:
+            end = min(first + chunk, last)
+            ranges.append((first, end))
+            first = end
+        return ranges
 
     def access(self):
         url = '/api/curves/{}/access'.format(self.id)
@@ -64,6 +187,7 @@ class BaseCurve:
 
 
 class TimeSeriesCurve(BaseCurve):
+    @tracing.traced_curve_call
     def get_data(self, data_from=None, data_to=None, time_zone=None, filter=None,
                  function=None, frequency=None, output_time_zone=None):
         """ Getting data from Time Series curves
@@ -143,10 +267,7 @@ class TimeSeriesCurve(BaseCurve):
         if len(args) > 0:
             astr = '?{}'.format('&'.join(args))
         url = '/api/series/{}{}'.format(self.id, astr)
-        result = self._load_data(url, 'Failed to load curve data')
-        if result is None:
-            return result
-        return util.TS(input_dict=result, curve_type=util.TIME_SERIES)
+        return self._load_ts(url, 'Failed to load curve data', util.TIME_SERIES)
 
 
 class TaggedCurve(BaseCurve):
@@ -161,6 +282,7 @@ class TaggedCurve(BaseCurve):
         url = '/api/series/tagged/{}/tags'.format(self.id)
         return self._load_data(url, 'Failed to fetch tags')
 
+    @tracing.traced_curve_call
     def get_data(self, tag=None, data_from=None, data_to=None, time_zone=None, filter=None,
                  function=None, frequency=None, output_time_zone=None):
         """ Getting data from TAGGED curves
@@ -247,28 +369,94 @@ class TaggedCurve(BaseCurve):
             args = []
             unwrap = True
         else:
-            if isinstance(tag, basestring):
+            if isinstance(tag, str):
                 unwrap = True
             args=[util.make_arg('tag', tag)]
         self._add_from_to(args, data_from, data_to)
         self._add_functions(args, time_zone, filter, function, frequency, output_time_zone)
         astr = '&'.join(args)
         url = '/api/series/tagged/{}?{}'.format(self.id, astr)
-        result = self._load_data(url, 'Failed to load tagged curve data')
-        if result is None:
-            return result
-        res = [util.TS(input_dict=r, curve_type=util.TAGGED) for r in result]
+        res = self._load_ts_list(url, 'Failed to load tagged curve data', util.TAGGED)
+        if res is None:
+            return res
         if unwrap and len(res) == 1:
             res = res[0]
         return res
 
+    def get_data_frame(self, tags=None, data_from=None, data_to=None, time_zone=None, filter=None,
+                       function=None, frequency=None, output_time_zone=None, tags_per_request=10,
+                       time_chunk=None, max_workers=bulk.MAX_WORKERS):
+        """ Getting data for many tags of a TAGGED curve as a DataFrame
+
+        Works like :meth:`get_data`, but splits the tags (and optionally
+        the time range) over several requests which run concurrently, and
+        returns one pandas.DataFrame with a column per tag.  This is much
+        faster than :meth:`get_data` followed by
+        :func:`volue_insight_timeseries.util.tags_to_DF` for many tags or
+        long ranges.
+
+        Parameters
+        ----------
+
+        tags: list, optional
+            tags to get the data for. If omitted, all tags of the curve are
+            fetched.
+
+        data_from, data_to, time_zone, filter, function, frequency, output_time_zone:
+            as for :meth:`get_data`.
+
+        tags_per_request: int, optional
+            number of tags fetched in each request.
+
+        time_chunk: datetime.timedelta, optional
+            if given, the range from ``data_from`` to ``data_to`` (which must
+            both be given) is also split into parts of this length. When
+            aggregating, this should be a multiple of ``frequency``.
+
+        max_workers: int, optional
+            maximum number of concurrent requests.
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        if tags is None:
+            tags = self.get_tags() or []
+        elif isinstance(tags, str):
+            tags = [tags]
+        tag_batches = [tags[i:i + tags_per_request] for i in range(0, len(tags), tags_per_request)]
+        parts = [(batch, period) for batch in tag_batches
+                 for period in self._split_range(data_from, data_to, time_chunk)]
+
+        def fetch(part):
+            batch, (first, last) = part
+            args = [util.make_arg('tag', batch)]
+            self._add_from_to(args, first, last)
+            self._add_functions(args, time_zone, filter, function, frequency, output_time_zone)
+            url = '/api/series/tagged/{}?{}'.format(self.id, '&'.join(args))
+            return self._load_data(url, 'Failed to load tagged curve data')
+
+        points = {tag: [] for tag in tags}
+        meta = {}
+        for result, error in bulk.run_concurrently(fetch, parts, max_workers):
+            if error is not None:
+                raise error
+            for series in result or []:
+                meta = series
+                points.setdefault(series['tag'], []).extend(series.get('points') or [])
+        times, values = util.align_points(list(points.values()))
+        tz = util.parse_tz(meta.get('time_zone') or output_time_zone or time_zone or self.time_zone)
+        return util.points_to_frame(times, values, list(points), tz, meta.get('frequency'))
+
 
 class InstanceCurve(BaseCurve):
+    @tracing.traced_curve_call
     def search_instances(self, issue_date_from=None, issue_date_to=None,
                          issue_dates=None, issue_weekdays=None, issue_days=None, issue_months=None,
                          issue_times=None, with_data=False, data_from=None, data_to=None,
                          time_zone=None, filter=None, function=None, frequency=None,
-                         output_time_zone=None, only_accessible=None, modified_since=None):
+                         output_time_zone=None, only_accessible=None, modified_since=None,
+                         lazy=False):
         """ Getting data from INSTANCE curves for multiple issue_dates
 
         An INSTANCE curve typically represents forecast,
@@ -327,6 +515,15 @@ class InstanceCurve(BaseCurve):
             only contains the attributes and meta data information but no
             data values.
 
+        lazy: bool, optional
+            If lazy is True, the returned objects are
+            :class:`volue_insight_timeseries.util.LazyTS` objects with only
+            the meta data, and the data of each instance (with the data
+            arguments given here) is fetched the first time it is used.
+            Instances are fetched in batches, with the instances following
+            the one used, so that going through the list fetches
+            the data in few requests.  with_data is ignored.
+
         data_from: time-stamp, optional
             start date (and time) of data to be fetched. If not given, the start
             date of the returned timeseries will be the first date with data
@@ -383,6 +580,8 @@ class InstanceCurve(BaseCurve):
         """
         if only_accessible is not None:
             warnings.warn("only_accessible parameter will be removed soon.", FutureWarning, stacklevel=2)
+        if lazy:
+            with_data = False
         args=[util.make_arg('with_data', '{}'.format(with_data).lower())]
         self._add_from_to(args, issue_date_from, issue_date_to, prefix='issue_date_')
         if with_data:
@@ -402,11 +601,14 @@ class InstanceCurve(BaseCurve):
             args.append(util.make_arg('modified_since', modified_since))
         astr = '&'.join(args)
         url = '/api/instances/{}?{}'.format(self.id, astr)
-        result = self._load_data(url, 'Failed to find instances')
-        if result is None:
-            return result
-        return [util.TS(input_dict=r, curve_type=util.INSTANCES) for r in result]
-
+        instances = self._load_ts_list(url, 'Failed to find instances', util.INSTANCES)
+        if lazy and instances is not None:
+            data_args = dict(data_from=data_from, data_to=data_to, time_zone=time_zone, filter=filter,
+                             function=function, frequency=frequency, output_time_zone=output_time_zone)
+            return _LazyInstanceLoader(self, data_args).wrap(instances)
+        return instances
+
+    @tracing.traced_curve_call
     def get_instance(self, issue_date, with_data=True, data_from=None, data_to=None,
                      time_zone=None, filter=None, function=None, frequency=None,
                      output_time_zone=None, only_accessible=None):
@@ -498,11 +700,9 @@ class InstanceCurve(BaseCurve):
             self._add_functions(args, time_zone, filter, function, frequency, output_time_zone)
         astr = '&'.join(args)
         url = '/api/instances/{}/get?{}'.format(self.id, astr)
-        result = self._load_data(url, 'Failed to load instance')
-        if result is None:
-            return result
-        return util.TS(input_dict=result, issue_date=issue_date, curve_type=util.INSTANCES)
+        return self._load_ts(url, 'Failed to load instance', util.INSTANCES, issue_date=issue_date)
 
+    @tracing.traced_curve_call
     def get_latest(self, issue_date_from=None, issue_date_to=None, issue_dates=None,
                    with_data=True, data_from=None, data_to=None, time_zone=None, filter=None,
                    function=None, frequency=None, output_time_zone=None, only_accessible=None):
@@ -609,11 +809,9 @@ class InstanceCurve(BaseCurve):
             args.append(util.make_arg('issue_date', issue_dates))
         astr = '&'.join(args)
         url = '/api/instances/{}/latest?{}'.format(self.id, astr)
-        result = self._load_data(url, 'Failed to load instance')
-        if result is None:
-            return result
-        return util.TS(input_dict=result, curve_type=util.INSTANCES)
+        return self._load_ts(url, 'Failed to load instance', util.INSTANCES)
 
+    @tracing.traced_curve_call
     def get_relative(self, data_offset, data_max_length=None, issue_date_from=None, issue_date_to=None,
                      issue_dates=None, issue_weekdays=None, issue_days=None, issue_months=None, issue_times=None,
                      data_from=None, data_to=None, time_zone=None, filter=None, function=None,
@@ -743,11 +941,9 @@ class InstanceCurve(BaseCurve):
             args.append(util.make_arg('issue_time', issue_times))
         astr = '&'.join(args)
         url = '/api/instances/{}/relative?{}'.format(self.id, astr)
-        result = self._load_data(url, 'Failed to find instances')
-        if result is None:
-            return result
-        return util.TS(input_dict=result, curve_type=util.INSTANCES)
+        return self._load_ts(url, 'Failed to find instances', util.INSTANCES)
 
+    @tracing.traced_curve_call
     def get_absolute(self, data_date, issue_frequency=None, issue_date_from=None, issue_date_to=None):
         """ Get an absolute forecast from the INSTANCE curve
 
@@ -795,10 +991,7 @@ class InstanceCurve(BaseCurve):
         self._add_from_to(args, issue_date_from, issue_date_to, prefix='issue_date_')
         astr = '&'.join(args)
         url = '/api/instances/{}/absolute?{}'.format(self.id, astr)
-        result = self._load_data(url, 'Failed to find instances')
-        if result is None:
-            return result
-        return util.TS(input_dict=result, curve_type=util.INSTANCES)
+        return self._load_ts(url, 'Failed to find instances', util.INSTANCES)
 
 
 class TaggedInstanceCurve(BaseCurve):
@@ -813,11 +1006,13 @@ class TaggedInstanceCurve(BaseCurve):
         url = '/api/instances/tagged/{}/tags'.format(self.id)
         return self._load_data(url, 'Failed to fetch tags')
 
+    @tracing.traced_curve_call
     def search_instances(self, tags=None, issue_date_from=None, issue_date_to=None,
                          issue_dates=None, issue_weekdays=None, issue_days=None, issue_months=None,
                          issue_times=None, with_data=False, data_from=None, data_to=None,
                          time_zone=None, filter=None, function=None, frequency=None,
-                         output_time_zone=None, only_accessible=None, modified_since=None):
+                         output_time_zone=None, only_accessible=None, modified_since=None,
+                         lazy=False):
         """ Getting data from TAGGED_INSTANCE curves for multiple issue_dates
 
         A TAGGED INSTANCE curve typically represents forecast that contain
@@ -886,6 +1081,15 @@ class TaggedInstanceCurve(BaseCurve):
             only contains the attributes and meta data information but no
             data values.
 
+        lazy: bool, optional
+            If lazy is True, the returned objects are
+            :class:`volue_insight_timeseries.util.LazyTS` objects with only
+            the meta data, and the data of each instance (with the data
+            arguments given here) is fetched the first time it is used.
+            Instances are fetched in batches, with the instances following
+            the one used, so that going through the list fetches
+            the data in few requests.  with_data is ignored.
+
         data_from: time-stamp, optional
             start date (and time) of data to be fetched. If not given, the start
             date of the returned timeseries will be the first date with data
@@ -942,6 +1146,8 @@ class TaggedInstanceCurve(BaseCurve):
         """
         if only_accessible is not None:
             warnings.warn("only_accessible parameter will be removed soon.", FutureWarning, stacklevel=2)
+        if lazy:
+            with_data = False
         args=[util.make_arg('with_data', '{}'.format(with_data).lower())]
         if tags is not None:
             args.append(util.make_arg('tag', tags))
@@ -963,11 +1169,14 @@ class TaggedInstanceCurve(BaseCurve):
             args.append(util.make_arg('modified_since', modified_since))
         astr = '&'.join(args)
         url = '/api/instances/tagged/{}?{}'.format(self.id, astr)
-        result = self._load_data(url, 'Failed to find tagged instances')
-        if result is None:
-            return result
-        return [util.TS(input_dict=r, curve_type=util.TAGGED_INSTANCES) for r in result]
-
+        instances = self._load_ts_list(url, 'Failed to find tagged instances', util.TAGGED_INSTANCES)
+        if lazy and instances is not None:
+            data_args = dict(data_from=data_from, data_to=data_to, time_zone=time_zone, filter=filter,
+                             function=function, frequency=frequency, output_time_zone=output_time_zone)
+            return _LazyInstanceLoader(self, data_args).wrap(instances)
+        return instances
+
+    @tracing.traced_curve_call
     def get_instance(self, issue_date, tag=None, with_data=True, data_from=None, data_to=None,
                      time_zone=None, filter=None, function=None, frequency=None,
                      output_time_zone=None, only_accessible=None):
@@ -1070,7 +1279,7 @@ class TaggedInstanceCurve(BaseCurve):
         if tag is None:
             unwrap = True
         else:
-            if isinstance(tag, basestring):
+            if isinstance(tag, str):
                 unwrap = True
             args.append(util.make_arg('tag', tag))
         if with_data:
@@ -1078,14 +1287,14 @@ class TaggedInstanceCurve(BaseCurve):
             self._add_functions(args, time_zone, filter, function, frequency, output_time_zone)
         astr = '&'.join(args)
         url = '/api/instances/tagged/{}/get?{}'.format(self.id, astr)
-        result = self._load_data(url, 'Failed to load tagged instance')
-        if result is None:
-            return result
-        res = [util.TS(input_dict=r, issue_date=issue_date, curve_type=util.TAGGED_INSTANCES) for r in result]
+        res = self._load_ts_list(url, 'Failed to load tagged instance', util.TAGGED_INSTANCES, issue_date=issue_date)
+        if res is None:
+            return res
         if unwrap and len(res) == 1:
             res = res[0]
         return res
 
+    @tracing.traced_curve_call
     def get_latest(self, tags=None, issue_date_from=None, issue_date_to=None, issue_dates=None,
                    with_data=True, data_from=None, data_to=None, time_zone=None, filter=None,
                    function=None, frequency=None, output_time_zone=None, only_accessible=None):
@@ -1210,12 +1419,10 @@ class TaggedInstanceCurve(BaseCurve):
             args.append(util.make_arg('issue_date', issue_dates))
         astr = '&'.join(args)
         url = '/api/instances/tagged/{}/latest?{}'.format(self.id, astr)
-        result = self._load_data(url, 'Failed to load tagged instance')
-        if result is None:
-            return result
-        return util.TS(input_dict=result, curve_type=util.TAGGED_INSTANCES)
+        return self._load_ts(url, 'Failed to load tagged instance', util.TAGGED_INSTANCES)
 
 
+    @tracing.traced_curve_call
     def get_relative(self, data_offset, data_max_length=None, tag=None, issue_date_from=None, issue_date_to=None,
                      issue_dates=None, issue_weekdays=None, issue_days=None, issue_months=None, issue_times=None,
                      data_from=None, data_to=None, time_zone=None, filter=None, function=None,
@@ -1350,11 +1557,9 @@ class TaggedInstanceCurve(BaseCurve):
             args.append(util.make_arg('issue_time', issue_times))
         astr = '&'.join(args)
         url = '/api/instances/tagged/{}/relative?{}'.format(self.id, astr)
-        result = self._load_data(url, 'Failed to find instances')
-        if result is None:
-            return result
-        return util.TS(input_dict=result, curve_type=util.TAGGED_INSTANCES)
+        return self._load_ts(url, 'Failed to find instances', util.TAGGED_INSTANCES)
 
+    @tracing.traced_curve_call
     def get_absolute(self, data_date, issue_frequency=None, tag=None, issue_date_from=None, issue_date_to=None):
         """ Get an absolute forecast from the INSTANCE curve
 
@@ -1407,7 +1612,4 @@ class TaggedInstanceCurve(BaseCurve):
         self._add_from_to(args, issue_date_from, issue_date_to, prefix='issue_date_')
         astr = '&'.join(args)
         url = '/api/instances/tagged/{}/absolute?{}'.format(self.id, astr)
-        result = self._load_data(url, 'Failed to find instances')
-        if result is None:
-            return result
-        return util.TS(input_dict=result, curve_type=util.TAGGED_INSTANCES)
+        return self._load_ts(url, 'Failed to find instances', util.TAGGED_INSTANCES)
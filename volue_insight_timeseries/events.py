@@ -1,17 +1,224 @@
+import collections
 import contextlib
+import datetime
 import json
+import os
 import time
 
-import sseclient
 import threading
 import queue
 
 from . import curves, util
-from builtins import str
+
+SAVE_EVERY = 100     # Events handed out between writes of the cursor file
+SAVE_INTERVAL = 1.0  # Seconds between writes of the cursor file
+
+
+class EventCursor:
+    """
+    Position in the event stream, used to resume listening without gaps.
+
+    The cursor holds the ``created`` timestamp of the latest event seen, and
+    the keys of the events seen with exactly that timestamp, so that events
+    re-sent when resuming from that timestamp can be skipped.  If ``path`` is
+    given, the cursor is loaded from (and saved to) that file, so a restarted
+    consumer can catch up from where it stopped.  The file is written by
+    :meth:`checkpoint` at most every ``save_every`` events or
+    ``save_interval`` seconds, so a consumer that crashes may see the
+    latest events again.
+    """
+    def __init__(self, path=None, save_every=SAVE_EVERY, save_interval=SAVE_INTERVAL):
+        self.path = path
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self.created = None
+        self.keys = set()
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+        self._lock = threading.Lock()
+        if path is not None:
+            self.load()
+
+    def seen(self, created, key):
+        """Check if the event has already been passed by the cursor"""
+        with self._lock:
+            return created is not None and created == self.created and key in self.keys
+
+    def advance(self, created, key):
+        """Move the cursor to the given event, never backwards"""
+        if created is None:
+            return
+        with self._lock:
+            if self.created is None or created > self.created:
+                self.created = created
+                self.keys = {key}
+            elif created == self.created:
+                self.keys.add(key)
+
+    def copy_from(self, other):
+        self.move_to(*other.position())
+
+    def position(self):
+        """The timestamp and keys of the cursor"""
+        with self._lock:
+            return self.created, set(self.keys)
+
+    def move_to(self, created, keys=()):
+        """Set the cursor to the given position"""
+        with self._lock:
+            self.created = created
+            self.keys = set(keys)
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        with open(self.path, 'rt') as f:
+            state = json.load(f)
+        with self._lock:
+            self.created = None
+            if state.get('created') is not None:
+                self.created = util.parsetime(state['created'])
+            self.keys = set(state.get('keys', []))
+
+    def checkpoint(self):
+        """Count an event passed by the cursor, and save the cursor if
+        enough events or time have passed since it was last saved"""
+        if self.path is None:
+            return
+        self._unsaved += 1
+        if self._unsaved >= self.save_every or time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def save(self):
+        """Atomically write the cursor to its file (if any)"""
+        if self.path is None:
+            return
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+        with self._lock:
+            if self.created is None:
+                return
+            state = {'created': self.created.isoformat(), 'keys': sorted(self.keys)}
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'wt') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+
+def _event_key(event):
+    # The event id, or else the event data as received
+    return event.event_id or event._data
+
+
+class EventQueue:
+    """
+    Queue between the event listener thread and the consumer.
+
+    With ``maxsize`` > 0 the queue is bounded, and ``policy`` decides what
+    happens when it is full:
+
+    * ``'block'``: the listener waits for the consumer (the server buffers).
+    * ``'drop_oldest'``: the oldest queued event is discarded.
+    * ``'coalesce'``: a new curve event replaces a queued event for the same
+      curve, tag, issue_date and operation, with the ranges merged.  If there
+      is none to replace, the listener waits as for ``'block'``.
+    """
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop_oldest'
+    COALESCE = 'coalesce'
+    _policies = (BLOCK, DROP_OLDEST, COALESCE)
+
+    def __init__(self, maxsize=0, policy=BLOCK):
+        if policy not in self._policies:
+            raise ValueError('Unknown queue policy {}, must be one of {}'.format(policy, self._policies))
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.coalesced = 0
+        self._items = collections.deque()
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def qsize(self):
+        return len(self._items)
+
+    def put(self, item):
+        with self._cond:
+            if (self.policy == self.COALESCE and isinstance(item, CurveEvent) and
+                    0 < self.maxsize <= len(self._items)):
+                slot = self._pending.get(_coalesce_key(item))
+                if slot is not None:
+                    item.range = _merge_ranges(slot[0].range, item.range)
+                    slot[0] = item
+                    self.coalesced += 1
+                    return
+            while 0 < self.maxsize <= len(self._items) and not self._closed:
+                if self.policy == self.DROP_OLDEST:
+                    self._forget(self._items.popleft())
+                    self.dropped += 1
+                else:
+                    self._cond.wait()
+            if self._closed:
+                return
+            slot = [item]
+            if self.policy == self.COALESCE and isinstance(item, CurveEvent):
+                self._pending[_coalesce_key(item)] = slot
+            self._items.append(slot)
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._items) > 0, timeout):
+                raise queue.Empty
+            slot = self._items.popleft()
+            self._forget(slot)
+            self._cond.notify_all()
+            return slot[0]
+
+    def close(self):
+        """Release a listener blocked on a full queue"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _forget(self, slot):
+        item = slot[0]
+        if isinstance(item, CurveEvent):
+            key = _coalesce_key(item)
+            if self._pending.get(key) is slot:
+                del self._pending[key]
+
+
+def _coalesce_key(event):
+    return (event.id, event.tag, event.issue_date, event.operation)
+
+
+def _merge_ranges(old, new):
+    """Smallest range covering both, where None means unbounded (or unknown)"""
+    if old is None or new is None:
+        return None
+    begin = None if old[0] is None or new[0] is None else min(old[0], new[0])
+    end = None if old[1] is None or new[1] is None else max(old[1], new[1])
+    return (begin, end)
 
 
 class EventListener:
-    def __init__(self, session, curve_list, start_time=None, timeout=None):
+    """
+    Listen for changes on a list of curves, see
+    :meth:`volue_insight_timeseries.session.Session.events`.
+
+    Events are read by a background thread into a queue, which by default is
+    unbounded.  Use ``max_queue_size`` and ``queue_policy`` (see
+    :class:`EventQueue`) to limit the memory used if the consumer is slow,
+    and :meth:`stats` to monitor the queue.
+
+    If the url for all the curves would be longer than the
+    ``max_url_length`` of the session, the curves are split between several
+    event streams, each read by its own thread into the same queue.
+    """
+    def __init__(self, session, curve_list, start_time=None, timeout=None, cursor_file=None,
+                 max_queue_size=0, queue_policy=EventQueue.BLOCK):
         self.curve_cache = {}
         ids = []
         if not hasattr(curve_list, '__iter__') or isinstance(curve_list, str):
@@ -22,45 +229,180 @@ class EventListener:
                 self.curve_cache[curve.id] = curve
             else:
                 ids.append(curve)
-        args = [util.make_arg('id', ids)]
-        if start_time is not None:
-            args.append(util.make_arg('start_time', start_time))
-        self.url = '/api/events?{}'.format('&'.join(args))
+        self.ids = ids
         self.session = session
+        self.id_groups = self._split_ids()
+        self._streams = {id: stream for stream, group in enumerate(self.id_groups) for id in group}
+        # The cursor is advanced as events are handed to the consumer (and
+        # persisted, if a file is given), while the resume cursor follows the
+        # events received from the stream and is used when reconnecting.
+        # An explicit start_time replaces the position in the cursor file.
+        self.cursor = EventCursor(cursor_file)
+        if start_time is not None:
+            self.cursor.move_to(None)
+        # Events are only ordered within a stream, so with several streams
+        # each has its own cursors, and the cursor kept is that of the stream
+        # furthest behind, from which all the streams are resumed.
+        self._delivered = [self.cursor]
+        if len(self.id_groups) > 1:
+            self._delivered = [self._origin(start_time) for _ in self.id_groups]
+        if start_time is None:
+            start_time = self.cursor.created
+        self.start_time = start_time
+        self._resumes = []
+        for _ in self.id_groups:
+            resume = EventCursor()
+            resume.copy_from(self.cursor)
+            self._resumes.append(resume)
+        self._resume = self._resumes[0]
+        self.url = self._make_url(start_time)
         self.timeout = timeout
         self.retry = 3000 # Retry time in milliseconds
         self.client = None
-        self.queue = queue.Queue()
+        self._clients = {}
+        self.queue = EventQueue(max_queue_size, queue_policy)
+        self.received = 0
+        self.delivered = 0
+        self.reconnects = 0
+        self._lock = threading.Lock()  # For the counters updated by the stream threads
+        self.lag = None
+        self.max_lag = None
         self.do_shutdown = False
-        self.worker = threading.Thread(target=self.fetch_events)
-        self.worker.setDaemon(True)
-        self.worker.start()
+        self.workers = []
+        for stream in range(len(self.id_groups)):
+            worker = threading.Thread(target=self.fetch_events, args=(stream,))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+        self.worker = self.workers[0]
+
+    def _split_ids(self):
+        # Leave room for the start_time argument added when resuming
+        max_length = getattr(self.session, 'max_url_length', None)
+        if not max_length or not self.ids:
+            return [self.ids]
+        fixed = len(self.session.urlbase) + len(self._make_url(None, [])) + len(util.make_arg(
+            'start_time', '2000-01-01T00:00:00.000000+00:00')) + 1
+        lengths = [len(util.make_arg('id', id)) + 1 for id in self.ids]
+        return [self.ids[start:end] for start, end in util.group_by_length(lengths, max_length - fixed)]
+
+    def _origin(self, start_time):
+        # Cursor at the position the streams start from
+        origin = EventCursor()
+        if start_time is not None:
+            origin.move_to(curves._as_datetime(start_time, datetime.timezone.utc))
+        elif self.cursor.created is not None:
+            origin.copy_from(self.cursor)
+        else:
+            origin.move_to(datetime.datetime.now(datetime.timezone.utc))
+        return origin
+
+    def _advance(self, event):
+        key = _event_key(event)
+        if len(self._delivered) == 1:
+            self.cursor.advance(event.created, key)
+            return
+        self._delivered[self._streams.get(event.id, 0)].advance(event.created, key)
+        positions = [cursor.position() for cursor in self._delivered]
+        created = min(created for created, _ in positions)
+        keys = set().union(*(keys for at, keys in positions if at == created))
+        self.cursor.move_to(created, keys)
+
+    def _make_url(self, start_time, ids=None):
+        if ids is None:
+            ids = self.id_groups[0]
+        args = [util.make_arg('id', ids)]
+        if start_time is not None:
+            args.append(util.make_arg('start_time', start_time))
+        return '/api/events?{}'.format('&'.join(args))
 
     def get(self):
         try:
             val = self.queue.get(timeout=self.timeout)
             if isinstance(val, EventError):
                 raise val.exception
+            self.delivered += 1
+            if isinstance(val, CurveEvent):
+                self.lag = time.time() - val.created.timestamp()
+                if self.max_lag is None or self.lag > self.max_lag:
+                    self.max_lag = self.lag
+                self._advance(val)
+                self.cursor.checkpoint()
+            session_metrics = getattr(self.session, 'metrics', None)
+            if session_metrics is not None:
+                session_metrics.record_event(self.lag if isinstance(val, CurveEvent) else None)
             return val
         except queue.Empty:
             return EventTimeout()
 
-    def fetch_events(self):
+    def stats(self):
+        """
+        Counters and gauges for monitoring the listener.
+
+        ``lag`` is the time in seconds from an event was created until it was
+        returned by :meth:`get`, for the latest event (``max_lag`` is the
+        largest seen).  ``dropped`` and ``coalesced`` count events discarded
+        or merged because the queue was full.
+        """
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'received': self.received,
+            'delivered': self.delivered,
+            'dropped': self.queue.dropped,
+            'coalesced': self.queue.coalesced,
+            'reconnects': self.reconnects,
+            'lag': self.lag,
+            'max_lag': self.max_lag,
+        }
+
+    def _handle_sse_event(self, sse_event, resume=None):
+        if resume is None:
+            resume = self._resume
+        if sse_event.retry is not None:
+            with contextlib.suppress(ValueError, TypeError):
+                self.retry = int(sse_event.retry)
+        if sse_event.event == 'curve_event':
+            event = CurveEvent(sse_event)
+            key = _event_key(event)
+            if resume.seen(event.created, key):
+                return
+            resume.advance(event.created, key)
+        else:
+            event = DefaultEvent(sse_event)
+        if hasattr(event, 'id') and event.id in self.curve_cache:
+            event.curve = self.curve_cache[event.id]
+        with self._lock:
+            self.received += 1
+        self.queue.put(event)
+
+    def fetch_events(self, stream=0):
+        ids = self.id_groups[stream]
+        resume = self._resumes[stream]
+        url = self._make_url(self.start_time, ids)
+        if stream == 0:
+            self.url = url
+        connected = False
         while not self.do_shutdown:
             try:
-                with self.session.data_request("GET", self.session.urlbase, self.url, stream=True) as stream:
-                    self.client = sseclient.SSEClient(stream)
-                    for sse_event in self.client.events():
-                        if sse_event.event == 'curve_event':
-                            event = CurveEvent(sse_event)
-                        else:
-                            event = DefaultEvent(sse_event)
-                        if hasattr(event, 'id') and event.id in self.curve_cache:
-                            event.curve = self.curve_cache[event.id]
-                        self.queue.put(event)
-                        if sse_event.retry is not None:
-                            with contextlib.suppress(ValueError, TypeError):
-                                self.retry = int(sse_event.retry)
+                if connected:
+                    with self._lock:
+                        self.reconnects += 1
+                connected = True
+                # Resume from the last received event, so that events created
+                # while reconnecting are not lost.
+                if resume.created is not None:
+                    url = self._make_url(resume.created, ids)
+                    if stream == 0:
+                        self.url = url
+                with self.session.data_request("GET", self.session.urlbase, url, stream=True) as response:
+                    import sseclient
+                    client = sseclient.SSEClient(response)
+                    self._clients[stream] = client
+                    if stream == 0:
+                        self.client = client
+                    for sse_event in client.events():
+                        self._handle_sse_event(sse_event, resume)
                         if self.do_shutdown:
                             break
                     # Session was closed by server/network, wait for retry before looping.
@@ -71,9 +413,13 @@ class EventListener:
 
     def close(self, timeout=1):
         self.do_shutdown = True
-        if self.client is not None:
-            self.client.close()
-        self.worker.join(timeout)
+        self.queue.close()
+        for client in list(self._clients.values()):
+            client.close()
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.join(max(0, deadline - time.monotonic()))
+        self.cursor.save()
 
     def __iter__(self):
         return self
@@ -102,8 +448,10 @@ class EventTimeout:
 
 
 class DefaultEvent(object):
+    __slots__ = ('event_id', 'json_data')
+
     def __init__(self, sse_event):
-        self._raw_event = sse_event
+        self.event_id = sse_event.id
         try:
             self.json_data = json.loads(sse_event.data)
         except (json.JSONDecodeError, TypeError):
@@ -111,18 +459,25 @@ class DefaultEvent(object):
 
 
 class CurveEvent(DefaultEvent):
+    """
+    A change to a curve.
+
+    The listener uses ``created`` of every event to resume and to measure
+    the lag, so the time fields are parsed when the event is made, using
+    the fast ISO 8601 path of :func:`volue_insight_timeseries.util.parsetime`.
+    """
+    __slots__ = ('id', 'curve', 'operation', 'tag', 'created', 'issue_date', 'range', '_data')
+
     def __init__(self, sse_event):
         super(CurveEvent, self).__init__(sse_event)
-        self.id = self.json_data['id']
+        self._data = None if sse_event.id else sse_event.data
+        json_data = self.json_data
+        self.id = json_data['id']
         self.curve = None
-        self.created = util.parsetime(self.json_data['created'])
-        self.operation = self.json_data['operation']
-        self.tag = None
-        self.issue_date = None
-        self.range = None
-        if 'tag' in self.json_data:
-            self.tag = self.json_data['tag']
-        if 'issue_date' in self.json_data:
-            self.issue_date = util.parsetime(self.json_data['issue_date'])
-        if 'range' in self.json_data:
-            self.range = util.parserange(self.json_data['range'])
+        self.operation = json_data['operation']
+        self.tag = json_data.get('tag')
+        self.created = util.parsetime(json_data['created'])
+        issue_date = json_data.get('issue_date')
+        self.issue_date = None if issue_date is None else util.parsetime(issue_date)
+        data_range = json_data.get('range')
+        self.range = None if data_range is None else util.parserange(data_range)
@@ -0,0 +1,156 @@
+#
+# Hedged requests: if an idempotent request has not been answered within a
+# high percentile of the recent latencies of its endpoint, the same request
+# is sent again and whichever response arrives first is used.
+#
+# The extra requests are limited to a fraction (the budget) of all requests.
+# Each copy sent takes its own slot from the session's limits, held until it
+# returns, even if the other copy has already answered.
+#
+
+import contextlib
+import contextvars
+import threading
+import time
+
+from . import limits
+from .instrument import LatencyTracker, endpoint_class
+
+PERCENTILE = 0.95   # Latency percentile after which a request is hedged
+BUDGET = 0.05       # Maximum fraction of requests that are hedged
+MIN_DELAY = 0.01    # Minimum seconds before hedging
+MIN_SAMPLES = 20    # Latencies needed for an endpoint before hedging
+MAX_WORKERS = 64    # Threads running hedgeable requests
+
+
+class Hedger:
+    """
+    Send a second copy of slow requests, see
+    :meth:`volue_insight_timeseries.session.Session.enable_hedging`.
+
+    Parameters
+    ----------
+    percentile: float
+        Hedge a request when it has run longer than this percentile (0-1)
+        of the recent latencies of its endpoint class.
+    budget: float
+        Maximum number of hedged requests, as a fraction of all requests.
+    min_delay: float
+        Minimum time (in seconds) before a request is hedged.
+    min_samples: int
+        Number of latencies needed for an endpoint class before its
+        requests are hedged.
+    max_workers: int
+        Number of threads running the requests that may be hedged.  The
+        calling thread waits for the first response.
+    """
+    def __init__(self, percentile=PERCENTILE, budget=BUDGET, min_delay=MIN_DELAY, min_samples=MIN_SAMPLES,
+                 max_workers=MAX_WORKERS):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self.latencies = LatencyTracker()
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def delay(self, endpoint):
+        """Seconds before a request to the endpoint class is hedged, or None
+        if it is not hedged"""
+        if self.latencies.count(endpoint) < self.min_samples:
+            return None
+        return max(self.min_delay, self.latencies.percentile(endpoint, self.percentile))
+
+    def _timed(self, endpoint, func):
+        # Only attempts that return are recorded
+        start = time.perf_counter()
+        res = func()
+        self.latencies.record(endpoint, time.perf_counter() - start)
+        return res
+
+    def _take_budget(self):
+        with self._lock:
+            if self.hedged + 1 > self.budget * self.requests:
+                return False
+            self.hedged += 1
+            return True
+
+    def _slotted(self, endpoint, func, slot, answered, started=None):
+        with slot():
+            # A copy still waiting for its slot is not sent once the other
+            # copy has answered
+            if answered.is_set():
+                return None
+            if started is not None:
+                started.set()
+            return self._timed(endpoint, func)
+
+    def _submit(self, endpoint, func, slot, answered, started=None):
+        import concurrent.futures
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = concurrent.futures.ThreadPoolExecutor(self.max_workers, thread_name_prefix='vit-hedge')
+        # The copies are scheduled as requests of the calling thread
+        context = contextvars.copy_context()
+        context.run(limits.pin_caller)
+        return self._pool.submit(context.run, self._slotted, endpoint, func, slot, answered, started)
+
+    def request(self, url, func, slot=contextlib.nullcontext):
+        """Call ``func`` (sending the request for ``url``), and call it again
+        if it has not returned within the hedging delay.
+
+        Each call is made while holding a ``slot()`` (a context manager, e.g.
+        for the limits of the session), which is kept until the call
+        returns.
+
+        Returns a tuple of the first result and whether it came from the
+        hedged call (None if the request was not hedged).  If the first
+        call to return raises an exception, the other is waited for.
+        """
+        endpoint = endpoint_class(url)
+        with self._lock:
+            self.requests += 1
+        delay = self.delay(endpoint)
+        if delay is None or self.hedged + 1 > self.budget * self.requests:
+            with slot():
+                return self._timed(endpoint, func), None
+        import concurrent.futures
+
+        answered = threading.Event()
+        started = threading.Event()
+        primary = self._submit(endpoint, func, slot, answered, started)
+        primary.add_done_callback(lambda future: started.set())
+        # The delay counts from when the request is sent, not while it waits
+        # for a thread or a slot, so that a busy pool does not cause hedging
+        started.wait()
+        done, _ = concurrent.futures.wait([primary], timeout=delay)
+        if done or not self._take_budget():
+            return primary.result(), None
+        hedge = self._submit(endpoint, func, slot, answered)
+        pending = [primary, hedge]
+        error = None
+        try:
+            while pending:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                        continue
+                    won = future is hedge
+                    if won:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result(), won
+            raise error
+        finally:
+            answered.set()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
@@ -0,0 +1,323 @@
+#
+# Local fan-out of curve events
+#
+# An EventHub holds one upstream event listener and re-publishes the events
+# over a Unix socket, so that many local processes can listen for changes
+# through a single connection to the API.  Processes subscribe using a
+# HubListener, which behaves like a normal EventListener.
+#
+
+import argparse
+import json
+import os
+import socket
+import stat
+import threading
+
+from . import events, util
+from .session import Session
+
+RECONNECT_DELAY = 0.1       # First wait before reconnecting to the hub, in seconds
+MAX_RECONNECT_DELAY = 30.0  # Longest wait between attempts to reconnect
+
+
+class EventHubException(Exception):
+    pass
+
+
+def _encode(msg):
+    return (json.dumps(msg) + '\n').encode()
+
+
+class _Subscriber:
+    """A connected subscriber, with its own queue and sender thread"""
+    def __init__(self, hub, conn, ids, max_queue_size):
+        self.hub = hub
+        self.conn = conn
+        self.ids = ids
+        self.queue = events.EventQueue(max_queue_size, events.EventQueue.DROP_OLDEST)
+        self.sender = threading.Thread(target=self.send_lines)
+        self.sender.daemon = True
+        self.sender.start()
+
+    def wants(self, curve_id):
+        return not self.ids or curve_id is None or curve_id in self.ids
+
+    def send_lines(self):
+        while True:
+            line = self.queue.get()
+            if line is None:
+                break
+            try:
+                self.conn.sendall(line)
+            except OSError:
+                break
+        self.hub._remove(self)
+
+    def close(self):
+        self.queue.put(None)
+        self.queue.close()
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.conn.close()
+
+
+class EventHub:
+    """
+    Share one upstream event stream between local processes.
+
+    The hub listens for events on all curves in ``curve_list``, and
+    re-publishes them on the Unix socket ``address`` to every
+    :class:`HubListener` whose curves match.  A slow subscriber only loses
+    its own oldest events (when more than ``max_queue_size`` are waiting),
+    it does not hold back the other subscribers.
+
+    Parameters
+    ----------
+
+    session: :class:`volue_insight_timeseries.session.Session` object
+        Session used for the upstream connection.
+    curve_list: list
+        Curves (or curve ids) to listen for.
+    address: path
+        Path of the Unix socket to create.
+    start_time: time-stamp, optional
+        Passed on to the upstream listener.
+    cursor_file: path, optional
+        Passed on to the upstream listener.
+    max_queue_size: int, optional
+        Maximum number of events waiting to be sent to each subscriber.
+    mode: int, optional
+        Permissions of the socket, by default only the user running the hub
+        may subscribe.
+    """
+    def __init__(self, session, curve_list, address, start_time=None, cursor_file=None,
+                 max_queue_size=10000, mode=0o600):
+        self.session = session
+        self.curve_list = curve_list
+        self.address = address
+        self.start_time = start_time
+        self.cursor_file = cursor_file
+        self.max_queue_size = max_queue_size
+        self.listener = None
+        self.do_shutdown = False
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._threads = []
+        # Replace a stale socket left by a hub that was not shut down cleanly,
+        # but not one that a running hub is serving on
+        if os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(address)
+            except ConnectionRefusedError:
+                os.unlink(address)
+            else:
+                raise EventHubException('An event hub is already serving on {}'.format(address))
+            finally:
+                probe.close()
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(address)
+        os.chmod(address, mode)
+        self._server.listen()
+
+    def start(self):
+        """Connect upstream and start serving subscribers"""
+        if self.listener is not None:
+            return
+        self.listener = events.EventListener(self.session, self.curve_list, start_time=self.start_time,
+                                             timeout=1, cursor_file=self.cursor_file)
+        for target in (self._accept, self._publish):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def serve_forever(self):
+        """Start the hub (if needed) and run until the upstream listener fails"""
+        self.start()
+        try:
+            while not self.do_shutdown and self._threads[1].is_alive():
+                self._threads[1].join(1)
+        finally:
+            self.close()
+
+    def stats(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        res = {
+            'subscribers': len(subscribers),
+            'dropped': sum(s.queue.dropped for s in subscribers),
+        }
+        if self.listener is not None:
+            res['upstream'] = self.listener.stats()
+        return res
+
+    def _accept(self):
+        while not self.do_shutdown:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                break
+            thread = threading.Thread(target=self._register, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _register(self, conn):
+        try:
+            conn.settimeout(10)
+            with conn.makefile('rb') as f:
+                msg = json.loads(f.readline())
+            conn.settimeout(None)
+            ids = (msg.get('ids') or []) if isinstance(msg, dict) else None
+            if not isinstance(ids, list) or not all(isinstance(id, (int, str)) for id in ids):
+                raise ValueError('Bad handshake')
+        except (OSError, ValueError):
+            conn.close()
+            return
+        subscriber = _Subscriber(self, conn, set(ids), self.max_queue_size)
+        with self._lock:
+            if self.do_shutdown:
+                subscriber.close()
+                return
+            self._subscribers.add(subscriber)
+
+    def _remove(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _publish(self):
+        while not self.do_shutdown:
+            try:
+                event = self.listener.get()
+            except Exception as e:
+                self._broadcast(_encode({'error': str(e)}), None)
+                break
+            if isinstance(event, events.EventTimeout):
+                continue
+            msg = {
+                'event': 'curve_event' if isinstance(event, events.CurveEvent) else 'message',
+                'id': event.event_id,
+                'data': json.dumps(event.json_data),
+            }
+            self._broadcast(_encode(msg), getattr(event, 'id', None))
+
+    def _broadcast(self, line, curve_id):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if subscriber.wants(curve_id):
+                subscriber.queue.put(line)
+
+    def close(self):
+        self.do_shutdown = True
+        # Stop taking subscribers first, so listeners do not reconnect to a
+        # closing hub (closing the socket does not stop a blocked accept)
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        try:
+            self._server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._server.close()
+        if self.listener is not None:
+            self.listener.close()
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for subscriber in subscribers:
+            subscriber.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class HubListener(events.EventListener):
+    """
+    Listen for changes on a list of curves through a local :class:`EventHub`.
+
+    Works like :class:`volue_insight_timeseries.events.EventListener`, but
+    needs no session, as the hub holds the connection to the API.  The hub
+    does not replay old events, so ``start_time`` and ``cursor_file`` are
+    not supported.  If the hub is not running (e.g. while it is
+    restarted), the listener tries to connect again, waiting longer
+    between each attempt, and events published meanwhile are missed.
+    """
+    def __init__(self, address, curve_list, timeout=None, max_queue_size=0, queue_policy=events.EventQueue.BLOCK):
+        self.address = address
+        self._stopped = threading.Event()
+        super().__init__(None, curve_list, timeout=timeout, max_queue_size=max_queue_size,
+                         queue_policy=queue_policy)
+
+    def fetch_events(self, stream=0):
+        # The hub takes any number of ids, so there is only one stream
+        import sseclient
+        connected = False
+        delay = RECONNECT_DELAY
+        while not self.do_shutdown:
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                client.connect(self.address)
+            except OSError:
+                client.close()
+                self._stopped.wait(delay)
+                delay = min(2 * delay, MAX_RECONNECT_DELAY)
+                continue
+            if connected:
+                with self._lock:
+                    self.reconnects += 1
+            connected = True
+            delay = RECONNECT_DELAY
+            self.client = client
+            try:
+                client.sendall(_encode({'ids': self.ids}))
+                with client.makefile('rb') as lines:
+                    for line in lines:
+                        msg = json.loads(line)
+                        if 'error' in msg:
+                            raise EventHubException('Event hub failed: {}'.format(msg['error']))
+                        self._handle_sse_event(sseclient.Event(data=msg['data'], event=msg['event'],
+                                                               id=msg['id']))
+                        if self.do_shutdown:
+                            break
+            except OSError:
+                pass  # Lost the hub, connect again
+            except Exception as e:
+                if not self.do_shutdown:
+                    self.queue.put(events.EventError(e))
+                break
+            finally:
+                client.close()
+
+    def close(self, timeout=1):
+        self.do_shutdown = True
+        self._stopped.set()
+        if self.client is not None:
+            try:
+                self.client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        super().close(timeout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Share one Volue Insight event stream between local processes.')
+    parser.add_argument('--config', required=True, help='Configuration file with access details')
+    parser.add_argument('--address', required=True, help='Path of the Unix socket to serve on')
+    parser.add_argument('--cursor-file', help='File used to resume the upstream stream after restart')
+    parser.add_argument('curves', nargs='+', help='Curve names or ids to listen for')
+    args = parser.parse_args(argv)
+    session = Session(config_file=args.config)
+    curve_list = [int(c) if util.is_integer(c) else session.get_curve(name=c) for c in args.curves]
+    hub = EventHub(session, curve_list, args.address, cursor_file=args.cursor_file)
+    hub.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
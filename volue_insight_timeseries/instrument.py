@@ -0,0 +1,179 @@
+#
+# Per-request instrumentation.
+#
+# When a request hook is added to a session, each call to the API is timed
+# and reported to the hook as a RequestStats object.  Without hooks, the
+# session skips all of this.
+#
+
+import collections
+import re
+import threading
+from urllib.parse import urlsplit
+
+
+class RequestStats:
+    """
+    Breakdown of one call to the API.  All times are in seconds, and are
+    None if the phase did not happen (e.g. no decoding of a failed request).
+
+    * ``auth``: validating (and possibly refreshing) the access token
+    * ``ttfb``: from sending the request until the response headers are
+      received, including setting up the connection (last attempt)
+    * ``download``: reading the response body (last attempt)
+    * ``decode``: decoding the json response
+    * ``build``: building the result objects (e.g. :class:`util.TS`)
+    * ``total``: the whole call, including retries
+    """
+    __slots__ = ('method', 'url', 'endpoint', 'status_code', 'bytes', 'attempts', 'timeouts',
+                 'auth', 'ttfb', 'download', 'decode', 'build', 'total', 'error')
+
+    def __init__(self, method=None, url=None):
+        self.method = method
+        self.url = url
+        self.endpoint = None if url is None else endpoint_class(url)
+        self.status_code = None
+        self.bytes = None
+        self.attempts = 0
+        self.timeouts = 0
+        self.auth = None
+        self.ttfb = None
+        self.download = None
+        self.decode = None
+        self.build = None
+        self.total = None
+        self.error = None
+
+    def begin(self, method, url):
+        self.method = method
+        self.url = url
+        self.endpoint = endpoint_class(url)
+
+    def add_attempt(self, response, elapsed, stream=False):
+        """Record one attempt at sending the request, taking ``elapsed`` seconds"""
+        self.attempts += 1
+        if response is None:
+            self.timeouts += 1
+            return
+        self.status_code = response.status_code
+        # requests measures the time until the headers are parsed, fakes may not
+        ttfb = response.elapsed.total_seconds() if getattr(response, 'elapsed', None) else 0.0
+        if not 0.0 < ttfb <= elapsed:
+            ttfb = elapsed
+        self.ttfb = ttfb
+        if stream:
+            # The body is read later by the consumer
+            length = response.headers.get('content-length')
+            self.bytes = int(length) if length is not None else None
+        else:
+            self.download = elapsed - ttfb
+            self.bytes = len(response.content)
+
+    @property
+    def retries(self):
+        return max(0, self.attempts - 1)
+
+    def as_dict(self):
+        res = {key: getattr(self, key) for key in self.__slots__}
+        res['retries'] = self.retries
+        return res
+
+    def __repr__(self):
+        return 'RequestStats({} {} {} in {:.3f}s)'.format(self.method, self.url, self.status_code,
+                                                           self.total or 0.0)
+
+
+_ENDPOINTS = [
+    (re.compile(r'/oauth2/'), 'auth'),
+    (re.compile(r'/api/events'), 'events'),
+    (re.compile(r'/api/curves'), 'curves'),
+    (re.compile(r'/api/series/tagged/'), 'tagged'),
+    (re.compile(r'/api/series/'), 'series'),
+    (re.compile(r'/api/instances/.*/relative'), 'relative'),
+    (re.compile(r'/api/instances/.*/absolute'), 'absolute'),
+    (re.compile(r'/api/instances/tagged/'), 'tagged_instances'),
+    (re.compile(r'/api/instances/'), 'instances'),
+    (re.compile(r'/api/[a-z_]+$'), 'attributes'),
+]
+
+
+def endpoint_class(url):
+    """Classify a request url, e.g. 'series' or 'instances'"""
+    path = urlsplit(url).path
+    for pattern, name in _ENDPOINTS:
+        if pattern.search(path):
+            return name
+    return 'other'
+
+
+class StatsCollector:
+    """
+    A request hook keeping the most recent :class:`RequestStats`, and totals
+    per endpoint class::
+
+        >>> collector = StatsCollector()
+        >>> session.add_request_hook(collector)
+        >>> ...
+        >>> collector.summary()['series']['mean_total']
+    """
+    _times = ('auth', 'ttfb', 'download', 'decode', 'build', 'total')
+
+    def __init__(self, keep=1000):
+        self.recent = collections.deque(maxlen=keep)
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, stats):
+        with self._lock:
+            self.recent.append(stats)
+            totals = self._totals.get(stats.endpoint)
+            if totals is None:
+                totals = self._totals[stats.endpoint] = collections.Counter()
+            totals['count'] += 1
+            totals['errors'] += stats.error is not None or (stats.status_code or 0) >= 400
+            totals['retries'] += stats.retries
+            totals['timeouts'] += stats.timeouts
+            totals['bytes'] += stats.bytes or 0
+            for key in self._times:
+                totals[key] += getattr(stats, key) or 0.0
+
+    def summary(self):
+        """Totals and mean times per endpoint class"""
+        res = {}
+        with self._lock:
+            for endpoint, totals in self._totals.items():
+                summary = dict(totals)
+                for key in self._times:
+                    summary['mean_{}'.format(key)] = totals[key] / totals['count']
+                res[endpoint] = summary
+        return res
+
+
+class LatencyTracker:
+    """
+    The most recent ``window`` latencies, in seconds, by endpoint class.
+    """
+    def __init__(self, window=1000):
+        self.window = window
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds):
+        with self._lock:
+            latencies = self._latencies.get(endpoint)
+            if latencies is None:
+                latencies = self._latencies[endpoint] = collections.deque(maxlen=self.window)
+            latencies.append(seconds)
+
+    def count(self, endpoint):
+        with self._lock:
+            return len(self._latencies.get(endpoint, ()))
+
+    def percentile(self, endpoint, q):
+        """The ``q`` (0-1) percentile of the latencies of the endpoint, or
+        None if none are recorded"""
+        with self._lock:
+            latencies = sorted(self._latencies.get(endpoint, ()))
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
@@ -0,0 +1,334 @@
+#
+# Client-side limits on the requests sent: a token bucket for the rate and
+# a limit on the number of requests in flight, per priority class.
+#
+# The limits are kept in memory and shared by the threads using a session,
+# or kept in files (with file locks) to share them between processes.
+#
+# The PriorityScheduler decides the order in which waiting requests are
+# sent, by priority class and fairly between callers.
+#
+
+import collections
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+# Priority classes
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+POLL_INTERVAL = 0.01  # Seconds between attempts to get a slot shared between processes
+
+_priority = contextvars.ContextVar('volue_insight_timeseries_priority', default=INTERACTIVE)
+_caller = contextvars.ContextVar('volue_insight_timeseries_caller', default=None)
+
+
+class LimitException(Exception):
+    pass
+
+
+def current_priority():
+    """The priority class of requests made in this thread (or context)"""
+    return _priority.get()
+
+
+@contextlib.contextmanager
+def priority(name):
+    """Make the requests within have the given priority class"""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_caller():
+    """The caller the requests made in this thread (or context) are
+    scheduled for, by default the thread"""
+    caller = _caller.get()
+    return caller if caller is not None else threading.get_ident()
+
+
+@contextlib.contextmanager
+def caller(name):
+    """Make the requests within be scheduled as made by caller ``name``"""
+    token = _caller.set(name)
+    try:
+        yield
+    finally:
+        _caller.reset(token)
+
+
+def pin_caller():
+    """Set the caller of the current context to the current thread, unless
+    already set, so that threads started with a copy of the context count
+    as the same caller"""
+    if _caller.get() is None:
+        _caller.set(threading.get_ident())
+
+
+def _lock(f, blocking=True):
+    try:
+        import fcntl
+    except ImportError:  # Windows
+        import msvcrt
+        f.seek(0)
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            if blocking:
+                raise
+            return False
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _unlock(f):
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class TokenBucket:
+    """
+    Allow ``rate`` requests per second on average, with bursts of up to
+    ``burst`` requests (default the rate, at least 1).
+    """
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise LimitException('Rate must be positive')
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self, tokens, now, available, updated):
+        # Returns the new state, and the time to wait for the tokens
+        available = min(self.burst, available + (now - updated) * self.rate)
+        available -= tokens
+        wait = -available / self.rate if available < 0 else 0.0
+        return available, wait
+
+    def acquire(self, tokens=1):
+        """Take tokens from the bucket, waiting until they are available.
+        Returns the time waited, in seconds."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens, wait = self._take(tokens, now, self._tokens, self._updated)
+            self._updated = now
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    A :class:`TokenBucket` kept in a file, shared by all processes using
+    the same path.
+    """
+    def __init__(self, path, rate, burst=None):
+        super().__init__(rate, burst)
+        self.path = path
+
+    def acquire(self, tokens=1):
+        with self._lock, open(self.path, 'a+') as f:
+            _lock(f)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read())
+                except ValueError:
+                    state = {}
+                # Wall-clock time, as monotonic clocks are not shared between processes
+                now = time.time()
+                available, wait = self._take(tokens, now, state.get('tokens', self.burst),
+                                             state.get('updated', now))
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({'tokens': available, 'updated': now}))
+                f.flush()
+            finally:
+                _unlock(f)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class ConcurrencyLimiter:
+    """
+    Allow at most ``max_in_flight`` requests at the same time.  Used as a
+    context manager around each request.
+    """
+    def __init__(self, max_in_flight):
+        if max_in_flight < 1:
+            raise LimitException('max_in_flight must be at least 1')
+        self.max_in_flight = max_in_flight
+        self._semaphore = threading.BoundedSemaphore(max_in_flight)
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._semaphore.release()
+
+
+class FileConcurrencyLimiter(ConcurrencyLimiter):
+    """
+    A :class:`ConcurrencyLimiter` shared by all processes using the same
+    path, with one lock file per slot (``path.0``, ``path.1``, ...).
+    """
+    def __init__(self, path, max_in_flight):
+        super().__init__(max_in_flight)
+        self.path = path
+        self._held = threading.local()
+
+    def __enter__(self):
+        # The in-process semaphore keeps our own threads from polling
+        self._semaphore.acquire()
+        try:
+            while True:
+                for slot in range(self.max_in_flight):
+                    f = open('{}.{}'.format(self.path, slot), 'a+')
+                    if _lock(f, blocking=False):
+                        self._held.files = getattr(self._held, 'files', []) + [f]
+                        return self
+                    f.close()
+                time.sleep(POLL_INTERVAL)
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        f = self._held.files.pop()
+        try:
+            _unlock(f)
+        finally:
+            f.close()
+            self._semaphore.release()
+
+
+class Limits:
+    """
+    The limits for one priority class (or for all requests), see
+    :meth:`volue_insight_timeseries.session.Session.set_limits`.
+    """
+    def __init__(self, rate=None, burst=None, max_in_flight=None, path=None):
+        self.bucket = None
+        self.limiter = None
+        if rate is not None:
+            if path is not None:
+                self.bucket = FileTokenBucket(os.fspath(path) + '.rate', rate, burst)
+            else:
+                self.bucket = TokenBucket(rate, burst)
+        if max_in_flight is not None:
+            if path is not None:
+                self.limiter = FileConcurrencyLimiter(os.fspath(path) + '.slot', max_in_flight)
+            else:
+                self.limiter = ConcurrencyLimiter(max_in_flight)
+        self.waited = 0.0  # Total time spent waiting for the rate limit
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Wait until a request may be sent, and hold a slot while it runs"""
+        if self.bucket is not None:
+            waited = self.bucket.acquire()
+            with self._lock:
+                self.waited += waited
+        if self.limiter is None:
+            yield
+            return
+        with self.limiter:
+            yield
+
+
+class PriorityScheduler:
+    """
+    Decide the order requests are sent in, see
+    :meth:`volue_insight_timeseries.session.Session.enable_scheduler`.
+
+    Requests are put in lanes by their priority class.  Whenever a request
+    may be sent, the waiting request from the first lane (in the order of
+    ``lanes``) that has room is sent, so interactive requests overtake
+    queued bulk requests.  Within a lane the callers take turns, so one
+    caller with many queued requests does not hold up the others.
+
+    Parameters
+    ----------
+    lanes: dict
+        Maximum number of requests in flight (or None for no limit) by
+        priority class, highest priority first.  Requests with other
+        priority classes use the last lane.
+    max_in_flight: int, optional
+        Maximum number of requests in flight in total.
+    """
+    def __init__(self, lanes, max_in_flight=None):
+        if not lanes:
+            raise LimitException('The scheduler needs at least one lane')
+        self.lanes = dict(lanes)
+        self.max_in_flight = max_in_flight
+        self._last_lane = list(self.lanes)[-1]
+        self._running = {lane: 0 for lane in self.lanes}
+        # Waiting requests by lane and caller, callers in the order of their turns
+        self._waiting = {lane: collections.OrderedDict() for lane in self.lanes}
+        self._total = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def slot(self, priority=None, caller=None):
+        """Wait for the turn of a request, and hold its slot while it runs"""
+        lane = priority if priority is not None else current_priority()
+        if lane not in self.lanes:
+            lane = self._last_lane
+        if caller is None:
+            caller = current_caller()
+        turn = threading.Event()
+        with self._lock:
+            self._waiting[lane].setdefault(caller, collections.deque()).append(turn)
+            self._dispatch()
+        turn.wait()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running[lane] -= 1
+                self._total -= 1
+                self._dispatch()
+
+    def _dispatch(self):
+        while self.max_in_flight is None or self._total < self.max_in_flight:
+            for lane, limit in self.lanes.items():
+                waiting = self._waiting[lane]
+                if waiting and (limit is None or self._running[lane] < limit):
+                    break
+            else:
+                return
+            caller, turns = waiting.popitem(last=False)
+            turn = turns.popleft()
+            if turns:
+                waiting[caller] = turns  # Back of the line for its next request
+            self._running[lane] += 1
+            self._total += 1
+            turn.set()
+
+    def stats(self):
+        """Number of requests running and waiting, by lane"""
+        with self._lock:
+            return {lane: {'running': self._running[lane],
+                           'waiting': sum(len(turns) for turns in self._waiting[lane].values())}
+                    for lane in self.lanes}
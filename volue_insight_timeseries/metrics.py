@@ -0,0 +1,352 @@
+#
+# Client-side metrics.
+#
+# A small registry of counters, gauges and histograms in the style of
+# Prometheus, which can be exported as a dict or in the Prometheus text
+# format, and served over HTTP for scraping.  SessionMetrics collects the
+# standard metrics for a session, see Session.enable_metrics.
+#
+
+import json
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+_CIRCUIT_STATES = {'closed': 0, 'half_open': 1, 'open': 2}  # vit_circuit_state values
+
+
+class MetricsException(Exception):
+    pass
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = ('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for k, v in labels.items())
+    return '{{{}}}'.format(','.join(escaped))
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise MetricsException('Metric {} takes labels {}, not {}'.format(self.name, self.labelnames,
+                                                                              tuple(labels)))
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _items(self):
+        with self._lock:
+            return [(dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+    def samples(self):
+        """List of (name, labels, value) in the Prometheus data model"""
+        return [(self.name, labels, value) for labels, value in self._items()]
+
+    def as_dict(self):
+        return {
+            'type': self.type,
+            'help': self.help,
+            'values': [{'labels': labels, 'value': value} for labels, value in self._items()],
+        }
+
+
+class Counter(_Metric):
+    """A value that only goes up"""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """A value that goes up and down.  If ``function`` is given, the
+    (unlabelled) value is read from it when exported."""
+    type = 'gauge'
+
+    def __init__(self, name, help, labelnames=(), function=None):
+        super().__init__(name, help, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        if self.function is not None:
+            return self.function()
+        return self._values.get(self._key(labels))
+
+    def _items(self):
+        if self.function is not None:
+            return [({}, self.function())]
+        return super()._items()
+
+
+class Histogram(_Metric):
+    """Distribution of observed values, counted in buckets"""
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def _items(self):
+        # Report cumulative bucket counts, as Prometheus does
+        res = []
+        for labels, state in super()._items():
+            counts = []
+            total = 0
+            for n in state['buckets']:
+                total += n
+                counts.append(total)
+            res.append((labels, {'buckets': dict(zip(self.buckets, counts)), 'sum': state['sum'],
+                                 'count': state['count']}))
+        return res
+
+    def samples(self):
+        res = []
+        for labels, value in self._items():
+            for bound, count in value['buckets'].items():
+                res.append((self.name + '_bucket', dict(labels, le=_format_value(bound)), count))
+            res.append((self.name + '_sum', labels, value['sum']))
+            res.append((self.name + '_count', labels, value['count']))
+        return res
+
+
+class MetricsRegistry:
+    """A collection of metrics, see :meth:`as_dict`, :meth:`to_prometheus` and :meth:`serve`"""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise MetricsException('Metric {} is already registered as a {}'.format(name, metric.type))
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=(), function=None):
+        return self._add(Gauge, name, help, labelnames, function=function)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram, name, help, labelnames, buckets=buckets)
+
+    def __getitem__(self, name):
+        return self._metrics[name]
+
+    def as_dict(self):
+        """All metrics as a json-serializable dict, keyed by metric name"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        res = {}
+        for metric in metrics:
+            res[metric.name] = metric.as_dict()
+            if metric.type == 'histogram':
+                for item in res[metric.name]['values']:
+                    item['value']['buckets'] = {_format_value(k): v for k, v in item['value']['buckets'].items()}
+        return res
+
+    def to_prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.help.replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            for name, labels, value in metric.samples():
+                if value is None:
+                    continue
+                lines.append('{}{} {}'.format(name, _format_labels(labels), _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=0, host='127.0.0.1'):
+        """Serve the metrics over HTTP in a background thread
+
+        ``/metrics`` returns the Prometheus text format and ``/metrics.json``
+        the output of :meth:`as_dict`.  Port 0 picks a free port.
+
+        Returns
+        -------
+        :class:`MetricsServer` object
+        """
+        return MetricsServer(self, port, host)
+
+
+def _handler_class(registry):
+    # http.server is only imported by the processes serving metrics
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            if path in ('/', '/metrics'):
+                body = registry.to_prometheus().encode()
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            elif path == '/metrics.json':
+                body = json.dumps(registry.as_dict()).encode()
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return MetricsHandler
+
+
+class MetricsServer:
+    """HTTP server for a :class:`MetricsRegistry`, running in a daemon thread"""
+    def __init__(self, registry, port=0, host='127.0.0.1'):
+        from http.server import ThreadingHTTPServer
+
+        self.server = ThreadingHTTPServer((host, port), _handler_class(registry))
+        self.server.daemon_threads = True
+        self.url = 'http://{}:{}/metrics'.format(*self.server.server_address[:2])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SessionMetrics(MetricsRegistry):
+    """
+    The standard metrics of a session, updated as a request hook (see
+    :meth:`volue_insight_timeseries.session.Session.enable_metrics`):
+
+    * ``vit_requests_total``: requests by endpoint class, method and status
+      (``error`` if no response was received)
+    * ``vit_request_duration_seconds`` and ``vit_request_ttfb_seconds``:
+      latency histograms by endpoint class
+    * ``vit_response_bytes_total``, ``vit_retries_total`` and
+      ``vit_timeouts_total`` by endpoint class
+    * ``vit_requests_in_flight``: requests currently running
+    * ``vit_cache_requests_total`` and ``vit_cache_hit_ratio`` by cache
+    * ``vit_event_lag_seconds``: time from the latest event was created until
+      it was handed to the consumer, and ``vit_events_total``
+    * ``vit_hedged_requests_total``: hedged requests by endpoint class and
+      which copy answered first (``primary`` or ``hedge``), and
+      ``vit_hedge_delay_seconds``: the current hedging delay by endpoint class
+    * ``vit_circuit_state``: the circuit breaker state by endpoint class (0
+      closed, 1 half open, 2 open), and ``vit_circuit_rejected_total``:
+      requests failing fast by endpoint class
+    """
+    def __init__(self):
+        super().__init__()
+        self.requests = self.counter('vit_requests_total', 'Requests to the API',
+                                     ('endpoint', 'method', 'status'))
+        self.duration = self.histogram('vit_request_duration_seconds', 'Request duration, including retries',
+                                       ('endpoint',))
+        self.ttfb = self.histogram('vit_request_ttfb_seconds', 'Time to first byte of the response',
+                                   ('endpoint',))
+        self.bytes = self.counter('vit_response_bytes_total', 'Bytes received', ('endpoint',))
+        self.retries = self.counter('vit_retries_total', 'Retried requests', ('endpoint',))
+        self.timeouts = self.counter('vit_timeouts_total', 'Requests timing out', ('endpoint',))
+        self.in_flight = self.gauge('vit_requests_in_flight', 'Requests currently running')
+        self.in_flight.set(0)
+        self.cache = self.counter('vit_cache_requests_total', 'Cache lookups', ('cache', 'result'))
+        self.cache_hit_ratio = self.gauge('vit_cache_hit_ratio', 'Fraction of cache lookups that hit',
+                                          ('cache',))
+        self.event_lag = self.gauge('vit_event_lag_seconds', 'Lag of the latest event handed to the consumer')
+        self.events = self.counter('vit_events_total', 'Events handed to the consumer')
+        self.hedged = self.counter('vit_hedged_requests_total', 'Requests sent twice to cut their latency',
+                                   ('endpoint', 'winner'))
+        self.hedge_delay = self.gauge('vit_hedge_delay_seconds', 'Time before a request is hedged',
+                                      ('endpoint',))
+        self.circuit_state = self.gauge('vit_circuit_state', 'Circuit breaker state (0 closed, 1 half open, 2 open)',
+                                        ('endpoint',))
+        self.circuit_rejected = self.counter('vit_circuit_rejected_total', 'Requests failing fast on an open circuit',
+                                             ('endpoint',))
+
+    def __call__(self, stats):
+        status = 'error' if stats.status_code is None else stats.status_code
+        self.requests.inc(endpoint=stats.endpoint, method=stats.method, status=status)
+        if stats.total is not None:
+            self.duration.observe(stats.total, endpoint=stats.endpoint)
+        if stats.ttfb is not None:
+            self.ttfb.observe(stats.ttfb, endpoint=stats.endpoint)
+        if stats.bytes:
+            self.bytes.inc(stats.bytes, endpoint=stats.endpoint)
+        if stats.retries:
+            self.retries.inc(stats.retries, endpoint=stats.endpoint)
+        if stats.timeouts:
+            self.timeouts.inc(stats.timeouts, endpoint=stats.endpoint)
+
+    def record_cache(self, cache, hit):
+        self.cache.inc(cache=cache, result='hit' if hit else 'miss')
+        hits = self.cache.get(cache=cache, result='hit')
+        misses = self.cache.get(cache=cache, result='miss')
+        self.cache_hit_ratio.set(hits / (hits + misses), cache=cache)
+
+    def record_hedge(self, endpoint, hedge_won, delay):
+        self.hedged.inc(endpoint=endpoint, winner='hedge' if hedge_won else 'primary')
+        if delay is not None:
+            self.hedge_delay.set(delay, endpoint=endpoint)
+
+    def record_circuit(self, endpoint, state, rejected=False):
+        self.circuit_state.set(_CIRCUIT_STATES[state], endpoint=endpoint)
+        if rejected:
+            self.circuit_rejected.inc(endpoint=endpoint)
+
+    def record_event(self, lag):
+        self.events.inc()
+        if lag is not None:
+            self.event_lag.set(lag)
@@ -1,24 +1,30 @@
-try:
-    from urllib.parse import urljoin
-except ImportError:
-    from urlparse import urljoin
+from urllib.parse import urljoin, urlsplit
 
 import requests
+import contextlib
 import json
+import re
+import threading
 import time
 import warnings
-from past.types import basestring
 import configparser
 
-from . import auth, curves, events, util
+from . import auth, bulk, circuit, curves, events, hedging, limits, timeouts, tracing, util
+from .instrument import RequestStats, endpoint_class
+from .transport import RequestsTransport, load_transport, make_response
 from .util import CurveException
 
 
 RETRY_COUNT = 4    # Number of times to retry
 RETRY_DELAY = 0.5  # Delay between retried calls, in seconds.
 TIMEOUT = 300      # Default timeout for web calls, in seconds.
+POOL_SIZE = 32     # Connections kept open per host, for concurrent requests.
+MAX_URL_LENGTH = 4096  # Longer GET requests are split, see Session.data_request.
 API_URLBASE = 'https://api.volueinsight.com'
 AUTH_URLBASE = 'https://auth.volueinsight.com'
+_INSTANCE_CURVES = (curves.InstanceCurve, curves.TaggedInstanceCurve)
+# Endpoints returning a list, which can be fetched in parts by data_request
+_LIST_PATHS = re.compile(r'/api/(curves|series/tagged/[^/]+|instances/[^/]+|instances/tagged/[^/]+)$')
 
 
 class ConfigException(Exception):
@@ -56,6 +62,11 @@ class Session(object):
         Location of Wattsight authentication service
     timeout: float
         Timeout for REST calls, in seconds
+    transport: :class:`volue_insight_timeseries.transport.Transport` object
+        Send requests through this transport instead of the default
+        :class:`~volue_insight_timeseries.transport.RequestsTransport`.
+        May also be set by the ``transport`` option in the ``common``
+        section of the config file.
 
     Returns
     -------
@@ -64,12 +75,29 @@ class Session(object):
     """
 
     def __init__(self, urlbase=None, config_file=None, client_id=None, client_secret=None,
-                 auth_urlbase=None, timeout=None, retry_update_auth=False):
+                 auth_urlbase=None, timeout=None, retry_update_auth=False, transport=None):
         self.urlbase = API_URLBASE
         self.auth = None
         self.timeout = TIMEOUT
+        self.max_url_length = MAX_URL_LENGTH
         self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=POOL_SIZE)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        if transport is None:
+            transport = RequestsTransport(self._session)
+        self.transport = transport
         self.retry_update_auth = retry_update_auth
+        self.request_hooks = []
+        self.metrics = None
+        self.latest_cache = bulk.LatestCache()
+        self.single_flight = None
+        self.limits = {}
+        self.scheduler = None
+        self.hedger = None
+        self.circuit_breaker = None
+        self.adaptive_timeouts = None
+        self._local = threading.local()
         if config_file is not None:
             self.read_config_file(config_file)
         elif client_id is not None and client_secret is not None:
@@ -95,6 +123,9 @@ class Session(object):
         urlbase = config.get('common', 'urlbase', fallback=None)
         if urlbase is not None:
             self.urlbase = urlbase
+        transport = config.get('common', 'transport', fallback=None)
+        if transport is not None:
+            self.transport = load_transport(transport)
         auth_type = config.get('common', 'auth_type')
         if auth_type == 'OAuth':
             client_id = config.get(auth_type, 'id')
@@ -295,6 +326,429 @@ class Session(object):
         response = self.data_request('GET', self.urlbase, '/api/curves{}'.format(astr))
         return self.handle_multi_curve_response(response)
 
+    def add_request_hook(self, hook):
+        """Call ``hook(stats)`` after each call to the API.
+
+        ``stats`` is a :class:`volue_insight_timeseries.instrument.RequestStats`
+        object with the timing breakdown, size, status and retries of the
+        call.  The hook is called from the thread making the request, so it
+        should be quick.  See also
+        :class:`volue_insight_timeseries.instrument.StatsCollector`.
+        """
+        self.request_hooks.append(hook)
+
+    def remove_request_hook(self, hook):
+        """Stop calling a hook added with :meth:`add_request_hook`"""
+        self.request_hooks.remove(hook)
+
+    def enable_metrics(self):
+        """Start collecting client-side metrics for this session.
+
+        The metrics (request counts, latencies, bytes, retries, cache hit
+        ratios, event lag, etc.) are available as ``session.metrics``, a
+        :class:`volue_insight_timeseries.metrics.SessionMetrics` object which
+        can be exported with ``as_dict()`` or ``to_prometheus()``, or served
+        for scraping with ``serve(port)``.
+
+        Returns
+        -------
+        :class:`volue_insight_timeseries.metrics.SessionMetrics` object
+        """
+        if self.metrics is None:
+            from .metrics import SessionMetrics
+
+            self.metrics = SessionMetrics()
+            self.add_request_hook(self.metrics)
+        return self.metrics
+
+    def enable_single_flight(self):
+        """Share identical concurrent requests for curve data.
+
+        When several threads request the same curve data (the same url) at
+        the same time, only one request is sent, and the others wait for
+        it and use its (decoded) result.  Each caller still gets its own
+        :class:`volue_insight_timeseries.util.TS` objects, with their own
+        lists of points.  This avoids
+        a burst of identical requests, e.g. when many threads refresh a
+        curve after an event.  The shared calls are counted in the
+        ``single_flight`` cache metrics, if enabled.
+
+        Returns
+        -------
+        :class:`volue_insight_timeseries.bulk.SingleFlight` object
+        """
+        if self.single_flight is None:
+            self.single_flight = bulk.SingleFlight()
+        return self.single_flight
+
+    def set_limits(self, rate=None, burst=None, max_in_flight=None, priority=None, path=None):
+        """Limit the requests sent by this session.
+
+        Requests wait until the rate limit (a token bucket) allows them to
+        be sent, and while ``max_in_flight`` requests are running.  The
+        limits apply to the requests of one priority class (see
+        :meth:`priority`), or to all requests if priority is None.  A
+        request must be allowed by both.  This way bulk jobs can be given a
+        budget that leaves room for interactive use with the same
+        credentials::
+
+            session.set_limits(rate=20, max_in_flight=8)
+            session.set_limits(rate=5, max_in_flight=2, priority='bulk')
+
+        Each retry of a request is also limited.  Call with only the priority
+        to remove the limits of that class.
+
+        Parameters
+        ----------
+        rate: float, optional
+            Requests per second, on average.
+        burst: int, optional
+            Number of requests that may be sent at once after a quiet
+            period. Defaults to the rate.
+        max_in_flight: int, optional
+            Number of requests that may run at the same time.
+        priority: str, optional
+            The priority class, ``'interactive'`` (the default for requests)
+            or ``'bulk'``, or any other name used with :meth:`priority`.
+        path: str, optional
+            Keep the limits in files with this path prefix, to share them
+            with other processes using the same path.
+
+        Returns
+        -------
+        :class:`volue_insight_timeseries.limits.Limits` object, or None
+        """
+        if rate is None and max_in_flight is None:
+            self.limits.pop(priority, None)
+            return None
+        self.limits[priority] = limits.Limits(rate, burst, max_in_flight, path)
+        return self.limits[priority]
+
+    def priority(self, name):
+        """Context manager to give the requests made within a priority class.
+
+        The class applies to the current thread, and to the threads used
+        by the session for concurrent requests within (e.g. in
+        :meth:`get_many`).  Requests are ``'interactive'`` by default::
+
+            with session.priority('bulk'):
+                result = session.get_many(names, data_from='2020-01-01')
+        """
+        return limits.priority(name)
+
+    def enable_hedging(self, percentile=hedging.PERCENTILE, budget=hedging.BUDGET, min_delay=hedging.MIN_DELAY):
+        """Hedge slow GET requests, to cut the tail latency.
+
+        When a GET request (other than a stream) has not been answered
+        within the ``percentile`` of the recent latencies of its endpoint
+        class (e.g. ``series``), the same request is sent again, and the
+        first response is used.  At most a ``budget`` fraction of the
+        requests are hedged.  The hedged requests are counted in the
+        ``vit_hedged_requests_total`` metric, by which copy answered first,
+        and the delays are in ``vit_hedge_delay_seconds``, if enabled.
+
+        Parameters
+        ----------
+        percentile: float, optional
+            Latency percentile (0-1) after which a request is hedged.
+        budget: float, optional
+            Maximum fraction of the requests that are hedged.
+        min_delay: float, optional
+            Minimum time (in seconds) before a request is hedged.
+
+        Returns
+        -------
+        :class:`volue_insight_timeseries.hedging.Hedger` object
+        """
+        if self.hedger is not None:
+            self.hedger.close()
+        self.hedger = hedging.Hedger(percentile=percentile, budget=budget, min_delay=min_delay)
+        return self.hedger
+
+    def enable_circuit_breaker(self, failures=circuit.FAILURES, slow_call=None,
+                               reset_timeout=circuit.RESET_TIMEOUT):
+        """Fail fast on requests to endpoints that keep failing.
+
+        After ``failures`` consecutive failed requests (timeouts, errors
+        connecting, 5xx or 408 responses after all retries, or requests
+        slower than ``slow_call``) to an endpoint class (e.g. ``series``),
+        its circuit opens, and requests to it (including retries) raise a
+        :class:`volue_insight_timeseries.circuit.CircuitOpenException` at
+        once.  After ``reset_timeout`` seconds one request is let through,
+        and the circuit closes again if it succeeds.  The states are in
+        the ``vit_circuit_state`` metric (0 closed, 1 half open, 2 open),
+        and the requests failing fast in ``vit_circuit_rejected_total``,
+        if enabled.
+
+        Parameters
+        ----------
+        failures: int, optional
+            Number of consecutive failures opening the circuit.
+        slow_call: float, optional
+            Requests taking longer than this (in seconds) count as failed.
+        reset_timeout: float, optional
+            Seconds before an open circuit is probed.
+
+        Returns
+        -------
+        :class:`volue_insight_timeseries.circuit.CircuitBreaker` object
+        """
+        self.circuit_breaker = circuit.CircuitBreaker(failures=failures, slow_call=slow_call,
+                                                      reset_timeout=reset_timeout)
+        return self.circuit_breaker
+
+    def enable_adaptive_timeouts(self, connect=timeouts.CONNECT_TIMEOUT, percentile=timeouts.PERCENTILE,
+                                 multiplier=timeouts.MULTIPLIER, min_read=timeouts.MIN_READ_TIMEOUT, max_read=None):
+        """Derive the timeouts of requests from the latencies seen so far.
+
+        Instead of the ``timeout`` of the session for all requests, a
+        request gets a connect timeout of ``connect`` seconds, and a read
+        timeout of ``multiplier`` times the ``percentile`` of the recent
+        latencies of its endpoint class (e.g. ``curves`` or ``series``),
+        scaled by the number of points the request is expected to return
+        (from the data range and frequency).  So stalled connections are
+        given up within seconds, while large requests get the time they
+        need.  Each retry doubles the read timeout.  Until enough requests
+        to an endpoint class have been seen, for requests for data without
+        a range (whose size is not known), and for event streams, the
+        ``timeout`` of the session is used for reading.
+
+        Parameters
+        ----------
+        connect: float, optional
+            Connect timeout, in seconds.
+        percentile: float, optional
+            Latency percentile (0-1) the read timeout is based on.
+        multiplier: float, optional
+            Read timeout, as a multiple of the percentile.
+        min_read: float, optional
+            Shortest read timeout, in seconds.
+        max_read: float, optional
+            Longest read timeout, in seconds.
+
+        Returns
+        -------
+        :class:`volue_insight_timeseries.timeouts.AdaptiveTimeouts` object
+        """
+        self.adaptive_timeouts = timeouts.AdaptiveTimeouts(connect=connect, percentile=percentile,
+                                                           multiplier=multiplier, min_read=min_read,
+                                                           max_read=max_read)
+        return self.adaptive_timeouts
+
+    @contextlib.contextmanager
+    def _expect_points(self, points):
+        """Let the requests made within expect about ``points`` points
+        (None if not known), for the adaptive timeouts"""
+        previous = getattr(self._local, 'points', 0)
+        self._local.points = points
+        try:
+            yield
+        finally:
+            self._local.points = previous
+
+    def _check_circuit(self, breaker, endpoint):
+        try:
+            state = breaker.check(endpoint)
+        except circuit.CircuitOpenException:
+            if self.metrics is not None:
+                self.metrics.record_circuit(endpoint, breaker.state(endpoint), rejected=True)
+            raise
+        if state != circuit.CLOSED and self.metrics is not None:
+            self.metrics.record_circuit(endpoint, state)
+        return state
+
+    def _record_circuit(self, breaker, endpoint, ok, elapsed):
+        state = breaker.record(endpoint, ok, elapsed)
+        if self.metrics is not None:
+            self.metrics.record_circuit(endpoint, state)
+
+    def enable_scheduler(self, lanes=None, max_in_flight=POOL_SIZE):
+        """Schedule the requests of this session by priority.
+
+        Requests wait for their turn when ``max_in_flight`` requests are
+        running (or their lane is full).  The next request sent is taken
+        from the highest priority lane with room, so interactive requests
+        overtake queued bulk requests (see :meth:`priority`), and the
+        callers (threads, or the names given with
+        :func:`volue_insight_timeseries.limits.caller`) with requests in a
+        lane take turns.  The threads used for concurrent requests count as
+        the thread that started them.
+
+        Parameters
+        ----------
+        lanes: dict, optional
+            Maximum number of requests in flight (None for no limit) by
+            priority class, highest priority first.  By default
+            interactive requests have no limit of their own, and bulk
+            requests may use half of ``max_in_flight``.
+        max_in_flight: int, optional
+            Maximum number of requests in flight in total.
+
+        Returns
+        -------
+        :class:`volue_insight_timeseries.limits.PriorityScheduler` object
+        """
+        if lanes is None:
+            lanes = {limits.INTERACTIVE: None, limits.BULK: max(1, (max_in_flight or POOL_SIZE) // 2)}
+        self.scheduler = limits.PriorityScheduler(lanes, max_in_flight)
+        return self.scheduler
+
+    @contextlib.contextmanager
+    def _request_slot(self):
+        if not self.limits and self.scheduler is None:
+            yield
+            return
+        with contextlib.ExitStack() as stack:
+            if self.scheduler is not None:
+                stack.enter_context(self.scheduler.slot())
+            for key in (None, limits.current_priority()):
+                request_limits = self.limits.get(key)
+                if request_limits is not None:
+                    stack.enter_context(request_limits.slot())
+            yield
+
+    def _record_cache(self, cache, hit):
+        if self.metrics is not None:
+            self.metrics.record_cache(cache, hit)
+
+    def get_many(self, names, data_from=None, data_to=None, time_zone=None, filter=None, function=None,
+                 frequency=None, output_time_zone=None, max_workers=bulk.MAX_WORKERS):
+        """Fetch data for many curves concurrently
+
+        The curve metadata is looked up in bulk, and the data is fetched
+        using up to ``max_workers`` concurrent requests.  For time series
+        and tagged curves this is the data (default tag) in the range, for
+        instance curves the latest instance.  A curve that cannot be found
+        or fetched is reported in the ``errors`` of the result, the others
+        are still returned.
+
+        Parameters
+        ----------
+
+        names: list
+            curve names (or curve objects, keyed by id if they have no name)
+        data_from, data_to, time_zone, filter, function, frequency, output_time_zone:
+            as for :meth:`volue_insight_timeseries.curves.TimeSeriesCurve.get_data`
+        max_workers: int, optional
+            maximum number of concurrent requests
+
+        Returns
+        -------
+        :class:`volue_insight_timeseries.bulk.BulkResult` object
+            with the series by name, the errors by name, and ``frame``, a
+            pandas.DataFrame with one column per curve on a common UTC index.
+        """
+        found, errors = self._find_curves(names, max_workers)
+        kwargs = dict(data_from=data_from, data_to=data_to, time_zone=time_zone, filter=filter,
+                      function=function, frequency=frequency, output_time_zone=output_time_zone)
+
+        def fetch(name):
+            curve = found[name]
+            if isinstance(curve, _INSTANCE_CURVES):
+                return curve.get_latest(**kwargs)
+            return curve.get_data(**kwargs)
+
+        fetched = list(found)
+        series = {}
+        for name, (ts, error) in zip(fetched, bulk.run_concurrently(fetch, fetched, max_workers)):
+            if error is not None:
+                errors[name] = error
+            else:
+                series[name] = ts
+        return bulk.BulkResult(series, errors)
+
+    def get_latest_many(self, curves, issue_date_from=None, issue_date_to=None, data_from=None, data_to=None,
+                        time_zone=None, filter=None, function=None, frequency=None, output_time_zone=None,
+                        use_cache=True, max_workers=bulk.MAX_WORKERS):
+        """Fetch the latest instance of many instance curves concurrently
+
+        Works like :meth:`get_many`, but calls ``get_latest`` on each curve.
+        With ``use_cache``, instances are kept in ``session.latest_cache``.
+        For a curve fetched before with the same arguments, only the issue
+        date of the latest instance is checked, and the data is downloaded
+        again only if there is a newer instance.
+
+        Parameters
+        ----------
+
+        curves: list
+            curve names (or curve objects) of INSTANCES or TAGGED_INSTANCES curves
+        issue_date_from, issue_date_to, data_from, data_to, time_zone, filter, function, frequency,
+        output_time_zone:
+            as for :meth:`volue_insight_timeseries.curves.InstanceCurve.get_latest`
+        use_cache: bool, optional
+            reuse unchanged instances from earlier calls
+        max_workers: int, optional
+            maximum number of concurrent requests
+
+        Returns
+        -------
+        :class:`volue_insight_timeseries.bulk.LatestResult` object
+            with the instances and errors by name, and ``frame``, a
+            pandas.DataFrame with (curve, issue_date) columns on a common
+            UTC index.
+        """
+        found, errors = self._find_curves(curves, max_workers)
+        kwargs = dict(issue_date_from=issue_date_from, issue_date_to=issue_date_to, data_from=data_from,
+                      data_to=data_to, time_zone=time_zone, filter=filter, function=function,
+                      frequency=frequency, output_time_zone=output_time_zone)
+        args = tuple(sorted(util.make_arg(key, val) for key, val in kwargs.items() if val is not None))
+
+        def fetch(name):
+            curve = found[name]
+            if not isinstance(curve, _INSTANCE_CURVES):
+                raise CurveException('{} is not an instance curve'.format(name))
+            if not use_cache:
+                return curve.get_latest(**kwargs)
+            key = (curve.id, args)
+            cached = self.latest_cache.get(key)
+            if cached is not None:
+                latest = curve.get_latest(with_data=False, issue_date_from=issue_date_from,
+                                          issue_date_to=issue_date_to)
+                hit = latest is not None and latest.issue_date == cached.issue_date
+                self._record_cache('latest', hit)
+                if hit:
+                    return cached
+            ts = curve.get_latest(**kwargs)
+            if ts is not None:
+                self.latest_cache.put(key, ts)
+            return ts
+
+        fetched = list(found)
+        series = {}
+        for name, (ts, error) in zip(fetched, bulk.run_concurrently(fetch, fetched, max_workers)):
+            if error is not None:
+                errors[name] = error
+            else:
+                series[name] = ts
+        return bulk.LatestResult(series, errors)
+
+    def _find_curves(self, names, max_workers):
+        """Look up curves by name in batches, returns dicts of curves and errors by name
+        (or by id, for curve objects without a name)"""
+        found = {}
+        errors = {}
+        wanted = []
+        for name in names:
+            if isinstance(name, curves.BaseCurve):
+                # Curves from make_curve have no name
+                found[getattr(name, 'name', name.id)] = name
+            else:
+                found[name] = None
+                wanted.append(name)
+        batches = [wanted[i:i + bulk.SEARCH_BATCH] for i in range(0, len(wanted), bulk.SEARCH_BATCH)]
+        results = bulk.run_concurrently(lambda batch: self.search(name=batch), batches, max_workers)
+        for batch, (curve_list, error) in zip(batches, results):
+            by_name = {} if curve_list is None else {c.name.lower(): c for c in curve_list}
+            for name in batch:
+                if error is not None:
+                    errors[name] = error
+                elif name.lower() in by_name:
+                    found[name] = by_name[name.lower()]
+                else:
+                    errors[name] = MetadataException('Curve {} not found'.format(name))
+        return {name: curve for name, curve in found.items() if curve is not None}, errors
+
     def make_curve(self, id, curve_type):
         """Return a mostly uninitialized curve object of the correct type.
         This is generally a bad idea, use get_curve or search when possible."""
@@ -302,9 +756,21 @@ class Session(object):
             return self._curve_types[curve_type](id, None, self)
         raise CurveException('Bad curve type requested')
 
-    def events(self, curve_list, start_time=None, timeout=None):
-        """Get an event listener for a list of curves."""
-        return events.EventListener(self, curve_list, start_time=start_time, timeout=timeout)
+    def events(self, curve_list, start_time=None, timeout=None, cursor_file=None,
+               max_queue_size=0, queue_policy='block'):
+        """Get an event listener for a list of curves.
+
+        If ``cursor_file`` is given, the position of the last event returned
+        is stored in that file, and a new listener using the same file
+        resumes from that position (unless ``start_time`` is given).
+
+        ``max_queue_size`` limits the number of events waiting for the
+        consumer, with ``queue_policy`` one of ``'block'``, ``'drop_oldest'``
+        or ``'coalesce'``, see :class:`volue_insight_timeseries.events.EventQueue`.
+        """
+        return events.EventListener(self, curve_list, start_time=start_time, timeout=timeout,
+                                    cursor_file=cursor_file, max_queue_size=max_queue_size,
+                                    queue_policy=queue_policy)
 
     _attributes = {'commodities', 'categories', 'areas', 'stations', 'sources', 'scenarios',
                    'units', 'time_zones', 'versions', 'frequencies', 'data_types',
@@ -448,7 +914,7 @@ class Session(object):
         databytes = None
         if data is not None:
             headers['content-type'] = 'application/json'
-            if isinstance(data, basestring):
+            if isinstance(data, str):
                 databytes = data.encode()
             else:
                 databytes = json.dumps(data).encode()
@@ -473,20 +939,65 @@ class Session(object):
 
         databytes = None
         if data is not None:
-            if isinstance(data, basestring):
+            if isinstance(data, str):
                 databytes = data.encode()
             else:
                 databytes = json.dumps(data).encode()
         if data is None and rawdata is not None:
             databytes = rawdata
+        stats = getattr(self._local, 'stats', None) if self.request_hooks else None
+        breaker = self.circuit_breaker
+        adaptive = self.adaptive_timeouts if not stream else None
+        endpoint = endpoint_class(longurl) if breaker is not None or adaptive is not None else None
+        if breaker is not None:
+            circuit_state = self._check_circuit(breaker, endpoint)
+        if adaptive is not None:
+            points = getattr(self._local, 'points', 0)
+            request_timeout = adaptive.timeout(endpoint, points, self.timeout, max(0, RETRY_COUNT - retries))
+        else:
+            request_timeout = self.timeout
         timeout = None
-        try:
-            res = self._session.request(method=req_type, url=longurl, data=databytes,
-                                        headers=headers, auth=authval, stream=stream, timeout=self.timeout)
-        except requests.exceptions.Timeout as e:
-            timeout = e
-            res = None
-        if (timeout is not None or (500 <= res.status_code < 600) or res.status_code == 408) and retries > 0:
+        hedged = self.hedger is not None and req_type == 'GET' and not stream
+        # The hedger takes a slot for each copy of the request it sends
+        with contextlib.nullcontext() if hedged else self._request_slot():
+            start = time.perf_counter()
+            with tracing.span('volue_insight_timeseries.attempt', {'http.method': req_type, 'http.url': longurl,
+                                                                   'vit.retries_left': retries}) as span:
+                def send():
+                    return self.transport.request(req_type, longurl, data=databytes, headers=headers, auth=authval,
+                                                  stream=stream, timeout=request_timeout)
+
+                try:
+                    if hedged:
+                        res, hedge_won = self.hedger.request(longurl, send, self._request_slot)
+                        if hedge_won is not None:
+                            span.set_attribute('vit.hedge_won', hedge_won)
+                            if self.metrics is not None:
+                                endpoint = endpoint_class(longurl)
+                                self.metrics.record_hedge(endpoint, hedge_won, self.hedger.delay(endpoint))
+                    else:
+                        res = send()
+                    span.set_attribute('http.status_code', res.status_code)
+                except requests.exceptions.Timeout as e:
+                    timeout = e
+                    res = None
+                    span.set_attribute('vit.timeout', True)
+                except Exception:
+                    if breaker is not None:
+                        self._record_circuit(breaker, endpoint, False, None)
+                    raise
+        elapsed = time.perf_counter() - start
+        if stats is not None:
+            stats.add_attempt(res, elapsed, stream)
+        ok = timeout is None and res.status_code < 500 and res.status_code != 408
+        retry = (timeout is not None or (500 <= res.status_code < 600) or res.status_code == 408) and retries > 0
+        # A request counts as one failure once its retries are used up, but
+        # a failed probe of a half open circuit opens it again at once
+        if breaker is not None and (not retry or circuit_state == circuit.HALF_OPEN):
+            self._record_circuit(breaker, endpoint, ok, elapsed)
+        if adaptive is not None and ok:
+            adaptive.record(endpoint, elapsed, points)
+        if retry:
             if RETRY_DELAY > 0:
                 time.sleep(RETRY_DELAY)
             return self.send_data_request(req_type, urlbase, url, data, rawdata, headers, authval, stream, retries-1)
@@ -496,11 +1007,120 @@ class Session(object):
 
     def data_request(self, req_type, urlbase, url, data=None, rawdata=None, authval=None,
                      stream=False, retries=RETRY_COUNT):
-        """Run a call to the backend, dealing with authentication etc."""
+        """Run a call to the backend, dealing with authentication etc.
+
+        A GET request to an endpoint returning a list (a search for curves
+        or instances, or the data of tagged curves) with a url longer than
+        ``max_url_length`` (e.g. for many names or issue dates) is split
+        into several requests, which are run concurrently, and the lists in
+        their responses are joined in order into one response.
+        """
+        if (req_type == 'GET' and not stream and url and self.max_url_length
+                and _LIST_PATHS.search(urlsplit(url).path)):
+            prefix = len(urljoin(urlbase or self.urlbase, url)) - len(url)
+            urls = util.split_url(url, self.max_url_length - prefix)
+            if urls is not None:
+                return self._split_request(urlbase, url, urls, authval, retries)
+        if tracing.enabled():
+            with tracing.span('volue_insight_timeseries.data_request',
+                              {'http.method': req_type, 'http.url': urljoin(urlbase or self.urlbase, url)}) as span:
+                res = self._data_request(req_type, urlbase, url, data, rawdata, authval, stream, retries)
+                span.set_attribute('http.status_code', res.status_code)
+                return res
+        return self._data_request(req_type, urlbase, url, data, rawdata, authval, stream, retries)
+
+    def _split_request(self, urlbase, url, urls, authval, retries):
+        def fetch(part):
+            return self.data_request('GET', urlbase, part, authval=authval, retries=retries)
+
+        merged = []
+        seen = set()
+        for response, error in bulk.run_concurrently(fetch, urls):
+            if error is not None:
+                raise error
+            if response.status_code == 204:
+                continue
+            if response.status_code != 200:
+                return response
+            result = response.json()
+            for item in result if isinstance(result, list) else [result]:
+                # The same curve or instance may be found by more than one part
+                if isinstance(item, dict):
+                    key = (item.get('id'), item.get('tag'), item.get('issue_date'))
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                merged.append(item)
+        return make_response(200, merged, {'Content-Type': 'application/json'},
+                             urljoin(urlbase or self.urlbase, url))
+
+    def _data_request(self, req_type, urlbase, url, data, rawdata, authval, stream, retries):
+        if self.request_hooks:
+            return self._measured_request(req_type, urlbase, url, data, rawdata, authval, stream, retries)
         headers = self._validate_auth(data, rawdata)
         res = self.send_data_request(req_type, urlbase, url, data, rawdata, headers, authval, stream, retries)
         return res
 
+    def _measured_request(self, req_type, urlbase, url, data, rawdata, authval, stream, retries):
+        # Fill in the stats opened by _measure if there is one, otherwise
+        # report this request on its own.
+        stats = getattr(self._local, 'pending', None)
+        owner = stats is None
+        if owner:
+            stats = RequestStats()
+        self._local.pending = None
+        stats.begin(req_type, urljoin(urlbase or self.urlbase, url))
+        session_metrics = self.metrics
+        if session_metrics is not None:
+            session_metrics.in_flight.inc()
+        start = time.perf_counter()
+        try:
+            headers = self._validate_auth(data, rawdata)
+            stats.auth = time.perf_counter() - start
+            self._local.stats = stats
+            try:
+                return self.send_data_request(req_type, urlbase, url, data, rawdata, headers, authval, stream,
+                                              retries)
+            finally:
+                self._local.stats = None
+        except Exception as e:
+            stats.error = repr(e)
+            raise
+        finally:
+            stats.total = time.perf_counter() - start
+            if session_metrics is not None:
+                session_metrics.in_flight.dec()
+            if owner:
+                self._report(stats)
+
+    @contextlib.contextmanager
+    def _measure(self):
+        """Collect stats for the request made within, so that the caller
+        can add decode and build times before they are reported.  Yields
+        None if there are no request hooks."""
+        if not self.request_hooks:
+            yield None
+            return
+        stats = RequestStats()
+        self._local.pending = stats
+        try:
+            yield stats
+        except Exception as e:
+            if stats.error is None:
+                stats.error = repr(e)
+            raise
+        finally:
+            self._local.pending = None
+            if stats.method is not None:
+                self._report(stats)
+
+    def _report(self, stats):
+        for hook in list(self.request_hooks):
+            try:
+                hook(stats)
+            except Exception as e:
+                warnings.warn('Request hook {!r} failed: {!r}'.format(hook, e), RuntimeWarning)
+
     def handle_single_curve_response(self, response):
         if not response.ok:
             raise MetadataException('Failed to load curve: {}'
@@ -0,0 +1,76 @@
+#
+# Adaptive timeouts: the connect and read timeouts of a request are derived
+# from the recent latencies of its endpoint class, scaled by the number of
+# points it is expected to return, instead of one long timeout for all.
+#
+
+from .instrument import LatencyTracker
+
+CONNECT_TIMEOUT = 5.0   # Seconds to set up a connection
+MIN_READ_TIMEOUT = 5.0  # Shortest read timeout, in seconds
+PERCENTILE = 0.99       # Latency percentile the read timeout is based on
+MULTIPLIER = 4.0        # Read timeout, as a multiple of the percentile
+MIN_SAMPLES = 20        # Latencies needed for an endpoint before adapting
+POINTS_UNIT = 10000     # Latencies are recorded per this many points
+
+
+def _units(points):
+    # Requests for up to POINTS_UNIT points count as one unit
+    if not points:
+        return 1.0
+    return max(1.0, points / POINTS_UNIT)
+
+
+class AdaptiveTimeouts:
+    """
+    Timeouts by endpoint class, see
+    :meth:`volue_insight_timeseries.session.Session.enable_adaptive_timeouts`.
+
+    The read timeout (the longest wait for data from the server) is
+    ``multiplier`` times the ``percentile`` of the recent latencies of the
+    endpoint class, per ``POINTS_UNIT`` points, times the number of units
+    the request is expected to return.  Each retry doubles it.  For
+    requests of unknown size (``points`` None) the default is used.
+
+    Parameters
+    ----------
+    connect: float
+        Connect timeout, in seconds.
+    percentile: float
+        Latency percentile (0-1) the read timeout is based on.
+    multiplier: float
+        Read timeout, as a multiple of the percentile.
+    min_read: float
+        Shortest read timeout, in seconds.
+    max_read: float, optional
+        Longest read timeout, in seconds.
+    min_samples: int
+        Number of latencies needed for an endpoint class before its
+        read timeout adapts; until then the default is used.
+    """
+    def __init__(self, connect=CONNECT_TIMEOUT, percentile=PERCENTILE, multiplier=MULTIPLIER,
+                 min_read=MIN_READ_TIMEOUT, max_read=None, min_samples=MIN_SAMPLES):
+        self.connect = connect
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_read = min_read
+        self.max_read = max_read
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker()
+
+    def record(self, endpoint, seconds, points=0):
+        """Record the latency of a request returning about ``points`` points"""
+        if points is None:
+            return  # Cannot be compared with the others
+        self.latencies.record(endpoint, seconds / _units(points))
+
+    def timeout(self, endpoint, points=0, default=None, attempt=0):
+        """The (connect, read) timeouts for a request to the endpoint class,
+        expected to return about ``points`` points"""
+        if points is None or self.latencies.count(endpoint) < self.min_samples:
+            return self.connect, default
+        read = self.multiplier * self.latencies.percentile(endpoint, self.percentile) * _units(points)
+        read = max(self.min_read, read) * 2 ** attempt
+        if self.max_read is not None:
+            read = min(self.max_read, read)
+        return self.connect, read
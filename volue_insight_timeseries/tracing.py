@@ -0,0 +1,109 @@
+#
+# Optional tracing of API calls.
+#
+# If the opentelemetry package is installed, spans are created for requests,
+# retries, authentication, curve calls and TS conversion, using the globally
+# configured tracer provider.  Without it, the functions here do nothing, and
+# opentelemetry is never imported unless a span is requested.
+#
+
+import functools
+
+_UNSET = object()
+_tracer = _UNSET
+
+
+class _NoSpan:
+    """Stands in for a span when tracing is disabled"""
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def get_tracer():
+    """The tracer used for spans, or None if tracing is disabled"""
+    global _tracer
+    if _tracer is _UNSET:
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            _tracer = None
+        else:
+            _tracer = trace.get_tracer('volue_insight_timeseries')
+    return _tracer
+
+
+def set_tracer(tracer):
+    """Use this tracer for spans (anything with an opentelemetry-style
+    ``start_as_current_span`` method), or disable tracing with None"""
+    global _tracer
+    _tracer = tracer
+
+
+def enabled():
+    return get_tracer() is not None
+
+
+def span(name, attributes=None):
+    """Context manager for a span, yielding an object with ``set_attribute``"""
+    tracer = get_tracer()
+    if tracer is None:
+        return _NO_SPAN
+    return tracer.start_as_current_span(name, attributes=attributes)
+
+
+def count_points(result):
+    """Number of points in a TS, or a list of them"""
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return sum(count_points(r) for r in result)
+    if getattr(result, 'loaded', True) is False:
+        return 0  # A lazy series, counting would fetch the points
+    return getattr(result, 'size', 0)
+
+
+def traced_curve_call(func):
+    """Trace a curve method, recording the curve and the size of the result"""
+    name = 'volue_insight_timeseries.{}'.format(func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if get_tracer() is None:
+            return func(self, *args, **kwargs)
+        attributes = {
+            'vit.curve.id': self.id,
+            'vit.curve.name': getattr(self, 'name', ''),
+            'vit.curve.type': getattr(self, 'curve_type', ''),
+        }
+        with span(name, attributes) as s:
+            result = func(self, *args, **kwargs)
+            s.set_attribute('vit.points', count_points(result))
+            response = getattr(self, '_last_response', None)
+            if response is not None:
+                s.set_attribute('vit.bytes', len(response.content or b''))
+            return result
+    return wrapper
+
+
+def traced_conversion(func):
+    """Trace a conversion between TS and pandas, recording the number of points"""
+    name = 'volue_insight_timeseries.{}'.format(func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if get_tracer() is None:
+            return func(*args, **kwargs)
+        with span(name) as s:
+            result = func(*args, **kwargs)
+            s.set_attribute('vit.points', count_points(result))
+            return result
+    return wrapper
@@ -0,0 +1,194 @@
+#
+# Transports used by the session to send HTTP requests.
+#
+# The session talks to the API through a transport object, which makes it
+# possible to swap in another HTTP client, an in-process fake (no sockets),
+# or a cassette recording real responses for later replay.
+#
+
+import base64
+import importlib
+import io
+import json
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class TransportException(Exception):
+    pass
+
+
+class Transport:
+    """
+    Interface for sending requests on behalf of a
+    :class:`volue_insight_timeseries.session.Session`.
+
+    ``request`` takes the same arguments as :meth:`requests.Session.request`
+    and must return a :class:`requests.Response` (or an object behaving like
+    one), or raise :class:`requests.exceptions.Timeout` on timeouts.
+    """
+    def request(self, method, url, data=None, headers=None, auth=None, stream=False, timeout=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(Transport):
+    """Send requests using a :class:`requests.Session` (the default)"""
+    def __init__(self, session=None):
+        if session is None:
+            session = requests.Session()
+        self.session = session
+
+    def request(self, method, url, data=None, headers=None, auth=None, stream=False, timeout=None):
+        return self.session.request(method=method, url=url, data=data, headers=headers, auth=auth,
+                                    stream=stream, timeout=timeout)
+
+    def close(self):
+        self.session.close()
+
+
+def make_response(status_code, content=b'', headers=None, url=None):
+    """Build a :class:`requests.Response` without a network connection"""
+    if isinstance(content, str):
+        content = content.encode()
+    elif not isinstance(content, bytes):
+        content = json.dumps(content).encode()
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response._content_consumed = True
+    response.raw = io.BytesIO(content)
+    response.headers = CaseInsensitiveDict(headers or {})
+    response.url = url
+    response.encoding = 'utf-8'
+    return response
+
+
+class FakeTransport(Transport):
+    """
+    In-process transport, calling ``handler(method, url, data, headers)``
+    instead of sending anything over the network.
+
+    The handler returns either a response, or a tuple of
+    ``(status_code, content)`` or ``(status_code, content, headers)``, where
+    content may be bytes, a string or a json-serializable object.
+    """
+    def __init__(self, handler):
+        self.handler = handler
+
+    def request(self, method, url, data=None, headers=None, auth=None, stream=False, timeout=None):
+        res = self.handler(method, url, data, headers)
+        if isinstance(res, tuple):
+            res = make_response(*res, url=url)
+        return res
+
+
+def _cassette_key(method, url):
+    # Ignore scheme and host, so a cassette can be replayed against any urlbase
+    parts = urlsplit(url)
+    path = parts.path
+    if parts.query:
+        path = '{}?{}'.format(path, parts.query)
+    return '{} {}'.format(method.upper(), path)
+
+
+def _encode_body(content):
+    try:
+        return {'text': content.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'base64': base64.b64encode(content).decode('ascii')}
+
+
+def _decode_body(body):
+    if 'base64' in body:
+        return base64.b64decode(body['base64'])
+    return body['text'].encode('utf-8')
+
+
+class RecordingTransport(Transport):
+    """
+    Record the responses from another transport (by default a
+    :class:`RequestsTransport`) into a cassette file, for replay with
+    :class:`ReplayTransport`.  Streaming (event) requests are passed through
+    without being recorded.  The cassette is written by :meth:`save` (and
+    :meth:`close`).
+    """
+    def __init__(self, path, transport=None):
+        self.path = path
+        self.transport = transport if transport is not None else RequestsTransport()
+        self.interactions = []
+        self._lock = threading.Lock()
+
+    def request(self, method, url, data=None, headers=None, auth=None, stream=False, timeout=None):
+        res = self.transport.request(method, url, data=data, headers=headers, auth=auth, stream=stream,
+                                     timeout=timeout)
+        if not stream:
+            interaction = {
+                'request': _cassette_key(method, url),
+                'status_code': res.status_code,
+                'headers': dict(res.headers),
+                'body': _encode_body(res.content),
+            }
+            with self._lock:
+                self.interactions.append(interaction)
+        return res
+
+    def save(self):
+        with self._lock:
+            cassette = {'interactions': list(self.interactions)}
+        with open(self.path, 'wt') as f:
+            json.dump(cassette, f)
+
+    def close(self):
+        self.save()
+        self.transport.close()
+
+
+class ReplayTransport(Transport):
+    """
+    Replay the responses recorded in a cassette file, without any network
+    access.  Requests are matched on method, path and query.  Responses to
+    repeated requests are replayed in the order recorded; once used up, the
+    last one is repeated.  A request not in the cassette raises
+    :class:`TransportException`.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rt') as f:
+            cassette = json.load(f)
+        self._responses = {}
+        for interaction in cassette['interactions']:
+            self._responses.setdefault(interaction['request'], []).append(interaction)
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, data=None, headers=None, auth=None, stream=False, timeout=None):
+        key = _cassette_key(method, url)
+        with self._lock:
+            if key not in self._responses:
+                raise TransportException('Request not found in cassette {}: {}'.format(self.path, key))
+            responses = self._responses[key]
+            n = self._next.get(key, 0)
+            self._next[key] = n + 1
+            interaction = responses[min(n, len(responses) - 1)]
+        return make_response(interaction['status_code'], _decode_body(interaction['body']),
+                             headers=interaction['headers'], url=url)
+
+
+def load_transport(spec):
+    """
+    Create a transport from a configuration value, either ``requests`` or
+    ``package.module:ClassName`` for a transport class taking no arguments.
+    """
+    if spec == 'requests':
+        return RequestsTransport()
+    module_name, sep, class_name = spec.partition(':')
+    if not sep:
+        raise TransportException('Transport must be "requests" or "module:Class", not {}'.format(spec))
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)()
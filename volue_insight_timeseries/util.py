@@ -3,19 +3,20 @@
 # the data from the backend
 #
 
+# pandas, numpy and dateutil are slow to import, and are only imported when
+# they are needed, so that only fetching data is fast to start up.
+#
+
 import calendar
+import collections
+import copy
 import datetime
-import dateutil.parser
-import pandas as pd
-import numpy as np
+import functools
 import warnings
-from past.types import basestring
-try:
-    from urllib.parse import quote_plus
-except ImportError:
-    from urllib import quote_plus
-from zoneinfo import ZoneInfo
-from zoneinfo._common import ZoneInfoNotFoundError
+from urllib.parse import quote_plus
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from . import tracing
 
 
 # Curve types
@@ -35,6 +36,7 @@ _TS_FREQ_TABLE = {
     'H12': '12h',
     'H6': '6h',
     'H3': '3h',
+    'H': 'h',
     'MIN30': '30min',
     'MIN15': '15min',
     'MIN5': '5min',
@@ -69,6 +71,11 @@ class CurveException(Exception):
 class TS(object):
     """
     A class to hold a basic time series.
+
+    The points are normally a list of [timestamp, value] pairs.  A series on
+    a regular grid can instead be stored in compact form (see
+    :meth:`compact`), as the first timestamp and an array of values, and the
+    points are then only made when they are used.
     """
     def __init__(self, id=None, name=None, frequency=None, time_zone=None, tag=None, issue_date=None,
                  curve_type=None, points=None, input_dict=None):
@@ -99,10 +106,114 @@ class TS(object):
 
     def __str__(self):
         size = ''
-        if self.points:
-            size = ' size: {}'.format(len(self.points))
+        if self.size:
+            size = ' size: {}'.format(self.size)
         return 'TS: {}{}'.format(self.fullname, size)
 
+    @property
+    def points(self):
+        if self._points is None and self._values is not None:
+            # The points replace the compact form, so that changes to them
+            # are not hidden by the values array
+            times = self.times.tolist()
+            self.points = [[t, None if v != v else v] for t, v in zip(times, self._values.tolist())]
+        return self._points
+
+    @points.setter
+    def points(self, points):
+        self._points = points
+        self._start = None
+        self._values = None
+
+    @property
+    def is_compact(self):
+        """True if the series is stored in compact form"""
+        return self._values is not None
+
+    @property
+    def size(self):
+        """Number of points in the series"""
+        if self._values is not None:
+            return len(self._values)
+        return len(self._points) if self._points is not None else 0
+
+    @property
+    def times(self):
+        """The timestamps of the points (epoch ms), as a numpy.ndarray"""
+        if self._values is not None:
+            return _grid_times(self._start, len(self._values), self.frequency, self.tz)
+        return _ts_arrays(self)[0]
+
+    @property
+    def values(self):
+        """The values of the points (NaN for missing values), as a
+        numpy.ndarray"""
+        if self._values is not None:
+            return self._values
+        return _ts_arrays(self)[1]
+
+    def compact(self):
+        """ Get the series in compact form
+
+        A compact series stores only the first timestamp and an array of the
+        values, which uses much less memory than the list of points, and can
+        be sliced in time with :meth:`slice` without searching.  The
+        ``points`` are made from these on first use, and then replace the
+        compact form.
+
+        Returns
+        -------
+        :class:`volue_insight_timeseries.util.TS` object
+            self if it is already compact, otherwise a compact copy.
+
+        Raises
+        ------
+        CurveException
+            If the points are not on a regular grid of the frequency.
+        """
+        import numpy as np
+
+        if self._values is not None:
+            return self
+        times, values = _ts_arrays(self)
+        start = int(times[0]) if len(times) else 0
+        if not np.array_equal(times, _grid_times(start, len(times), self.frequency, self.tz)):
+            raise CurveException('Points are not on a regular {} grid'.format(self.frequency))
+        return self._with_values(start, values)
+
+    def slice(self, data_from=None, data_to=None):
+        """ Get the part of the series from data_from (inclusive) to data_to
+        (exclusive)
+
+        The result is a compact series sharing the values with this one.
+
+        Parameters
+        ----------
+        data_from: time-stamp, optional
+            start date, as epoch ms, a date string or a datetime object.
+        data_to: time-stamp, optional
+            end date, as epoch ms, a date string or a datetime object.
+        Returns
+        -------
+        :class:`volue_insight_timeseries.util.TS` object
+        """
+        ts = self.compact()
+        begin = 0 if data_from is None else _grid_position(ts, _as_epoch_ms(data_from, self.tz))
+        end = ts.size if data_to is None else _grid_position(ts, _as_epoch_ms(data_to, self.tz))
+        end = max(begin, end)
+        if begin < ts.size:
+            start = int(_grid_times(ts._start, begin + 1, ts.frequency, ts.tz)[begin])
+        else:
+            start = ts._start
+        return ts._with_values(start, ts._values[begin:end])
+
+    def _with_values(self, start, values):
+        ts = copy.copy(self)
+        ts._points = None
+        ts._start = start
+        ts._values = values
+        return ts
+
     @property
     def fullname(self):
         attrs = []
@@ -118,6 +229,7 @@ class TS(object):
             attrs.append(str(self.issue_date))
         return ' '.join(attrs)
 
+    @tracing.traced_conversion
     def to_pandas(self, name=None):
         """ Converting :class:`volue_insight_timeseries.util.TS` object
         to a pandas.Series object
@@ -131,10 +243,21 @@ class TS(object):
         -------
         pandas.Series
         """
+        import pandas as pd
+
         if name is None:
             name = self.fullname
-        if self.points is None or len(self.points) == 0:
+        if self.size == 0:
             return pd.Series(name=name, dtype='float64')
+        if self._values is not None:
+            index = _make_index(self.times, self.tz, self.frequency)
+            return pd.Series(self._values, index=index, name=name, copy=True)
+
+        # Points on the regular grid share a cached index, and need no asfreq
+        times, _ = _ts_arrays(self)
+        index = _grid_index(times, self.tz, self.frequency)
+        if index is not None:
+            return pd.Series([row[1] for row in self.points], index=index, name=name)
 
         index = []
         values = []
@@ -148,7 +271,10 @@ class TS(object):
         return res.asfreq(self._map_freq(self.frequency))
 
     @staticmethod
+    @tracing.traced_conversion
     def from_pandas(pd_series):
+        import numpy as np
+
         # Clean up some of the more common Pandas/api problems
         pd_series = pd_series.astype(np.float64)
         pd_series.replace({np.nan: None}, inplace=True)
@@ -200,8 +326,14 @@ class TS(object):
         -------
         :class:`volue_insight_timeseries.util.TS` object
         """
-        df = _ts_list_to_dataframe(ts_list)
-        return _generated_series_to_TS(df.sum(axis=1), name)
+        import numpy as np
+
+        times, columns = _align_ts_list(ts_list)
+        total = np.zeros(len(times))
+        for positions, values in columns:
+            valid = ~np.isnan(values)
+            total[positions[valid]] += values[valid]
+        return _aggregated_TS(ts_list, name, times, total)
 
     @staticmethod
     def mean(ts_list, name):
@@ -220,8 +352,9 @@ class TS(object):
         -------
         :class:`volue_insight_timeseries.util.TS` object
         """
-        df = _ts_list_to_dataframe(ts_list)
-        return _generated_series_to_TS(df.mean(axis=1), name)
+        times, columns = _align_ts_list(ts_list)
+        mean, _ = _mean_and_count(len(times), columns)
+        return _aggregated_TS(ts_list, name, times, mean)
 
     @staticmethod
     def median(ts_list, name):
@@ -240,21 +373,304 @@ class TS(object):
         -------
         :class:`volue_insight_timeseries.util.TS` object
         """
-        df = _ts_list_to_dataframe(ts_list)
-        return _generated_series_to_TS(df.median(axis=1), name)
+        return TS.quantile(ts_list, 0.5, name)
+
+    @staticmethod
+    def quantile(ts_list, q, name):
+        """ calculate a quantile of a given list of TS objects
+
+        Returns a TS (:class:`volue_insight_timeseries.util.TS`) object that is
+        the ``q`` quantile of a list of TS objects with the given name,
+        interpolating linearly between values like pandas.DataFrame.quantile.
+
+        Parameters
+        ----------
+        ts_list: list
+            list of TS objects
+        q: float
+            The quantile, between 0 and 1.
+        name: str
+            Name of the returned TS object.
+        Returns
+        -------
+        :class:`volue_insight_timeseries.util.TS` object
+        """
+        import numpy as np
+
+        if not 0 <= q <= 1:
+            raise ValueError('Quantile must be between 0 and 1')
+        times, values = _aligned_values(ts_list)
+        with warnings.catch_warnings():
+            # All-NaN rows give NaN, which is what we want
+            warnings.simplefilter('ignore', RuntimeWarning)
+            result = np.nanquantile(values, q, axis=1)
+        return _aggregated_TS(ts_list, name, times, result)
+
+    @staticmethod
+    def std(ts_list, name):
+        """ calculate the standard deviation of a given list of TS objects
+
+        Returns a TS (:class:`volue_insight_timeseries.util.TS`) object that is
+        the sample standard deviation (like pandas.DataFrame.std) of a list of
+        TS objects with the given name.
+
+        Parameters
+        ----------
+        ts_list: list
+            list of TS objects
+        name: str
+            Name of the returned TS object.
+        Returns
+        -------
+        :class:`volue_insight_timeseries.util.TS` object
+        """
+        import numpy as np
+
+        times, columns = _align_ts_list(ts_list)
+        mean, count = _mean_and_count(len(times), columns)
+        squares = np.zeros(len(times))
+        for positions, values in columns:
+            valid = ~np.isnan(values)
+            pos = positions[valid]
+            squares[pos] += (values[valid] - mean[pos]) ** 2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = np.sqrt(squares / (count - 1))
+        result[count < 2] = np.nan
+        return _aggregated_TS(ts_list, name, times, result)
+
+
+class LazyTS(TS):
+    """
+    A :class:`TS` with the metadata of a series, whose points are fetched
+    the first time they are used (through ``points``, ``values``,
+    :meth:`~TS.to_pandas` etc.).  The fetching is done by the ``loader``,
+    which may fetch many series in one request, see
+    :meth:`volue_insight_timeseries.curves.InstanceCurve.search_instances`.
+    """
+    def __init__(self, ts, loader):
+        self.__dict__.update(ts.__dict__)
+        self._loader = loader
+        self._loaded = False
+
+    def __str__(self):
+        if not self._loaded:
+            return 'TS: {} (not loaded)'.format(self.fullname)
+        return super().__str__()
+
+    @property
+    def loaded(self):
+        """True if the points have been fetched"""
+        return self._loaded
+
+    def load(self):
+        """Fetch the points now, if not already done"""
+        if not self._loaded:
+            self._loader.load(self)
+        return self
+
+    def _set_data(self, ts):
+        # Called by the loader with the series with data, or None if it has
+        # no data.  Aggregations and time zone arguments may have changed
+        # the frequency and time zone.
+        if ts is None:
+            self.points = []
+        else:
+            self.__dict__.update(ts.__dict__)
+        self._loaded = True
+
+    @property
+    def points(self):
+        self.load()
+        return TS.points.fget(self)
+
+    @points.setter
+    def points(self, points):
+        TS.points.fset(self, points)
+        self._loaded = True
+
+    @property
+    def is_compact(self):
+        self.load()
+        return TS.is_compact.fget(self)
 
+    @property
+    def size(self):
+        self.load()
+        return TS.size.fget(self)
+
+    @property
+    def times(self):
+        self.load()
+        return TS.times.fget(self)
+
+    @property
+    def values(self):
+        self.load()
+        return TS.values.fget(self)
+
+    def compact(self):
+        self.load()
+        return super().compact()
+
+
+#
+# Aggregation of many series
+#
+# The series are aligned by placing their values directly in NumPy buffers
+# on a common time axis (epoch ms), instead of converting each of them to a
+# pandas.Series and joining those.
+#
+
+# Frequencies stepped by a fixed number of milliseconds.  The multi-hour
+# ones are fixed durations also over DST changes (e.g. 00:00+01:00 is followed
+# by 04:00+02:00 in CET), like the pandas frequencies used by TS.to_pandas.
+_FIXED_STEP_MS = {
+    'MIN': 60000,
+    'MIN5': 300000,
+    'MIN15': 900000,
+    'MIN30': 1800000,
+    'H': 3600000,
+    'H3': 10800000,
+    'H6': 21600000,
+    'H12': 43200000,
+}
+
+
+def _regular_grid(start, end, frequency, tz):
+    """
+    Timestamps (epoch ms) of a regular series with the given frequency from
+    start to end, and the step in ms if it is fixed.  Returns (None, None) if
+    start and end are not on such a series.
+    """
+    import numpy as np
+
+    step = _FIXED_STEP_MS.get(frequency.upper())
+    if step is not None:
+        if (end - start) % step:
+            return None, None
+        return np.arange(start, end + 1, step, dtype=np.int64), step
 
-def _generated_series_to_TS(series, name):
-    series.name = name
-    return TS.from_pandas(series)
+    import pandas as pd
 
+    first = pd.Timestamp(start, unit='ms', tz='UTC').tz_convert(tz)
+    last = pd.Timestamp(end, unit='ms', tz='UTC').tz_convert(tz)
+    try:
+        index = pd.date_range(first, last, freq=TS._map_freq(frequency))
+    except ValueError:
+        return None, None
+    grid = _index_to_ms(index)
+    if len(grid) == 0 or grid[0] != start or grid[-1] != end:
+        return None, None
+    return grid, None
+
+
+def _grid_positions(grid, step, times):
+    import numpy as np
+
+    if step is not None:
+        offsets = times - grid[0]
+        if np.any(offsets % step):
+            return None
+        return offsets // step
+    positions = np.searchsorted(grid, times)
+    if np.any(positions >= len(grid)) or np.any(grid[positions] != times):
+        return None
+    return positions
 
-def _ts_list_to_dataframe(ts_list):
-    pd_list = []
-    for ts in ts_list:
-        pd_list.append(ts.to_pandas())
 
-    return pd.concat(pd_list, axis=1)
+def _align_ts_list(ts_list):
+    """
+    Align a list of TS on a common time axis.
+
+    Returns the timestamps (a sorted int64 array of epoch ms) and for each TS
+    a pair of arrays: the positions of its points in the timestamps and the
+    values (NaN for missing values).  Series with the same frequency are
+    placed on the regular series covering all of them, with missing values
+    in the gaps (like :meth:`TS.to_pandas` does for a single series).
+    Otherwise the timestamps are the union of the timestamps of all points.
+    """
+    import numpy as np
+
+    arrays = [_ts_arrays(ts) for ts in ts_list]
+    times = [t for t, v in arrays]
+    present = [t for t in times if len(t)]
+    if not present:
+        return np.empty(0, dtype=np.int64), arrays
+
+    grid = positions = None
+    frequencies = {ts.frequency.upper() for ts, t in zip(ts_list, times) if len(t)}
+    if len(frequencies) == 1:
+        start = min(t.min() for t in present)
+        end = max(t.max() for t in present)
+        grid, step = _regular_grid(int(start), int(end), frequencies.pop(), ts_list[0].tz)
+        if grid is not None:
+            positions = [_grid_positions(grid, step, t) for t in times]
+            if any(p is None for p in positions):
+                grid = None
+    if grid is None:
+        grid = np.unique(np.concatenate(present))
+        positions = [np.searchsorted(grid, t) for t in times]
+    return grid, [(p, v) for p, (t, v) in zip(positions, arrays)]
+
+
+def _ts_arrays(ts):
+    """The timestamps and values of a TS as numpy arrays"""
+    import numpy as np
+
+    if ts.is_compact:
+        return ts.times, ts.values
+    a = np.array(ts.points or [], dtype=np.float64).reshape(-1, 2)
+    if ts.points and a.shape[0] != len(ts.points):
+        raise ValueError('Points have unexpected contents')
+    return a[:, 0].astype(np.int64), a[:, 1]
+
+
+def _aligned_values(ts_list):
+    """The output of :func:`_align_ts_list` as one 2D array, with one column
+    per TS"""
+    import numpy as np
+
+    times, columns = _align_ts_list(ts_list)
+    values = np.full((len(times), len(columns)), np.nan)
+    for i, (positions, column) in enumerate(columns):
+        values[positions, i] = column
+    return times, values
+
+
+def _mean_and_count(length, columns):
+    import numpy as np
+
+    total = np.zeros(length)
+    count = np.zeros(length)
+    for positions, values in columns:
+        valid = ~np.isnan(values)
+        total[positions[valid]] += values[valid]
+        count[positions[valid]] += 1
+    with np.errstate(invalid='ignore'):
+        return total / count, count
+
+
+# Frequencies from the finest to the coarsest
+_FREQUENCY_ORDER = ['MIN', 'MIN5', 'MIN15', 'MIN30', 'H', 'H3', 'H6', 'H12', 'D', 'W', 'M', 'Q', 'S', 'Y']
+
+
+def _finest_frequency(ts_list):
+    """The finest frequency of the TS in the list, or that of the first TS
+    if they are not all known"""
+    if any(ts.frequency.upper() not in _FREQUENCY_ORDER for ts in ts_list):
+        return ts_list[0].frequency
+    return min(ts_list, key=lambda ts: _FREQUENCY_ORDER.index(ts.frequency.upper())).frequency
+
+
+def _aggregated_TS(ts_list, name, times, values):
+    """Make a TS of an aggregation, with the finest frequency of the TS in
+    the list (the points of all are kept) and the time zone of the first"""
+    first = ts_list[0]
+    frequency = _finest_frequency(ts_list)
+    points = [[t, None if v != v else v] for t, v in zip(times.tolist(), values.tolist())]
+    if is_integer(name):
+        return TS(id=int(name), frequency=frequency, time_zone=first.time_zone, points=points)
+    return TS(name=name, frequency=frequency, time_zone=first.time_zone, points=points)
 
 
 def tags_to_DF(tagged_list):
@@ -262,7 +678,178 @@ def tags_to_DF(tagged_list):
     Given a list of tagged series/instances, create a DataFrame with the tag of
     each as column name
     """
-    return pd.DataFrame({s.tag: s.to_pandas() for s in tagged_list})
+    import pandas as pd
+
+    # Like a dict, the last series wins if a tag is repeated
+    by_tag = {s.tag: s for s in tagged_list}
+    if not by_tag:
+        return pd.DataFrame()
+    series = list(by_tag.values())
+    times, values = _aligned_values(series)
+    first = series[0]
+    return points_to_frame(times, values, list(by_tag), first.tz, first.frequency)
+
+
+def align_points(point_lists):
+    """
+    Align lists of [timestamp, value] points on the union of their
+    timestamps.  Returns a sorted int64 array of the timestamps (epoch ms),
+    and a 2D float array with one column per list, NaN where a list has no
+    value.
+    """
+    import numpy as np
+
+    arrays = [np.array(points, dtype=np.float64).reshape(-1, 2) for points in point_lists]
+    if arrays:
+        times = np.unique(np.concatenate([a[:, 0] for a in arrays])).astype(np.int64)
+    else:
+        times = np.empty(0, dtype=np.int64)
+    values = np.full((len(times), len(arrays)), np.nan)
+    for i, a in enumerate(arrays):
+        values[np.searchsorted(times, a[:, 0].astype(np.int64)), i] = a[:, 1]
+    return times, values
+
+
+def points_to_frame(times, values, columns, tz, frequency=None):
+    """
+    Make a pandas.DataFrame from the output of :func:`align_points`, with
+    the index in time zone ``tz``
+    """
+    import pandas as pd
+
+    return pd.DataFrame(values, index=_make_index(times, tz, frequency), columns=columns)
+
+
+def _make_index(times, tz, frequency=None):
+    import pandas as pd
+
+    if frequency is not None:
+        index = _grid_index(times, tz, frequency)
+        if index is not None:
+            return index
+    return pd.to_datetime(times, unit='ms', utc=True).tz_convert(tz)
+
+
+def _grid_index(times, tz, frequency):
+    """The shared index from :func:`_regular_index` if the timestamps are on
+    the regular grid of frequency, otherwise None"""
+    import numpy as np
+
+    if len(times) == 0:
+        return None
+    start = int(times[0])
+    try:
+        on_grid = np.array_equal(times, _grid_times(start, len(times), frequency, tz))
+    except CurveException:
+        return None  # Not one of our frequencies
+    index = _regular_index(start, len(times), frequency, tz) if on_grid else None
+    # A view shares the data (and identity) but not the name, which can be set
+    return index.view() if index is not None else None
+
+
+@functools.lru_cache(maxsize=128)
+def _regular_index(start, length, frequency, tz):
+    """
+    A pandas.DatetimeIndex of ``length`` points of frequency from ``start``
+    (epoch ms), or None if pandas does not agree with our grid.
+
+    The indexes are cached and shared, so that converting many series with
+    the same span (e.g. tags or instances) builds the index once, and pandas
+    can use its fast paths for identical indexes when combining them.
+    Indexes are immutable, so sharing them is safe.
+    """
+    import pandas as pd
+
+    first = datetime.datetime.fromtimestamp(start / 1000.0, tz)
+    index = pd.date_range(first, periods=length, freq=TS._map_freq(frequency))
+    if not (_index_to_ms(index) == _grid_times(start, length, frequency, tz)).all():
+        return None
+    return index
+
+
+def _index_to_ms(index):
+    """Timestamps (epoch ms) of a timezone aware pandas.DatetimeIndex"""
+    import numpy as np
+    import pandas as pd
+
+    return ((index - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(milliseconds=1)).to_numpy(np.int64)
+
+
+#
+# Regular grids
+#
+# A compact TS stores only the first timestamp of the grid.  For frequencies
+# of fixed length the timestamps are found by arithmetic, for calendar
+# frequencies (and days/weeks, which vary in length over DST changes) from a
+# cached table of the timestamps.
+#
+
+# Length of the calendar frequencies, in (months, days)
+_CALENDAR_STEPS = {
+    'Y': (12, 0),
+    'S': (6, 0),
+    'Q': (3, 0),
+    'M': (1, 0),
+    'W': (0, 7),
+    'D': (0, 1),
+}
+
+
+def _grid_times(start, length, frequency, tz):
+    """Timestamps (epoch ms) of ``length`` points on the grid of frequency
+    starting at ``start``, as a read-only numpy.ndarray"""
+    import numpy as np
+
+    step = _FIXED_STEP_MS.get(frequency.upper())
+    if step is not None:
+        times = np.arange(start, start + length * step, step, dtype=np.int64)[:length]
+        times.setflags(write=False)
+        return times
+    return _calendar_times(start, length, frequency.upper(), tz)
+
+
+@functools.lru_cache(maxsize=256)
+def _calendar_times(start, length, frequency, tz):
+    import numpy as np
+
+    if frequency not in _CALENDAR_STEPS:
+        raise CurveException('Frequency is not supported: {}'.format(frequency))
+    months, days = _CALENDAR_STEPS[frequency]
+    first = datetime.datetime.fromtimestamp(start / 1000.0, tz)
+    times = np.empty(length, dtype=np.int64)
+    for i in range(length):
+        month = first.month - 1 + i * months
+        d = datetime.datetime(first.year + month // 12, month % 12 + 1, 1, first.hour, first.minute,
+                              first.second, tzinfo=tz)
+        d = d.replace(day=min(first.day, calendar.monthrange(d.year, d.month)[1]))
+        if days:
+            d = d + datetime.timedelta(days=i * days)
+        times[i] = int(d.timestamp() * 1000)
+    times.setflags(write=False)
+    return times
+
+
+def _grid_position(ts, timestamp):
+    """Index of the first point of a compact TS at or after timestamp"""
+    import numpy as np
+
+    length = len(ts._values)
+    step = _FIXED_STEP_MS.get(ts.frequency.upper())
+    if step is not None:
+        return min(max(-((ts._start - timestamp) // step), 0), length)
+    return int(np.searchsorted(_grid_times(ts._start, length, ts.frequency, ts.tz), timestamp))
+
+
+def _as_epoch_ms(value, tz):
+    if isinstance(value, str):
+        value = parsetime(value, tz)
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=tz)
+        return int(value.timestamp() * 1000)
+    if isinstance(value, datetime.date):
+        return int(datetime.datetime(value.year, value.month, value.day, tzinfo=tz).timestamp() * 1000)
+    return int(value)
 
 
 #
@@ -275,7 +862,13 @@ def parsetime(datestr, tz=None):
     Parse the input date and optionally convert to correct time zone
     """
 
-    d = dateutil.parser.parse(datestr)
+    # Fast path for the ISO 8601 format used by the API, falling back to the
+    # much slower, but more lenient, dateutil parser.
+    try:
+        d = datetime.datetime.fromisoformat(datestr)
+    except (ValueError, TypeError):
+        import dateutil.parser
+        d = dateutil.parser.parse(datestr)
 
     if tz is not None:
         if not isinstance(tz, datetime.tzinfo):
@@ -289,7 +882,7 @@ def parsetime(datestr, tz=None):
     else:
         # If datestr does not have tzinfo and no tz given, assume CET
         if d.tzinfo is None:
-            d = d.replace(tzinfo=ZoneInfo("CET"))
+            d = d.replace(tzinfo=parse_tz('CET'))
     return d
 
 
@@ -319,6 +912,7 @@ _tzmap = {
 }
 
 
+@functools.lru_cache(maxsize=None)
 def parse_tz(time_zone):
     try:
         if time_zone in _tzmap:
@@ -347,8 +941,75 @@ def is_integer(s):
         return False
 
 
+def expected_points(first, last, frequency, tz=None):
+    """Approximate number of points of the given frequency from ``first``
+    to ``last`` (time-stamps as in the API arguments), or None if the
+    frequency is not known or the time-stamps cannot be parsed"""
+    frequency = frequency.upper()
+    step = _FIXED_STEP_MS.get(frequency)
+    if step is None:
+        if frequency not in _CALENDAR_STEPS:
+            return None
+        months, days = _CALENDAR_STEPS[frequency]
+        step = (months * 30.44 + days) * 86400000
+    try:
+        span = parsetime(str(last), tz) - parsetime(str(first), tz)
+    except (ValueError, OverflowError):
+        return None
+    return max(0, int(span.total_seconds() * 1000 // step))
+
+
+def group_by_length(lengths, max_length):
+    """
+    Split a sequence of lengths into consecutive groups with a total length
+    of at most max_length (but at least one item each).  Returns a list of
+    (start, end) index pairs.
+    """
+    groups = []
+    start = 0
+    total = 0
+    for i, length in enumerate(lengths):
+        if i > start and total + length > max_length:
+            groups.append((start, i))
+            start = i
+            total = 0
+        total += length
+    if start < len(lengths):
+        groups.append((start, len(lengths)))
+    return groups
+
+
+def split_url(url, max_length):
+    """
+    Split a url longer than max_length into several urls, by dividing the
+    values of the query parameter that is repeated most times (e.g. the
+    names in a search) between them.  Returns the urls in the order of the
+    values, or None if the url is short enough or cannot be split.
+    """
+    if len(url) <= max_length:
+        return None
+    path, sep, query = url.partition('?')
+    if not sep:
+        return None
+    pieces = query.split('&')
+    keys = [piece.partition('=')[0] for piece in pieces]
+    key, count = collections.Counter(keys).most_common(1)[0]
+    if count < 2:
+        return None
+    first = keys.index(key)
+    others = [piece for piece, k in zip(pieces, keys) if k != key]
+    values = [piece for piece, k in zip(pieces, keys) if k == key]
+
+    def make_url(group):
+        return '{}?{}'.format(path, '&'.join(others[:first] + group + others[first:]))
+
+    fixed = len(make_url([]))
+    groups = group_by_length([len(v) + 1 for v in values], max_length - fixed)
+    return [make_url(values[start:end]) for start, end in groups]
+
+
 def make_arg(key, value):
-    if hasattr(value, '__iter__') and not isinstance(value, basestring):
+    if hasattr(value, '__iter__') and not isinstance(value, str):
         return '&'.join([make_arg(key, v) for v in value])
 
     if isinstance(value, datetime.date):